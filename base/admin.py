@@ -10,3 +10,7 @@ admin.site.register(models.Animal, models.Animal.Admin)
 admin.site.register(models.Assignment, models.Assignment.Admin)
 admin.site.register(models.AssignmentStep, models.AssignmentStep.Admin)
 admin.site.register(models.AssignmentFulfillment, models.AssignmentFulfillment.Admin)
+admin.site.register(models.ClassJob, models.ClassJob.Admin)
+admin.site.register(models.TrendDelta, models.TrendDelta.Admin)
+admin.site.register(models.Founder, models.Founder.Admin)
+admin.site.register(models.FounderPoolRefill, models.FounderPoolRefill.Admin)
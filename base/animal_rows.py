@@ -0,0 +1,126 @@
+from typing import Any
+
+from django.db.models import QuerySet, TextField
+from django.db.models.functions import Cast
+
+from . import names as nms
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+
+class LazyJSON:
+    """Attribute holding a JSON column as text until it is first read"""
+
+    slot: str
+
+    def __set_name__(self, owner: type, name: str):
+        self.slot = f"_{name}"
+
+    def __get__(self, row: "AnimalRow | None", owner: type) -> Any:
+        if row is None:
+            return self
+
+        value = getattr(row, self.slot)
+        if isinstance(value, str):
+            value = loads(value)
+            setattr(row, self.slot, value)
+
+        return value
+
+
+class AnimalRow:
+    """Read-only projection of an Animal for list and summary paths. Rows are
+    built from values_list, so no model instances are created, and JSON
+    columns are only decoded when they are used. orjson decodes them when it
+    is installed."""
+
+    FIELDS = [
+        "id",
+        "name",
+        "generation",
+        "assignment",
+        "sire_id",
+        "dam_id",
+        "inbreeding",
+        "male",
+        "net_merit",
+    ]
+    JSON_FIELDS = ["genotype", "phenotype", "ptas", "recessives"]
+
+    __slots__ = [*FIELDS, *[f"_{x}" for x in JSON_FIELDS]]
+
+    id: int
+    name: str
+    generation: int
+    assignment: str
+    sire_id: int | None
+    dam_id: int | None
+    inbreeding: float
+    male: bool
+    net_merit: float
+
+    genotype = LazyJSON()
+    phenotype = LazyJSON()
+    ptas = LazyJSON()
+    recessives = LazyJSON()
+
+    def __init__(self, *values: Any):
+        for name, value in zip(self.__slots__, values, strict=True):
+            setattr(self, name, value)
+
+    @classmethod
+    def query(cls, animals: QuerySet) -> list["AnimalRow"]:
+        """Rows of a queryset of animals. JSON columns are read as text."""
+
+        return [
+            cls(*values)
+            for values in animals.values_list(
+                *cls.FIELDS, *[Cast(x, TextField()) for x in cls.JSON_FIELDS]
+            )
+        ]
+
+
+def get_json_dict(animal: Any, connectedclass: Any) -> dict[str, Any]:
+    """Animal values visible to the students of connectedclass. Works on an
+    Animal or an AnimalRow."""
+
+    json = {
+        nms.ID_KEY: animal.id,
+        nms.NAME_KEY: animal.name,
+        nms.GENERATION_KEY: animal.generation,
+        nms.ASSIGNMENT_KEY: animal.assignment,
+        nms.DAM_ID_KEY: animal.dam_id,
+        nms.SIRE_ID_KEY: animal.sire_id,
+        nms.INBREEDING_COEFFICIENT_KEY: animal.inbreeding,
+        nms.MALE_KEY: animal.male,
+    }
+    if connectedclass.net_merit_visibility:
+        json[nms.NETMERIT_KEY] = animal.net_merit
+
+    trait_visibility = connectedclass.trait_visibility
+    return json | {
+        nms.GENOTYPE_KEY: {
+            key: val
+            for key, val in animal.genotype.items()
+            if trait_visibility[key][0]
+        },
+        nms.PHENOTYPE_KEY: {
+            key: val
+            for key, val in animal.phenotype.items()
+            if trait_visibility[key][1]
+        },
+        nms.PTA_KEY: {
+            key: val
+            for key, val in animal.ptas.items()
+            if trait_visibility[key][2]
+            and (animal.male or not connectedclass.hide_female_pta)
+        },
+        nms.RECESSIVES_KEY: {
+            key: val
+            for key, val in animal.recessives.items()
+            if connectedclass.recessive_visibility[key]
+        },
+    }
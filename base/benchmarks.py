@@ -0,0 +1,586 @@
+import random
+import timeit
+from statistics import NormalDist
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from . import names as nms
+from .pedigrees import Kinship
+from .traitsets import REGISTERED, Traitset
+from .traitsets import reference
+from .traitsets.traitset import (
+    HETEROZYGOUS_KEY,
+    HOMOZYGOUS_CARRIER_KEY,
+    Recessive,
+)
+
+SIZES = (1, 100, 10_000)
+HERD_SIZES = (5_000,)
+BREEDINGS = 3
+EQUIVALENCE_SAMPLES = 10_000
+
+# Chance of wrongly failing an equivalence check. Split between every mean,
+# variance and correlation compared, so wide traitsets are not penalized.
+EQUIVALENCE_ALPHA = 1e-3
+
+# Deterministic kernels may only differ by floating point rounding
+DETERMINISTIC_TOLERANCE = 1e-6
+
+FOUNDERS = 20
+GENERATIONS = 4
+
+ALLELE_COUNTS = {HOMOZYGOUS_CARRIER_KEY: 2, HETEROZYGOUS_KEY: 1}
+
+
+class KernelInputs:
+    """Parent values for size animals, generated up front so they are not
+    part of the timings"""
+
+    sires: list[dict[str, float]]
+    dams: list[dict[str, float]]
+    sire_matrix: np.ndarray
+    dam_matrix: np.ndarray
+    genotypes: list[dict[str, float]]
+    genotype_matrix: np.ndarray
+    inbreeding: list[float]
+    daughters: list[int]
+    genomic_tests: list[int]
+    sire_recessives: list[dict[str, str]]
+    dam_recessives: list[dict[str, str]]
+    pedigrees: list[dict]
+
+    def __init__(self, traitset: Traitset, size: int, seed: int = 0):
+        random.seed(seed)
+        np.random.seed(seed)
+
+        self.sires = [traitset.get_random_genotype() for _ in range(size)]
+        self.dams = [traitset.get_random_genotype() for _ in range(size)]
+        self.genotypes = [traitset.get_random_genotype() for _ in range(size)]
+        self.sire_matrix = to_matrix(traitset, self.sires)
+        self.dam_matrix = to_matrix(traitset, self.dams)
+        self.genotype_matrix = to_matrix(traitset, self.genotypes)
+        self.inbreeding = [random.random() * 0.25 for _ in range(size)]
+        self.daughters = [random.randrange(0, 50) for _ in range(size)]
+        self.genomic_tests = [random.randrange(0, 3) for _ in range(size)]
+        self.sire_recessives = [traitset.get_random_recessives() for _ in range(size)]
+        self.dam_recessives = [traitset.get_random_recessives() for _ in range(size)]
+        self.pedigrees = make_pedigrees(size)
+
+
+def to_matrix(traitset: Traitset, values: list[dict[str, float]]) -> np.ndarray:
+    return np.array(
+        [[x[trait.uid] for trait in traitset.traits] for x in values]
+    ).reshape(len(values), len(traitset.traits))
+
+
+def get_inbreeding_batch(pedigrees: list[dict]) -> list[float]:
+    """Inbreeding of every pedigree with one memoized kinship, as breed_herd
+    works it out"""
+
+    kinship = Kinship()
+    for pedigree in pedigrees:
+        kinship.add_pedigree(pedigree)
+
+    return [
+        kinship.inbreeding(
+            x[nms.SIRE_ID_KEY][nms.ID_KEY], x[nms.DAM_ID_KEY][nms.ID_KEY]
+        )
+        for x in pedigrees
+    ]
+
+
+def make_pedigrees(size: int) -> list[dict]:
+    """Pedigrees for size animals bred from a small closed population, so
+    most of them have related parents"""
+
+    next_id = 0
+
+    def new(sire: Optional[dict], dam: Optional[dict]) -> dict:
+        nonlocal next_id
+        next_id += 1
+        return {nms.SIRE_ID_KEY: sire, nms.DAM_ID_KEY: dam, nms.ID_KEY: next_id}
+
+    generation = [new(None, None) for _ in range(FOUNDERS)]
+    for _ in range(GENERATIONS):
+        generation = [
+            new(random.choice(generation[::2]), random.choice(generation[1::2]))
+            for _ in range(FOUNDERS)
+        ]
+
+    return [
+        new(random.choice(generation[::2]), random.choice(generation[1::2]))
+        for _ in range(size)
+    ]
+
+
+class Kernel:
+    """One genetics kernel. current and reference take the inputs and an
+    animal index and return that animal's result, encode turns a result into
+    a row of numbers for comparison. Batch kernels are called once with the
+    number of animals instead and return every result."""
+
+    name: str
+    current: Callable[[Traitset, KernelInputs, int], Any]
+    reference: Callable[[Traitset, KernelInputs, int], Any]
+    encode: Callable[[Traitset, Any], list[float]]
+    deterministic: bool
+    batch: bool
+
+    def __init__(
+        self,
+        name: str,
+        current: Callable[[Traitset, KernelInputs, int], Any],
+        reference: Callable[[Traitset, KernelInputs, int], Any],
+        encode: Callable[[Traitset, Any], list[float]],
+        deterministic: bool = False,
+        batch: bool = False,
+    ):
+        self.name = name
+        self.current = current
+        self.reference = reference
+        self.encode = encode
+        self.deterministic = deterministic
+        self.batch = batch
+
+    def run(self, traitset: Traitset, inputs: KernelInputs, size: int) -> list:
+        if self.batch:
+            return self.current(traitset, inputs, size)
+
+        return [self.current(traitset, inputs, i) for i in range(size)]
+
+    def sample(
+        self,
+        implementation: Callable[[Traitset, KernelInputs, int], Any],
+        traitset: Traitset,
+        inputs: KernelInputs,
+        size: int,
+        seed: int,
+    ) -> np.ndarray:
+        random.seed(seed)
+        np.random.seed(seed)
+
+        if self.batch and implementation is self.current:
+            results = implementation(traitset, inputs, size)
+        else:
+            results = [implementation(traitset, inputs, i) for i in range(size)]
+
+        return np.array(
+            [self.encode(traitset, x) for x in results], dtype=float
+        ).reshape(size, -1)
+
+
+def encode_traits(traitset: Traitset, result: dict[str, float]) -> list[float]:
+    return [result[x.uid] for x in traitset.traits]
+
+
+def encode_recessives(traitset: Traitset, result: dict[str, str]) -> list[float]:
+    return [ALLELE_COUNTS.get(result[x.uid], 0) for x in traitset.recessives]
+
+
+def encode_scalar(traitset: Traitset, result: float) -> list[float]:
+    return [result]
+
+
+KERNELS = [
+    Kernel(
+        "get_random_genotype",
+        lambda ts, inputs, i: ts.get_random_genotype(),
+        lambda ts, inputs, i: reference.get_random_genotype(ts),
+        encode_traits,
+    ),
+    Kernel(
+        "get_genotype_from_breeding",
+        lambda ts, inputs, i: ts.get_genotype_from_breeding(
+            inputs.sires[i], inputs.dams[i]
+        ),
+        lambda ts, inputs, i: reference.get_genotype_from_breeding(
+            ts, inputs.sires[i], inputs.dams[i]
+        ),
+        encode_traits,
+    ),
+    Kernel(
+        "derive_phenotype_from_genotype",
+        lambda ts, inputs, i: ts.derive_phenotype_from_genotype(
+            inputs.genotypes[i], inputs.inbreeding[i]
+        ),
+        lambda ts, inputs, i: reference.derive_phenotype_from_genotype(
+            ts, inputs.genotypes[i], inputs.inbreeding[i]
+        ),
+        encode_traits,
+    ),
+    Kernel(
+        "derive_ptas_from_genotype",
+        lambda ts, inputs, i: ts.derive_ptas_from_genotype(
+            inputs.genotypes[i], inputs.daughters[i], inputs.genomic_tests[i]
+        ),
+        lambda ts, inputs, i: reference.derive_ptas_from_genotype(
+            ts, inputs.genotypes[i], inputs.daughters[i], inputs.genomic_tests[i]
+        ),
+        encode_traits,
+    ),
+    Kernel(
+        "derive_net_merit_from_genotype",
+        lambda ts, inputs, i: ts.derive_net_merit_from_genotype(inputs.genotypes[i]),
+        lambda ts, inputs, i: reference.derive_net_merit_from_genotype(
+            ts, inputs.genotypes[i]
+        ),
+        encode_scalar,
+        deterministic=True,
+    ),
+    Kernel(
+        "Recessive.get_from_breeding",
+        lambda ts, inputs, i: {
+            x.uid: Recessive.get_from_breeding(
+                inputs.sire_recessives[i][x.uid], inputs.dam_recessives[i][x.uid]
+            )
+            for x in ts.recessives
+        },
+        lambda ts, inputs, i: {
+            x.uid: reference.get_recessive_from_breeding(
+                inputs.sire_recessives[i][x.uid], inputs.dam_recessives[i][x.uid]
+            )
+            for x in ts.recessives
+        },
+        encode_recessives,
+    ),
+    Kernel(
+        "inbreeding",
+        lambda ts, inputs, i: get_inbreeding_batch([inputs.pedigrees[i]])[0],
+        lambda ts, inputs, i: reference.get_inbreeding(inputs.pedigrees[i]),
+        encode_scalar,
+        deterministic=True,
+    ),
+    Kernel(
+        "get_genotype_from_breeding_batch",
+        lambda ts, inputs, size: ts.to_trait_dicts(
+            ts.get_genotype_from_breeding_batch(inputs.sire_matrix, inputs.dam_matrix)
+        ),
+        lambda ts, inputs, i: reference.get_genotype_from_breeding(
+            ts, inputs.sires[i], inputs.dams[i]
+        ),
+        encode_traits,
+        batch=True,
+    ),
+    Kernel(
+        "get_recessives_from_breeding_batch",
+        lambda ts, inputs, size: ts.get_recessives_from_breeding_batch(
+            inputs.sire_recessives, inputs.dam_recessives
+        ),
+        lambda ts, inputs, i: {
+            x.uid: reference.get_recessive_from_breeding(
+                inputs.sire_recessives[i][x.uid], inputs.dam_recessives[i][x.uid]
+            )
+            for x in ts.recessives
+        },
+        encode_recessives,
+        batch=True,
+    ),
+    Kernel(
+        "inbreeding_batch",
+        lambda ts, inputs, size: get_inbreeding_batch(inputs.pedigrees),
+        lambda ts, inputs, i: reference.get_inbreeding(inputs.pedigrees[i]),
+        encode_scalar,
+        deterministic=True,
+        batch=True,
+    ),
+    Kernel(
+        "get_random_genotype_batch",
+        lambda ts, inputs, size: ts.to_trait_dicts(ts.get_random_genotype_batch(size)),
+        lambda ts, inputs, i: reference.get_random_genotype(ts),
+        encode_traits,
+        batch=True,
+    ),
+    Kernel(
+        "derive_net_merit_batch",
+        lambda ts, inputs, size: ts.derive_net_merit_batch(
+            inputs.genotype_matrix
+        ).tolist(),
+        lambda ts, inputs, i: reference.derive_net_merit_from_genotype(
+            ts, inputs.genotypes[i]
+        ),
+        encode_scalar,
+        deterministic=True,
+        batch=True,
+    ),
+    Kernel(
+        "derive_phenotype_batch",
+        lambda ts, inputs, size: ts.to_trait_dicts(
+            ts.derive_phenotype_batch(inputs.genotype_matrix, inputs.inbreeding)
+        ),
+        lambda ts, inputs, i: reference.derive_phenotype_from_genotype(
+            ts, inputs.genotypes[i], inputs.inbreeding[i]
+        ),
+        encode_traits,
+        batch=True,
+    ),
+    Kernel(
+        "derive_ptas_batch",
+        lambda ts, inputs, size: ts.to_trait_dicts(
+            ts.derive_ptas_batch(
+                inputs.genotype_matrix, inputs.daughters, inputs.genomic_tests
+            )
+        ),
+        lambda ts, inputs, i: reference.derive_ptas_from_genotype(
+            ts, inputs.genotypes[i], inputs.daughters[i], inputs.genomic_tests[i]
+        ),
+        encode_traits,
+        batch=True,
+    ),
+    Kernel(
+        "get_random_recessives_batch",
+        lambda ts, inputs, size: ts.get_random_recessives_batch(size),
+        lambda ts, inputs, i: reference.get_random_recessives(ts),
+        encode_recessives,
+        batch=True,
+    ),
+]
+
+
+class Equivalence:
+    """Comparison of two samples drawn from a kernel. Each deviation is the
+    largest difference found, measured in standard errors."""
+
+    mean_z: float
+    variance_z: float
+    correlation_z: float
+    max_abs_difference: Optional[float]
+    z: float
+
+    def __init__(
+        self,
+        mean_z: float,
+        variance_z: float,
+        correlation_z: float,
+        max_abs_difference: Optional[float] = None,
+        z: float = 0,
+    ):
+        self.mean_z = mean_z
+        self.variance_z = variance_z
+        self.correlation_z = correlation_z
+        self.max_abs_difference = max_abs_difference
+        self.z = z
+
+    @property
+    def passed(self) -> bool:
+        if self.max_abs_difference is not None:
+            return self.max_abs_difference <= DETERMINISTIC_TOLERANCE
+
+        return max(self.mean_z, self.variance_z, self.correlation_z) <= self.z
+
+    def json_dict(self) -> dict[str, Any]:
+        return {
+            "passed": self.passed,
+            "mean_z": round(self.mean_z, 3),
+            "variance_z": round(self.variance_z, 3),
+            "correlation_z": round(self.correlation_z, 3),
+            "threshold_z": round(self.z, 3),
+            "max_abs_difference": self.max_abs_difference,
+        }
+
+
+def _largest(values: np.ndarray) -> float:
+    values = values[~np.isnan(values)]
+    return float(values.max()) if values.size else 0.0
+
+
+def compare_distributions(
+    a: np.ndarray, b: np.ndarray, alpha: float = EQUIVALENCE_ALPHA
+) -> Equivalence:
+    """Compare the means, variances and pairwise column correlations of two
+    samples of shape (animals, columns)"""
+
+    n_a, n_b = len(a), len(b)
+    columns = a.shape[1]
+    comparisons = 2 * columns + columns * (columns - 1) // 2
+    z = NormalDist().inv_cdf(1 - alpha / (2 * comparisons))
+
+    mean_a, mean_b = a.mean(axis=0), b.mean(axis=0)
+    var_a, var_b = a.var(axis=0, ddof=1), b.var(axis=0, ddof=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_se = np.sqrt(var_a / n_a + var_b / n_b)
+        mean_z = np.abs(mean_a - mean_b) / mean_se
+
+        # Standard error of the sample variance from the fourth central moment,
+        # which also holds for the discrete recessive counts
+        m4_a = ((a - mean_a) ** 4).mean(axis=0)
+        m4_b = ((b - mean_b) ** 4).mean(axis=0)
+        variance_se = np.sqrt((m4_a - var_a**2) / n_a + (m4_b - var_b**2) / n_b)
+        variance_z = np.abs(var_a - var_b) / variance_se
+
+        # Fisher transformed correlations are close to normal with a standard
+        # error of 1 / sqrt(n - 3)
+        if columns > 1:
+            corr_a = np.arctanh(np.clip(np.corrcoef(a, rowvar=False), -0.999, 0.999))
+            corr_b = np.arctanh(np.clip(np.corrcoef(b, rowvar=False), -0.999, 0.999))
+            correlation_se = np.sqrt(1 / (n_a - 3) + 1 / (n_b - 3))
+            correlation_z = np.abs(corr_a - corr_b) / correlation_se
+        else:
+            correlation_z = np.zeros(1)
+
+    # Columns that are constant in both samples can only differ in their mean
+    constant = (var_a == 0) & (var_b == 0)
+    mean_z[constant & (mean_a == mean_b)] = 0
+    mean_z[constant & (mean_a != mean_b)] = np.inf
+
+    return Equivalence(
+        _largest(mean_z), _largest(variance_z), _largest(correlation_z), z=z
+    )
+
+
+def check_equivalence(
+    kernel: Kernel,
+    traitset: Traitset,
+    samples: int = EQUIVALENCE_SAMPLES,
+    seed: int = 0,
+) -> Equivalence:
+    """Draw from the current and reference kernel with independent seeds and
+    compare the samples. Deterministic kernels must match exactly."""
+
+    inputs = KernelInputs(traitset, samples, seed)
+
+    if kernel.deterministic:
+        current = kernel.sample(kernel.current, traitset, inputs, samples, seed)
+        expected = kernel.sample(kernel.reference, traitset, inputs, samples, seed)
+        return Equivalence(0, 0, 0, float(np.abs(current - expected).max()))
+
+    current = kernel.sample(kernel.current, traitset, inputs, samples, seed + 1)
+    expected = kernel.sample(kernel.reference, traitset, inputs, samples, seed + 2)
+    return compare_distributions(current, expected)
+
+
+def time_kernel(
+    kernel: Kernel, traitset: Traitset, size: int, repeat: int = 3, seed: int = 0
+) -> float:
+    """Best wall time in seconds to run kernel for size animals"""
+
+    inputs = KernelInputs(traitset, size, seed)
+    return min(
+        timeit.repeat(
+            lambda: kernel.run(traitset, inputs, size), repeat=repeat, number=1
+        )
+    )
+
+
+def run_benchmarks(
+    traitsets: Optional[list[str]] = None,
+    sizes: tuple[int, ...] = SIZES,
+    repeat: int = 3,
+    samples: int = EQUIVALENCE_SAMPLES,
+    seed: int = 0,
+    log: Optional[Callable[[str], None]] = None,
+) -> dict[str, Any]:
+    traitsets = traitsets or [x.name for x in REGISTERED]
+    log = log or (lambda message: None)
+    timings = []
+    equivalence = []
+
+    for traitsetname in traitsets:
+        traitset = Traitset(traitsetname)
+
+        for kernel in KERNELS:
+            log(f"Benchmarking {traitsetname} {kernel.name}")
+            for size in sizes:
+                seconds = time_kernel(kernel, traitset, size, repeat, seed)
+                timings.append(
+                    {
+                        "traitset": traitsetname,
+                        "kernel": kernel.name,
+                        "size": size,
+                        "best_ms": round(seconds * 1000, 3),
+                        "per_animal_us": round(seconds / size * 1e6, 3),
+                    }
+                )
+
+            if samples:
+                equivalence.append(
+                    {
+                        "traitset": traitsetname,
+                        "kernel": kernel.name,
+                        "samples": samples,
+                    }
+                    | check_equivalence(kernel, traitset, samples, seed).json_dict()
+                )
+
+    return {
+        "config": {
+            "traitsets": traitsets,
+            "sizes": list(sizes),
+            "repeat": repeat,
+            "samples": samples,
+            "seed": seed,
+        },
+        "timings": timings,
+        "equivalence": equivalence,
+    }
+
+
+def benchmark_breeding(
+    traitsetname: str,
+    herd_size: int,
+    breedings: int = BREEDINGS,
+    seed: int = 0,
+    log: Optional[Callable[[str], None]] = None,
+) -> list[dict[str, Any]]:
+    """Time breed_herd on a herd of herd_size animals, with a class set up so
+    that herd_size is also the size the herd settles at. Everything is
+    written in a transaction that is rolled back afterwards."""
+
+    from django.contrib.auth.models import User
+    from django.db import transaction
+
+    from . import models
+
+    log = log or (lambda message: None)
+    random.seed(seed)
+    np.random.seed(seed)
+    timings = []
+
+    with transaction.atomic():
+        traitset = Traitset(traitsetname)
+        user = User.objects.create_user(f"benchmark-{random.random()}")
+        connectedclass = models.Class.create_new(
+            user, "Benchmark", traitsetname, "", 1, 1
+        )
+
+        # A fifth of the herd is replaced every breeding
+        connectedclass.max_age = 5
+        calves = max(herd_size // connectedclass.max_age, 2)
+        connectedclass.herd_males = max(calves // 10, 1)
+        connectedclass.herd_females = calves - connectedclass.herd_males
+        connectedclass.save()
+
+        males = max(herd_size // 10, 1)
+        (herd,), _animals = models.Herd.generate_starter_herds(
+            ["Benchmark <herd>"],
+            herd_size - males,
+            males,
+            traitset,
+            connectedclass,
+        )
+
+        for breeding in range(breedings):
+            herd = models.Herd.objects.select_related("connectedclass").get(id=herd.id)
+            animals = models.Animal.objects.filter(herd=herd).count()
+            sires = list(models.Animal.objects.filter(herd=herd, male=True)[:5])
+
+            log(f"Breeding {traitsetname} herd of {animals}")
+            start = timeit.default_timer()
+            herd.breed_herd(sires, "")
+            seconds = timeit.default_timer() - start
+
+            timings.append(
+                {
+                    "traitset": traitsetname,
+                    "herd_size": herd_size,
+                    "breeding": breeding + 1,
+                    "animals": animals,
+                    "calves": calves,
+                    "seconds": round(seconds, 3),
+                }
+            )
+
+        transaction.set_rollback(True)
+
+    return timings
@@ -0,0 +1,75 @@
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+
+from . import names as nms
+from .traitsets import Traitset
+
+FAMILIES = (nms.GENOTYPE_KEY, nms.PHENOTYPE_KEY, nms.PTA_KEY)
+
+
+class ConversionTable:
+    """Scale and offset vectors converting trait values from genetic units
+    into the real units of a traitset animal.
+
+    Genotypes are scaled by the standard deviation. Phenotypes and PTAs are
+    scaled by twice the standard deviation and offset by the phenotype
+    average."""
+
+    uids: tuple[str, ...]
+    scale: dict[str, np.ndarray]
+    offset: dict[str, np.ndarray]
+    row_scale: np.ndarray
+    row_offset: np.ndarray
+
+    def __init__(self, traitset_name: str, animal: str):
+        traitset = Traitset(traitset_name)
+
+        self.uids = tuple(x.uid for x in traitset.traits)
+
+        sd = np.array([x.animals[animal].standard_deviation for x in traitset.traits])
+        avg = np.array([x.animals[animal].phenotype_average for x in traitset.traits])
+
+        self.scale = {
+            nms.GENOTYPE_KEY: sd,
+            nms.PHENOTYPE_KEY: sd * 2,
+            nms.PTA_KEY: sd * 2,
+        }
+        self.offset = {
+            nms.GENOTYPE_KEY: np.zeros_like(sd),
+            nms.PHENOTYPE_KEY: avg,
+            nms.PTA_KEY: avg,
+        }
+
+        # Genotype, phenotype and PTA columns side by side, in the order used
+        # by the animal file.
+        self.row_scale = np.concatenate([self.scale[x] for x in FAMILIES])
+        self.row_offset = np.concatenate([self.offset[x] for x in FAMILIES])
+
+    def convert_matrix(self, matrix: np.ndarray) -> np.ndarray:
+        """Convert a matrix with one row per animal and the genotype,
+        phenotype and PTA columns side by side. Missing values are nan and
+        stay nan."""
+
+        return matrix * self.row_scale + self.row_offset
+
+    def convert_rows(self, rows: list[list[Any]], start: int):
+        """Convert in place the genotype, phenotype and PTA columns of rows,
+        starting at column start. Missing values stay None."""
+
+        if not rows:
+            return
+
+        end = start + len(self.row_scale)
+        matrix = np.array([row[start:end] for row in rows], dtype=float)
+        converted = self.convert_matrix(matrix).astype(object)
+        converted[np.isnan(matrix)] = None
+
+        for row, values in zip(rows, converted.tolist()):
+            row[start:end] = values
+
+
+@lru_cache
+def get_conversion_table(traitset_name: str, animal: str) -> ConversionTable:
+    return ConversionTable(traitset_name, animal)
@@ -1,14 +1,13 @@
 from io import BytesIO
 from random import choice
-from typing import Any, Iterator
+from typing import Any, Optional
 import zipfile
 
-from background_task import background
 from django.conf import settings
-from django.core.mail import send_mail
 from django.http import FileResponse
 
 from base import models
+from base import tasks
 
 COL_SEP = ","
 ROW_SEP = "\n"
@@ -43,8 +42,34 @@ def create_csv_response(
     return FileResponse(bytes_io, as_attachment=True, filename=f"{file_name}.zip")
 
 
-@background(schedule=0)
-def create_animal_csv(classid: int, userid: int):
+@tasks.task
+def create_animal_csv(jobid: int, userid: Optional[int] = None):
+    """Upload the animal file for a job. Tasks queued before ClassJob existed
+    pass (classid, userid) and are resubmitted as a job."""
+
+    if userid is not None:
+        user = models.User.objects.filter(id=userid).first()
+        if user is not None:
+            models.ClassJob.submit_legacy(
+                jobid, models.ClassJob.KIND_ANIMAL_CHART, user.email
+            )
+        return
+
+    job = models.ClassJob.start(jobid)
+
+    try:
+        link = upload_animal_csv(
+            job.connectedclass,
+            job.kind == models.ClassJob.KIND_REAL_UNIT_ANIMAL_CHART,
+        )
+    except Exception:
+        job.fail()
+        raise
+
+    job.finish(link)
+
+
+def upload_animal_csv(connectedclass: models.Class, real_units: bool = False) -> str:
     import boto3
     from io import BytesIO
 
@@ -52,20 +77,7 @@ def create_animal_csv(classid: int, userid: int):
     bucketname = settings.AWS_STORAGE_BUCKET_NAME
     uid = "".join(choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(10))
     filekey = f"animal_charts/AnimalChart-{uid}.csv"
-    connectedclass = models.Class.objects.get(id=classid)
     headers = connectedclass.get_animal_file_headers()
-    data_keys = connectedclass.get_animal_file_data_order()
-
-    def iterator() -> Iterator[list[Any]]:
-        for animal in (
-            models.Animal.objects.filter(connectedclass=connectedclass)
-            .defer("pedigree")
-            .iterator(chunk_size=5_000)
-        ):
-            row = []
-            for key in data_keys:
-                row.append(animal.resolve_data_key(key))
-            yield row
 
     # Initialize multipart upload
     response = s3.create_multipart_upload(Bucket=bucketname, Key=filekey)
@@ -77,7 +89,7 @@ def create_animal_csv(classid: int, userid: int):
     buffer = BytesIO()
     buffer.write(f"{convert_data_row(headers)}{ROW_SEP}".encode("utf-8"))
 
-    for item in iterator():
+    for item in connectedclass.iter_animal_file_rows(real_units):
         buffer.write(f"{convert_data_row(item)}{ROW_SEP}".encode("utf-8"))
 
         if buffer.tell() >= min_part_size:
@@ -113,14 +125,4 @@ def create_animal_csv(classid: int, userid: int):
         MultipartUpload={"Parts": parts},
     )
 
-    user = models.User.objects.get(id=userid)
-    link = f"https://{bucketname}.s3.amazonaws.com/{filekey}"
-
-    send_mail(
-        "Animal Chart Ready",
-        "The animal chart you requested from HerdGenetics is ready."
-        + f" You can download the file at {link}",
-        settings.EMAIL_HOST_USER,
-        [user.email],
-        fail_silently=False,
-    )
+    return f"https://{bucketname}.s3.amazonaws.com/{filekey}"
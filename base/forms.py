@@ -1,16 +1,16 @@
 from typing import Optional
 
-import background_task
 from django import forms
 from django.contrib.auth import forms as auth_forms
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.http import Http404
 
-from base.views_utils import ClassAuth, HerdAuth, auth_herd
+from base.views_utils import ClassAuth, HerdAuth, auth_herd_instance
 
 from . import models
-from .templatetags.animal_filters import filter_text_to_default
+from . import tasks
 from .traitsets import TRAITSET_CHOICES, Traitset
 
 
@@ -103,6 +103,15 @@ class UpdateClassForm(forms.ModelForm):
     classcode = forms.CharField(disabled=True)
     enrollment_tokens = forms.IntegerField(disabled=True)
     quarantine_days = forms.IntegerField(min_value=0, max_value=60)
+    herd_males = forms.IntegerField(
+        min_value=1, max_value=1_000, label="Males born per breeding"
+    )
+    herd_females = forms.IntegerField(
+        min_value=1, max_value=5_000, label="Females born per breeding"
+    )
+    max_age = forms.IntegerField(
+        min_value=1, max_value=20, label="Max age (breedings)"
+    )
 
     class Meta:
         model = models.Class
@@ -114,6 +123,9 @@ class UpdateClassForm(forms.ModelForm):
             "info",
             "default_animal",
             "quarantine_days",
+            "herd_males",
+            "herd_females",
+            "max_age",
             "allow_other_animals",
             "allow_herd_rename",
             "net_merit_visibility",
@@ -131,15 +143,15 @@ class UpdateClassForm(forms.ModelForm):
     def __init__(self, connectedclass: models.Class, *args, **kwargs):
         super(UpdateClassForm, self).__init__(*args, **kwargs)
         traitset = Traitset(self.instance.traitset)
+        labels = connectedclass.get_export_labels()
 
         trait_visibility_choices = [
-            (x.uid, filter_text_to_default(f"<{x.uid}>", connectedclass))
-            for x in traitset.traits
+            (x.uid, label) for x, label in zip(traitset.traits, labels.traits)
         ]
 
         recessive_visibility_choices = [
-            (x.uid, filter_text_to_default(f"<{x.uid}>", connectedclass))
-            for x in traitset.recessives
+            (x.uid, label)
+            for x, label in zip(traitset.recessives, labels.recessives)
         ]
 
         self.fields["genotype_visibility"] = forms.MultipleChoiceField(
@@ -213,6 +225,7 @@ class UpdateClassForm(forms.ModelForm):
             models.Enrollment.objects.bulk_update(enrollments, ["animal"])
 
         self.instance.save()
+        self.instance.bump_version()
 
 
 class ClassReadonlyForm(forms.ModelForm):
@@ -286,25 +299,34 @@ class BreedHerd(forms.Form):
     def validate_males(self, class_auth: ClassAuth.Student) -> bool:
         males = self.cleaned_data["males"]
 
-        if type(males) != list:
+        if type(males) != list or len(males) == 0:
             return False
 
-        self.validation_catch.males = []
-        for male in males:
-            try:
-                animal = models.Animal.objects.get(id=male)
-                self.validation_catch.males.append(animal)
-            except models.Animal.DoesNotExist:
-                return False
+        try:
+            male_ids = [int(x) for x in males]
+        except (TypeError, ValueError):
+            return False
+
+        animals = {
+            x.id: x
+            for x in models.Animal.objects.select_related("herd").filter(
+                id__in=male_ids
+            )
+        }
 
-            if not animal.male:
+        self.validation_catch.males = []
+        for male in male_ids:
+            animal = animals.get(male)
+            if animal is None or not animal.male or animal.herd is None:
                 return False
 
             try:
-                _herd_auth = auth_herd(class_auth, animal.herd_id)
+                _herd_auth = auth_herd_instance(class_auth, animal.herd)
             except Http404:
                 return False
 
+            self.validation_catch.males.append(animal)
+
         return True
 
     def validate_assignment(self, class_auth: ClassAuth.Student) -> bool:
@@ -407,20 +429,36 @@ class SubmitAnimal(forms.Form):
             models.AssignmentStep.CHOICE_FEMALE_SUBMISSION,
         ]
 
-    @background_task.background(schedule=0)
+    @tasks.task
     @staticmethod
     def move_animal(animal_id: int):
-        animal = (
-            models.Animal.objects.select_related("connectedclass")
-            .defer("pedigree", "connectedclass__trend_log")
-            .get(id=animal_id)
+        """Move a submitted animal out of quarantine into the class herd.
+        Only the herd column is written so PTA updates are not lost."""
+
+        class_herd_id = (
+            models.Animal.objects.filter(id=animal_id)
+            .values_list("connectedclass__class_herd", flat=True)
+            .first()
         )
-        animal.herd = animal.connectedclass.class_herd
-        animal.save()
+        if class_herd_id is None:
+            return
+
+        with transaction.atomic():
+            models.Herd.lock(class_herd_id)
+            models.Animal.objects.filter(id=animal_id).update(herd=class_herd_id)
+            models.Herd.bump_versions(id=class_herd_id)
+
+    def save(self, class_auth: ClassAuth.Student, animal: models.Animal) -> bool:
+        """Quarantine the animal. The animal's herd must be locked. Returns
+        False when the animal has already left the herd."""
+
+        removed = models.Animal.objects.filter(
+            id=animal.id, herd=animal.herd_id
+        ).update(herd=None)
+        if not removed:
+            return False
 
-    def save(self, class_auth: ClassAuth.Student, animal: models.Animal) -> None:
-        animal.herd = None
-        animal.save()
+        models.Herd.bump_versions(id=animal.herd_id)
 
         day = 60 * 60 * 24
         self.move_animal(
@@ -431,6 +469,8 @@ class SubmitAnimal(forms.Form):
         self.validation_catch.assignment_fulfillment.current_step += 1
         self.validation_catch.assignment_fulfillment.save()
 
+        return True
+
 
 class NewAssignment(forms.ModelForm):
     "A form to create new assignments."
@@ -533,12 +573,47 @@ class UpdateEnrollmentForm(forms.ModelForm):
         )
 
         self.instance.herd.save()
+        self.instance.herd.bump_version()
 
     class Meta:
         model = models.Enrollment
         fields = ["animal"]
 
 
+class ConfirmEnrollmentRequests(forms.Form):
+    "A form to confirm many enrollment requests at once."
+
+    requests = forms.JSONField(required=False)
+    all = forms.BooleanField(required=False)
+
+    def get_enrollment_requests(
+        self, connectedclass: models.Class
+    ) -> Optional[list[models.EnrollmentRequest]]:
+        """Get the selected requests, oldest first, or None if the selection
+        is malformed. The requests are locked until the end of the
+        transaction."""
+
+        enrollment_requests = (
+            models.EnrollmentRequest.objects.select_for_update(of=("self",))
+            .select_related("connectedclass", "student")
+            .filter(connectedclass=connectedclass)
+        )
+
+        if not self.cleaned_data["all"]:
+            requests = self.cleaned_data["requests"]
+            if type(requests) != list:
+                return None
+
+            try:
+                request_ids = [int(x) for x in requests]
+            except (TypeError, ValueError):
+                return None
+
+            enrollment_requests = enrollment_requests.filter(id__in=request_ids)
+
+        return list(enrollment_requests.order_by("id"))
+
+
 class Account(forms.ModelForm):
     "A form to update accounts."
 
@@ -0,0 +1,75 @@
+from json import dumps
+from threading import Lock
+
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+from . import models
+
+CACHE_ALIAS = "herds"
+TIMEOUT = 60 * 60 * 24
+
+
+class Stats:
+    """Hit and miss counts for this process"""
+
+    hits: int = 0
+    misses: int = 0
+    lock = Lock()
+
+    @classmethod
+    def record(cls, hit: bool):
+        with cls.lock:
+            if hit:
+                cls.hits += 1
+            else:
+                cls.misses += 1
+
+
+def get_key(herd: models.Herd, visibility_hash: str) -> str:
+    # The herd version is bumped whenever its animals change, so older
+    # entries are never read again and age out of the cache.
+    return f"herd:{herd.id}:{herd.version}:{visibility_hash}"
+
+
+def get_herd_json(herd: models.Herd, visibility_hash: str) -> tuple[bytes, bool]:
+    """Get the serialized herd json and whether it came from the cache"""
+
+    cache = caches[CACHE_ALIAS]
+    key = get_key(herd, visibility_hash)
+    content = cache.get(key)
+    hit = content is not None
+
+    if not hit:
+        content = dumps(herd.json_dict(), cls=DjangoJSONEncoder).encode("utf-8")
+        cache.set(key, content, TIMEOUT)
+
+    Stats.record(hit)
+    return content, hit
+
+
+def herd_json_response(herd: models.Herd, visibility_hash: str) -> HttpResponse:
+    content, hit = get_herd_json(herd, visibility_hash)
+
+    response = HttpResponse(content, content_type="application/json")
+    response["X-Cache"] = "HIT" if hit else "MISS"
+    return response
+
+
+def stats() -> dict[str, int | float]:
+    with Stats.lock:
+        hits, misses = Stats.hits, Stats.misses
+
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    with Stats.lock:
+        Stats.hits = 0
+        Stats.misses = 0
@@ -0,0 +1,278 @@
+import random
+import resource
+import tracemalloc
+from datetime import timedelta
+from json import dumps
+from time import perf_counter
+from typing import Any, Callable, Optional
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from . import csv, herd_cache, models
+
+
+def get_process_peak_rss_kb() -> int:
+    """Peak resident set size of the whole process since it started. Linux
+    reports kilobytes. It never goes down, so it can't be split by
+    endpoint."""
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class EndpointStats:
+    """Timings and query counts collected for one endpoint"""
+
+    latencies: list[float]
+    queries: list[int]
+    errors: int
+    peak_alloc_kb: list[int]
+
+    def __init__(self):
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+        self.peak_alloc_kb = []
+
+    def record(
+        self, seconds: float, queries: int, ok: bool, peak_alloc_kb: Optional[int]
+    ):
+        self.latencies.append(seconds * 1000)
+        self.queries.append(queries)
+        self.errors += not ok
+        if peak_alloc_kb is not None:
+            self.peak_alloc_kb.append(peak_alloc_kb)
+
+    def summary(self) -> dict[str, Any]:
+        latencies = np.array(self.latencies)
+        queries = np.array(self.queries)
+
+        summary = {
+            "count": len(self.latencies),
+            "errors": self.errors,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            "mean_ms": round(float(latencies.mean()), 3),
+            "queries_mean": round(float(queries.mean()), 2),
+            "queries_max": int(queries.max()),
+        }
+        if self.peak_alloc_kb:
+            summary["peak_alloc_kb_max"] = max(self.peak_alloc_kb)
+
+        return summary
+
+
+class LoadTest:
+    """Simulate a semester of activity in one class against the current
+    database. Background tasks should run with the immediate task backend so
+    their cost is counted in the request that queued them.
+
+    With trace_memory set, the peak Python memory allocated by each call is
+    recorded with tracemalloc. Tracing slows every allocation, so latencies
+    from such a run should not be compared with untraced ones."""
+
+    enrollments: int
+    rounds: int
+    traitset: str
+    trace_memory: bool
+    log: Callable[[str], None]
+    stats: dict[str, EndpointStats]
+
+    def __init__(
+        self,
+        enrollments: int,
+        rounds: int,
+        traitset: str = "ANIMAL_SCIENCE_322",
+        seed: int = 0,
+        log: Optional[Callable[[str], None]] = None,
+        trace_memory: bool = False,
+    ):
+        self.enrollments = enrollments
+        self.rounds = rounds
+        self.traitset = traitset
+        self.seed = seed
+        self.log = log or (lambda message: None)
+        self.trace_memory = trace_memory
+        self.stats = {}
+
+    def measure(self, name: str, func: Callable[[], Any]) -> Any:
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            allocated = tracemalloc.get_traced_memory()[0]
+
+        with CaptureQueriesContext(connection) as queries:
+            start = perf_counter()
+            result = func()
+            seconds = perf_counter() - start
+
+        peak_alloc_kb = None
+        if self.trace_memory:
+            peak_alloc_kb = (tracemalloc.get_traced_memory()[1] - allocated) // 1024
+
+        ok = not isinstance(result, HttpResponse) or result.status_code < 400
+        self.stats.setdefault(name, EndpointStats()).record(
+            seconds, len(queries), ok, peak_alloc_kb
+        )
+        return result
+
+    def setup_class(self):
+        self.teacher = User.objects.create_user(
+            "loadtest-teacher", "teacher@example.com", "password"
+        )
+        self.connectedclass = models.Class.create_new(
+            self.teacher, "Load Test", self.traitset, "", 10, 70
+        )
+        self.connectedclass.enrollment_tokens = self.enrollments
+        self.connectedclass.save()
+
+        self.teacher_client = Client()
+        self.teacher_client.force_login(self.teacher)
+
+        self.students: list[tuple[Client, models.Enrollment]] = []
+        for i in range(self.enrollments):
+            student = User.objects.create_user(
+                f"loadtest-student-{i}",
+                f"student{i}@example.com",
+                "password",
+                first_name="Student",
+                last_name=str(i),
+            )
+            request = models.EnrollmentRequest.create_new(student, self.connectedclass)
+            enrollment = self.measure(
+                "create_enrollment",
+                lambda: models.Enrollment.create_from_enrollment_request(request),
+            )
+
+            client = Client()
+            client.force_login(student)
+            self.students.append((client, enrollment))
+
+        steps = [
+            models.AssignmentStep.CHOICE_BREED,
+            models.AssignmentStep.CHOICE_MALE_SUBMISSION,
+        ] * self.rounds
+        self.assignment = models.Assignment.create_new(
+            "Load Test",
+            now() - timedelta(days=1),
+            now() + timedelta(days=1),
+            steps,
+            self.connectedclass,
+        )
+
+    def herd_path(self, herd_id: int) -> str:
+        return f"/class/{self.connectedclass.id}/herd/{herd_id}"
+
+    def run_round(self):
+        classid = self.connectedclass.id
+
+        for client, enrollment in self.students:
+            herd_path = self.herd_path(enrollment.herd_id)
+            response = self.measure("get_herd", lambda: client.get(f"{herd_path}/get"))
+            self.measure(
+                "get_herd_revalidate",
+                lambda: client.get(
+                    f"{herd_path}/get", headers={"If-None-Match": response["ETag"]}
+                ),
+            )
+            self.measure(
+                "get_assignments", lambda: client.get(f"{herd_path}/assignments/get")
+            )
+
+            males = list(
+                models.Animal.objects.filter(herd=enrollment.herd_id, male=True)
+                .order_by("?")
+                .values_list("id", flat=True)[:3]
+            )
+            self.measure(
+                "breed_herd",
+                lambda: client.post(
+                    f"{herd_path}/breed",
+                    {"males": dumps(males), "assignment": self.assignment.id},
+                ),
+            )
+
+            animal = (
+                models.Animal.objects.filter(herd=enrollment.herd_id, male=True)
+                .order_by("-id")
+                .values_list("id", flat=True)
+                .first()
+            )
+            self.measure(
+                "submit_animal",
+                lambda: client.post(
+                    f"{herd_path}/assignments/submit-animal/{animal}",
+                    {"assignment": self.assignment.id},
+                ),
+            )
+
+        class_herd_path = self.herd_path(self.connectedclass.class_herd_id)
+        for client, _enrollment in self.students:
+            self.measure(
+                "get_class_herd", lambda: client.get(f"{class_herd_path}/get")
+            )
+
+        self.measure(
+            "get_enrollments",
+            lambda: self.teacher_client.get(f"/class/{classid}/get-enrollments"),
+        )
+        self.measure(
+            "calculate_ptas",
+            lambda: self.teacher_client.get(f"/class/{classid}/calculate-ptas"),
+        )
+        self.measure(
+            "get_trend_chart",
+            lambda: self.teacher_client.get(f"/class/{classid}/get-trend-chart"),
+        )
+        self.measure("animal_csv", self.build_animal_csv)
+
+    def build_animal_csv(self) -> int:
+        """Build the animal chart in memory, as the upload task does, without
+        sending it anywhere"""
+
+        size = len(csv.convert_data_row(self.connectedclass.get_animal_file_headers()))
+        for row in self.connectedclass.iter_animal_file_rows():
+            size += len(csv.convert_data_row(row)) + len(csv.ROW_SEP)
+
+        return size
+
+    def run(self) -> dict[str, Any]:
+        random.seed(self.seed)
+        np.random.seed(self.seed)
+        herd_cache.reset_stats()
+        if self.trace_memory:
+            tracemalloc.start()
+
+        try:
+            self.log(f"Creating class with {self.enrollments} enrollments")
+            self.setup_class()
+
+            for i in range(self.rounds):
+                self.log(f"Running round {i + 1}/{self.rounds}")
+                self.run_round()
+        finally:
+            if self.trace_memory:
+                tracemalloc.stop()
+
+        return {
+            "config": {
+                "enrollments": self.enrollments,
+                "rounds": self.rounds,
+                "traitset": self.traitset,
+                "seed": self.seed,
+                "trace_memory": self.trace_memory,
+                "database": connection.vendor,
+            },
+            "animals": models.Animal.objects.filter(
+                connectedclass=self.connectedclass
+            ).count(),
+            "process_peak_rss_kb": get_process_peak_rss_kb(),
+            "herd_cache": herd_cache.stats(),
+            "endpoints": {
+                name: stats.summary() for name, stats in self.stats.items()
+            },
+        }
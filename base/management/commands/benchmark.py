@@ -0,0 +1,96 @@
+from json import dumps
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...benchmarks import (
+    BREEDINGS,
+    EQUIVALENCE_SAMPLES,
+    HERD_SIZES,
+    SIZES,
+    benchmark_breeding,
+    run_benchmarks,
+)
+from ...traitsets import REGISTERED
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the genetics kernels for every registered traitset and check that "
+        "they draw from the same distributions as the reference kernels. Then "
+        "time breeding whole herds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--traitset",
+            action="append",
+            choices=[x.name for x in REGISTERED],
+            help="Traitset to benchmark, may be repeated (default: all)",
+        )
+        parser.add_argument(
+            "--size",
+            action="append",
+            type=int,
+            help=f"Number of animals, may be repeated (default: {SIZES})",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument(
+            "--samples",
+            type=int,
+            default=EQUIVALENCE_SAMPLES,
+            help="Animals drawn for the equivalence checks, 0 to skip them",
+        )
+        parser.add_argument(
+            "--herd-size",
+            action="append",
+            type=int,
+            help=f"Animals in each bred herd, may be repeated (default: {HERD_SIZES})",
+        )
+        parser.add_argument(
+            "--breedings",
+            type=int,
+            default=BREEDINGS,
+            help="Breedings timed for each herd size, 0 to skip them",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the report to a file")
+
+    def handle(self, *args, **kwargs):
+        report = run_benchmarks(
+            kwargs["traitset"],
+            tuple(kwargs["size"] or SIZES),
+            kwargs["repeat"],
+            kwargs["samples"],
+            kwargs["seed"],
+            lambda message: self.stderr.write(message),
+        )
+        report["breeding"] = [
+            timing
+            for traitsetname in kwargs["traitset"] or [x.name for x in REGISTERED]
+            for herd_size in kwargs["herd_size"] or HERD_SIZES
+            for timing in benchmark_breeding(
+                traitsetname,
+                herd_size,
+                kwargs["breedings"],
+                kwargs["seed"],
+                lambda message: self.stderr.write(message),
+            )
+        ]
+
+        output = dumps(report, indent=2)
+        if kwargs["output"]:
+            with open(kwargs["output"], "w") as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+        failed = [
+            f"{x['traitset']} {x['kernel']}"
+            for x in report["equivalence"]
+            if not x["passed"]
+        ]
+        if failed:
+            raise CommandError(
+                "Kernels no longer match the reference distributions: "
+                + ", ".join(failed)
+            )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Save the living animals of a herd and its class's breeding settings to "
+        "a .npz snapshot for the whatif command."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("herd", type=int, help="Id of the herd to export")
+        parser.add_argument("path", help="File to write the snapshot to")
+
+    def handle(self, *args, **kwargs):
+        try:
+            herd = models.Herd.objects.select_related("connectedclass").get(
+                id=kwargs["herd"]
+            )
+        except models.Herd.DoesNotExist:
+            raise CommandError(f"No herd with id {kwargs['herd']}")
+
+        snapshot = herd.get_snapshot()
+        with open(kwargs["path"], "wb") as file:
+            snapshot.save(file)
+
+        self.stderr.write(f"Exported {len(snapshot.animals)} animals")
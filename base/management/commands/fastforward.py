@@ -0,0 +1,55 @@
+from json import dumps
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ... import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Breed a herd for many generations in memory, choosing sires with a "
+        "selection strategy, and save the final herd and its trend log."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("herd", type=int, help="Id of the herd to breed")
+        parser.add_argument("--generations", type=int, default=20)
+        parser.add_argument(
+            "--strategy",
+            default="net_merit",
+            help='"net_merit", "pta:<trait>" or "random" (default: net_merit)',
+        )
+        parser.add_argument(
+            "--sires", type=int, default=5, help="Sires used in each breeding"
+        )
+        parser.add_argument(
+            "--assignment",
+            default="Fast forward",
+            help="Assignment recorded on the new animals",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["generations"] < 1 or kwargs["sires"] < 1:
+            raise CommandError("--generations and --sires must be at least 1")
+
+        try:
+            herd = models.Herd.objects.select_related("connectedclass").get(
+                id=kwargs["herd"]
+            )
+        except models.Herd.DoesNotExist:
+            raise CommandError(f"No herd with id {kwargs['herd']}")
+
+        max_len = models.Animal._meta.get_field("assignment").max_length
+        try:
+            with transaction.atomic():
+                results = herd.fast_forward(
+                    kwargs["generations"],
+                    kwargs["strategy"],
+                    kwargs["sires"],
+                    kwargs["assignment"][:max_len],
+                )
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        self.stdout.write(dumps([x.json_dict() for x in results], indent=2))
@@ -0,0 +1,60 @@
+from json import dumps
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from ...loadtest import LoadTest
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate a semester of class activity in a throwaway test database and "
+        "report latency, queries and memory per endpoint as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--enrollments", type=int, default=20)
+        parser.add_argument("--rounds", type=int, default=5)
+        parser.add_argument("--traitset", default="ANIMAL_SCIENCE_322")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the report to a file")
+        parser.add_argument(
+            "--trace-memory",
+            action="store_true",
+            help="Record the peak memory allocated by each request with "
+            "tracemalloc. Slows every request.",
+        )
+
+    def handle(self, *args, **kwargs):
+        def log(message: str):
+            self.stderr.write(message)
+
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        try:
+            with override_settings(TASK_BACKEND="immediate"):
+                report = LoadTest(
+                    kwargs["enrollments"],
+                    kwargs["rounds"],
+                    kwargs["traitset"],
+                    kwargs["seed"],
+                    log,
+                    kwargs["trace_memory"],
+                ).run()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = dumps(report, indent=2)
+        if kwargs["output"]:
+            with open(kwargs["output"], "w") as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
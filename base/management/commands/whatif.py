@@ -0,0 +1,63 @@
+from json import dumps
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...simulation import HerdSnapshot
+from ...whatif import run_whatif
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate selection strategies many times on a herd snapshot from "
+        "exportherd and report per generation distributions of genetic gain, "
+        "inbreeding and recessive deaths. Does not use the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("snapshot", help="Snapshot written by exportherd")
+        parser.add_argument(
+            "--strategy",
+            action="append",
+            help='"net_merit", "pta:<trait>" or "random", may be repeated '
+            "(default: net_merit and random)",
+        )
+        parser.add_argument("--replicates", type=int, default=100)
+        parser.add_argument("--generations", type=int, default=20)
+        parser.add_argument(
+            "--sires", type=int, default=5, help="Sires used in each breeding"
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--workers", type=int, help="Processes to use (default: every core)"
+        )
+        parser.add_argument("--output", help="Write the report to a file")
+
+    def handle(self, *args, **kwargs):
+        for name in ["replicates", "generations", "sires"]:
+            if kwargs[name] < 1:
+                raise CommandError(f"--{name} must be at least 1")
+
+        try:
+            snapshot = HerdSnapshot.load(kwargs["snapshot"])
+        except (OSError, KeyError, ValueError) as error:
+            raise CommandError(f"Could not read snapshot: {error}")
+
+        try:
+            report = run_whatif(
+                snapshot,
+                kwargs["strategy"] or ["net_merit", "random"],
+                kwargs["replicates"],
+                kwargs["generations"],
+                kwargs["sires"],
+                kwargs["seed"],
+                kwargs["workers"],
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        output = dumps(report, indent=2)
+        if kwargs["output"]:
+            with open(kwargs["output"], "w") as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,290 @@
+import cProfile
+import logging
+from copy import copy
+from json import dumps
+from pathlib import Path
+from random import random
+from threading import Lock
+from time import perf_counter, thread_time
+from typing import Callable
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+from django.utils.timezone import now
+
+from . import herd_cache
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the request duration histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class ViewStats:
+    """Running totals for one view in this process"""
+
+    requests: int
+    errors: int
+    seconds: float
+    buckets: list[int]
+    queries: int
+    query_seconds: float
+    cpu_seconds: float
+    response_bytes: int
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.seconds = 0
+        self.buckets = [0] * len(BUCKETS)
+        self.queries = 0
+        self.query_seconds = 0
+        self.cpu_seconds = 0
+        self.response_bytes = 0
+
+
+class RequestMetrics:
+    """Measurements taken for a single request"""
+
+    view: str
+    status: int
+    seconds: float
+    queries: int
+    query_seconds: float
+    cpu_seconds: float
+    response_bytes: int
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0
+
+    def time_query(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_seconds += perf_counter() - start
+
+    def json_dict(self) -> dict[str, str | int | float]:
+        return {
+            "time": now().isoformat(),
+            "view": self.view,
+            "status": self.status,
+            "ms": round(self.seconds * 1000, 3),
+            "queries": self.queries,
+            "query_ms": round(self.query_seconds * 1000, 3),
+            "cpu_ms": round(self.cpu_seconds * 1000, 3),
+            "bytes": self.response_bytes,
+        }
+
+
+class Registry:
+    views: dict[str, ViewStats] = {}
+    lock = Lock()
+
+    @classmethod
+    def record(cls, metrics: RequestMetrics):
+        with cls.lock:
+            stats = cls.views.get(metrics.view)
+            if stats is None:
+                stats = cls.views[metrics.view] = ViewStats()
+
+            stats.requests += 1
+            stats.errors += metrics.status >= 500
+            stats.seconds += metrics.seconds
+            stats.queries += metrics.queries
+            stats.query_seconds += metrics.query_seconds
+            stats.cpu_seconds += metrics.cpu_seconds
+            stats.response_bytes += metrics.response_bytes
+
+            for i, bound in enumerate(BUCKETS):
+                if metrics.seconds <= bound:
+                    stats.buckets[i] += 1
+
+
+def reset():
+    with Registry.lock:
+        Registry.views = {}
+
+
+def get_view_name(request: HttpRequest) -> str:
+    match = request.resolver_match
+    return match.view_name if match else "unresolved"
+
+
+def get_response_size(response: HttpResponse) -> int:
+    if response.streaming:
+        return int(response.get("Content-Length", 0))
+
+    return len(response.content)
+
+
+class Profiler:
+    """Profile one request with cProfile, or pyinstrument when
+    METRICS_PROFILER is set to it and the package is installed. Only one
+    profiler can run in a process at a time, so a request sampled while
+    another is being profiled is not profiled and active stays False."""
+
+    # Held by the profiler that is running
+    lock = Lock()
+
+    active: bool
+
+    def __init__(self):
+        self.active = False
+        self.pyinstrument = None
+        if settings.METRICS_PROFILER == "pyinstrument":
+            try:
+                from pyinstrument import Profiler as PyinstrumentProfiler
+            except ImportError:
+                logger.warning("pyinstrument is not installed, using cProfile")
+            else:
+                self.pyinstrument = PyinstrumentProfiler()
+
+        self.cprofile = None if self.pyinstrument else cProfile.Profile()
+
+    def __enter__(self):
+        if not self.lock.acquire(blocking=False):
+            return self
+
+        try:
+            if self.cprofile:
+                self.cprofile.enable()
+            else:
+                self.pyinstrument.start()
+        except (ValueError, RuntimeError):
+            # Another profiling tool, e.g. a debugger, is already active
+            self.lock.release()
+            return self
+
+        self.active = True
+        return self
+
+    def __exit__(self, *exc):
+        if not self.active:
+            return
+
+        try:
+            if self.cprofile:
+                self.cprofile.disable()
+            else:
+                self.pyinstrument.stop()
+        finally:
+            self.lock.release()
+
+    def save(self, view: str) -> Path:
+        directory = Path(settings.METRICS_PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = f"{now():%Y%m%d-%H%M%S-%f}-{view}"
+
+        if self.cprofile:
+            path = directory / f"{name}.prof"
+            self.cprofile.dump_stats(path)
+        else:
+            path = directory / f"{name}.html"
+            path.write_text(self.pyinstrument.output_html())
+
+        return path
+
+
+class MetricsMiddleware:
+    """Record wall time, query count and time, CPU time and response size for
+    every request. A METRICS_PROFILE_RATE fraction of requests is also
+    profiled to METRICS_PROFILE_DIR."""
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        metrics = RequestMetrics()
+        profiler = (
+            Profiler()
+            if settings.METRICS_PROFILE_RATE
+            and random() < settings.METRICS_PROFILE_RATE
+            else None
+        )
+
+        start = perf_counter()
+        cpu_start = thread_time()
+        with connection.execute_wrapper(metrics.time_query):
+            if profiler:
+                with profiler:
+                    response = self.get_response(request)
+            else:
+                response = self.get_response(request)
+
+        metrics.seconds = perf_counter() - start
+        metrics.cpu_seconds = thread_time() - cpu_start
+        metrics.view = get_view_name(request)
+        metrics.status = response.status_code
+        metrics.response_bytes = get_response_size(response)
+
+        Registry.record(metrics)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(dumps(metrics.json_dict()))
+
+        if profiler and profiler.active:
+            path = profiler.save(metrics.view)
+            logger.info(dumps({"view": metrics.view, "profile": str(path)}))
+
+        return response
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus() -> str:
+    """All metrics for this process in the Prometheus text format"""
+
+    with Registry.lock:
+        views = {name: copy(stats) for name, stats in Registry.views.items()}
+        for stats in views.values():
+            stats.buckets = list(stats.buckets)
+
+    metric = "herdgen_request_duration_seconds"
+    lines = [
+        f"# HELP {metric} Wall time spent in each view.",
+        f"# TYPE {metric} histogram",
+    ]
+    for name, stats in views.items():
+        view = _label(name)
+        for bound, count in zip(BUCKETS, stats.buckets):
+            lines.append(f'{metric}_bucket{{view="{view}",le="{bound}"}} {count}')
+        lines.append(f'{metric}_bucket{{view="{view}",le="+Inf"}} {stats.requests}')
+        lines.append(f'{metric}_sum{{view="{view}"}} {stats.seconds}')
+        lines.append(f'{metric}_count{{view="{view}"}} {stats.requests}')
+
+    for metric, description, attribute in [
+        ("herdgen_request_errors_total", "Responses with a 5xx status.", "errors"),
+        ("herdgen_request_queries_total", "Database queries run.", "queries"),
+        (
+            "herdgen_request_query_seconds_total",
+            "Time spent in database queries.",
+            "query_seconds",
+        ),
+        ("herdgen_request_cpu_seconds_total", "Python CPU time.", "cpu_seconds"),
+        ("herdgen_response_bytes_total", "Response body size.", "response_bytes"),
+    ]:
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} counter")
+        for name, stats in views.items():
+            lines.append(
+                f'{metric}{{view="{_label(name)}"}} {getattr(stats, attribute)}'
+            )
+
+    cache = herd_cache.stats()
+    for metric, key in [
+        ("herdgen_herd_cache_hits_total", "hits"),
+        ("herdgen_herd_cache_misses_total", "misses"),
+    ]:
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {cache[key]}")
+
+    return "\n".join(lines) + "\n"
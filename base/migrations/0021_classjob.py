@@ -0,0 +1,27 @@
+# Generated by Django 5.0.7 on 2026-10-19 15:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0020_class_allow_herd_rename'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('ptas', 'Calculate PTAs'), ('genomic', 'Genomic Test'), ('chart', 'Animal Chart')], max_length=255)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=255)),
+                ('fingerprint', models.CharField(blank=True, default='', max_length=255)),
+                ('result', models.TextField(blank=True, default='')),
+                ('emails', models.JSONField(blank=True, default=list)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('connectedclass', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='base.class')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-19 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0021_classjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='class',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='herd',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
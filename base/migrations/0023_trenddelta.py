@@ -0,0 +1,115 @@
+# Generated by Django 5.0.7 on 2026-10-19 15:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+
+FAMILIES = ["genotype", "phenotype", "ptas"]
+
+
+def get_sums(entry):
+    """Convert a trend log entry of averages into sums"""
+
+    population = entry["populationsize"]
+    return {
+        "population": population,
+        "net_merit": entry["NM$"] * population,
+    } | {
+        family: {key: val * population for key, val in entry.get(family, {}).items()}
+        for family in FAMILIES
+    }
+
+
+def trend_log_to_deltas(apps, schema_editor):
+    Class = apps.get_model("base", "Class")
+    TrendDelta = apps.get_model("base", "TrendDelta")
+
+    for connectedclass in Class.objects.iterator():
+        deltas = []
+        last = {"population": 0, "net_merit": 0} | {x: {} for x in FAMILIES}
+
+        for entry in connectedclass.trend_log:
+            sums = get_sums(entry)
+            deltas.append(
+                TrendDelta(
+                    connectedclass=connectedclass,
+                    population=sums["population"] - last["population"],
+                    net_merit=sums["net_merit"] - last["net_merit"],
+                    created=parse_datetime(entry["timestamp"]),
+                    **{
+                        family: {
+                            key: val - last[family].get(key, 0)
+                            for key, val in sums[family].items()
+                        }
+                        for family in FAMILIES
+                    },
+                )
+            )
+            last = sums
+
+        TrendDelta.objects.bulk_create(deltas)
+
+
+def deltas_to_trend_log(apps, schema_editor):
+    Class = apps.get_model("base", "Class")
+    TrendDelta = apps.get_model("base", "TrendDelta")
+
+    for connectedclass in Class.objects.iterator():
+        trend_log = []
+        sums = {"population": 0, "net_merit": 0} | {x: {} for x in FAMILIES}
+
+        for delta in TrendDelta.objects.filter(
+            connectedclass=connectedclass
+        ).order_by("id"):
+            sums["population"] += delta.population
+            sums["net_merit"] += delta.net_merit
+            for family in FAMILIES:
+                for key, val in getattr(delta, family).items():
+                    sums[family][key] = sums[family].get(key, 0) + val
+
+            population = sums["population"] or 1
+            trend_log.append(
+                {
+                    "timestamp": delta.created.isoformat(),
+                    "populationsize": sums["population"],
+                    "NM$": sums["net_merit"] / population,
+                }
+                | {
+                    family: {
+                        key: val / population for key, val in sums[family].items()
+                    }
+                    for family in FAMILIES
+                }
+            )
+
+        connectedclass.trend_log = trend_log
+        connectedclass.save(update_fields=["trend_log"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0022_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('population', models.IntegerField()),
+                ('net_merit', models.FloatField()),
+                ('genotype', models.JSONField()),
+                ('phenotype', models.JSONField()),
+                ('ptas', models.JSONField()),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('connectedclass', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='base.class')),
+            ],
+        ),
+        migrations.RunPython(trend_log_to_deltas, deltas_to_trend_log),
+        migrations.RemoveField(
+            model_name='class',
+            name='trend_log',
+        ),
+    ]
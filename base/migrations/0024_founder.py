@@ -0,0 +1,31 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0023_trenddelta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Founder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('traitset', models.CharField(max_length=255)),
+                ('male', models.BooleanField()),
+                ('net_merit', models.FloatField()),
+                ('genotype', models.JSONField()),
+                ('phenotype', models.JSONField()),
+                ('ptas', models.JSONField()),
+                ('recessives', models.JSONField()),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['traitset', 'male', 'id'], name='base_founde_traitse_b9ed62_idx')],
+            },
+        ),
+    ]
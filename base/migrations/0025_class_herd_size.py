@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0024_founder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='class',
+            name='herd_females',
+            field=models.IntegerField(default=70),
+        ),
+        migrations.AddField(
+            model_name='class',
+            name='herd_males',
+            field=models.IntegerField(default=10),
+        ),
+        migrations.AddField(
+            model_name='class',
+            name='max_age',
+            field=models.IntegerField(default=5),
+        ),
+    ]
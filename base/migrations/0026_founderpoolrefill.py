@@ -0,0 +1,22 @@
+# Generated by Django 5.0.7 on 2026-10-19 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0025_class_herd_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FounderPoolRefill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('traitset', models.CharField(max_length=255, unique=True)),
+                ('queued', models.BooleanField(default=False)),
+                ('requested', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-19 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0026_founderpoolrefill'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='classjob',
+            name='kind',
+            field=models.CharField(choices=[('ptas', 'Calculate PTAs'), ('genomic', 'Genomic Test'), ('chart', 'Animal Chart'), ('chart-real', 'Animal Chart (Real Units)')], max_length=255),
+        ),
+    ]
@@ -1,27 +1,69 @@
 from collections import defaultdict
+from datetime import timedelta
+from hashlib import sha1
+from itertools import batched
+from json import dumps
 from random import choice
-from typing import Any, Optional
+from typing import Any, Callable, Iterator, Optional
 
-import background_task
-import inbreeding_calculator
+import numpy as np
 
 from django.conf import settings
 from django.contrib.admin import ModelAdmin
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import connection, models, transaction
 from django.utils.timezone import datetime, now
-from django.core.mail import send_mail
+from django.core.mail import send_mass_mail
 
 
+from . import animal_rows
 from . import names as nms
-from .templatetags.animal_filters import filter_text_to_default
+from . import pedigrees
+from . import simulation
+from . import tasks
+from . import tracing
+from .conversion import ConversionTable, get_conversion_table
+from .templatetags.animal_filters import ExportLabels, get_export_labels
 from .traitsets import Traitset
 from .traitsets import traitset
-from .traitsets.traitset import HOMOZYGOUS_CARRIER_KEY
 
 
 # Create your models here.
-class Class(models.Model):
+class VersionedModel(models.Model):
+    """A model with a version that increases whenever the data served from
+    it changes. Used as an ETag by the JSON views.
+
+    The version is only ever written by bump_versions, so saving an instance
+    that was loaded before a bump can never move it backwards."""
+
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+        ):
+            kwargs["update_fields"] = [
+                x.name
+                for x in self._meta.concrete_fields
+                if not x.primary_key and x.name != "version"
+            ]
+
+        super().save(*args, **kwargs)
+
+    def bump_version(self):
+        type(self).bump_versions(id=self.id)
+
+    @classmethod
+    def bump_versions(cls, *args, **kwargs):
+        cls.objects.filter(*args, **kwargs).update(version=models.F("version") + 1)
+
+
+class Class(VersionedModel):
     """Classroom object: manages class settings and enrollments."""
 
     class Admin(ModelAdmin):
@@ -44,7 +86,6 @@ class Class(models.Model):
     hide_female_pta = models.BooleanField(default=False)
     recessive_visibility = models.JSONField()
     net_merit_visibility = models.BooleanField(default=True)
-    trend_log = models.JSONField(default=list, blank=True)
     default_animal = models.CharField(max_length=255)
     allow_other_animals = models.BooleanField(default=True)
     allow_herd_rename = models.BooleanField(default=True)
@@ -59,6 +100,12 @@ class Class(models.Model):
     )
     enrollment_tokens = models.IntegerField(default=10)
 
+    # Calves born in each breeding, which is also the size of starter herds
+    herd_males = models.IntegerField(default=10)
+    herd_females = models.IntegerField(default=70)
+    # Breedings an animal survives before it is culled
+    max_age = models.IntegerField(default=5)
+
     def __str__(self) -> str:
         return f"{self.id} | {self.name}"
 
@@ -97,25 +144,39 @@ class Class(models.Model):
         new.default_animal = traitset.animal_choices[0][0]
         new.save()
 
-        new.class_herd = Herd.generate_starter_herd(
-            name=f"{name} class <herd>",
+        herds, animals = Herd.generate_starter_herds(
+            names=[f"{name} class <herd>"],
             females=initial_females,
             males=initial_males,
             traitset=traitset,
             connectedclass=new,
         )
-
-        new.update_trend_log(save=False)
+        new.class_herd = herds[0]
 
         new.save()
+        new.record_trend_delta(new_animals=animals, old_animals=[])
 
         return new
 
-    def decrement_enrollment_tokens(self):
-        """Remove one enrollment token"""
+    @classmethod
+    def lock(cls, classid: int) -> "Class":
+        """Lock the class row until the end of the transaction so that
+        simultaneous enrollment confirmations spend tokens one after the
+        other"""
 
-        self.enrollment_tokens -= 1
-        self.save()
+        return (
+            cls.objects.select_for_update()
+            .only("id", "enrollment_tokens")
+            .get(id=classid)
+        )
+
+    def decrement_enrollment_tokens(self, count: int = 1):
+        """Remove enrollment tokens"""
+
+        Class.objects.filter(id=self.id).update(
+            enrollment_tokens=models.F("enrollment_tokens") - count
+        )
+        self.enrollment_tokens -= count
 
     def get_open_assignments(self) -> models.manager.BaseManager["Assignment"]:
         """Get a query of all open assignments"""
@@ -124,130 +185,78 @@ class Class(models.Model):
             connectedclass=self, startdate__lte=now(), duedate__gte=now()
         )
 
-    def update_trend_log(
-        self,
-        save: bool = True,
-        new_animals: Optional[list["Animal"]] = None,
-        old_animals: Optional[list["Animal"]] = None,
-    ) -> None:
-        """Update the class trend log"""
-
-        if new_animals is not None and old_animals is not None:
-            last = self.trend_log[-1]
-            last_pop = last[nms.POPULATION_SIZE_KEY]
-            new_pop = last_pop - len(old_animals) + len(new_animals)
-
-            capture = {
-                nms.GENOTYPE_KEY: {},
-                nms.PHENOTYPE_KEY: {},
-                nms.PTA_KEY: {},
-            }
-            for key, val in last[nms.GENOTYPE_KEY].items():
-                old_sum = 0
-                for animal in old_animals:
-                    old_sum += animal.genotype[key]
-
-                new_sum = 0
-                for animal in new_animals:
-                    new_sum += animal.genotype[key]
-
-                capture[nms.GENOTYPE_KEY][key] = (
-                    (val * last_pop) - old_sum + new_sum
-                ) / new_pop
-
-            for key, val in last[nms.PHENOTYPE_KEY].items():
-                old_sum = 0
-                for animal in old_animals:
-                    old_sum += animal.phenotype[key] or 0
-
-                new_sum = 0
-                for animal in new_animals:
-                    new_sum += animal.phenotype[key] or 0
-
-                capture[nms.PHENOTYPE_KEY][key] = (
-                    (val * last_pop) - old_sum + new_sum
-                ) / new_pop
-
-            if nms.PTA_KEY in last:
-                for key, val in last[nms.PTA_KEY].items():
-                    old_sum = 0
-                    for animal in old_animals:
-                        old_sum += animal.ptas[key]
-
-                    new_sum = 0
-                    for animal in new_animals:
-                        new_sum += animal.ptas[key]
-
-                    capture[nms.PTA_KEY][key] = (
-                        (val * last_pop) - old_sum + new_sum
-                    ) / new_pop
-
-            old_nm = 0
-            for animal in old_animals:
-                old_nm += animal.net_merit
-
-            new_nm = 0
-            for animal in new_animals:
-                new_nm += animal.net_merit
-
-            last_nm = last[nms.NETMERIT_KEY]
-            capture[nms.NETMERIT_KEY] = (
-                (last_nm * last_pop) - old_nm + new_nm
-            ) / new_pop
-            capture[nms.POPULATION_SIZE_KEY] = new_pop
-
-            capture[nms.TIME_STAMP_KEY] = now().isoformat()
-        else:
-            capture = {
-                nms.GENOTYPE_KEY: defaultdict(int),
-                nms.PHENOTYPE_KEY: defaultdict(int),
-                nms.PTA_KEY: defaultdict(int),
-            }
-            net_merit_capture = 0
+    def record_trend_delta(
+        self, new_animals: list["Animal"], old_animals: list["Animal"]
+    ) -> "TrendDelta":
+        """Record animals joining and leaving the living class population"""
+
+        delta = TrendDelta(
+            connectedclass=self,
+            population=len(new_animals) - len(old_animals),
+            net_merit=0,
+            genotype=defaultdict(float),
+            phenotype=defaultdict(float),
+            ptas=defaultdict(float),
+        )
 
-            animals = Animal.objects.defer("pedigree").filter(connectedclass=self)
-            num_animals_alive = 0
+        for animals, sign in ((new_animals, 1), (old_animals, -1)):
             for animal in animals:
-                if animal.herd_id is None:
-                    continue
-                else:
-                    num_animals_alive += 1
-
-                net_merit_capture += animal.net_merit
+                delta.net_merit += sign * animal.net_merit
 
                 for key, val in animal.genotype.items():
-                    capture[nms.GENOTYPE_KEY][key] += val
+                    delta.genotype[key] += sign * val
 
                 for key, val in animal.phenotype.items():
-                    capture[nms.PHENOTYPE_KEY][key] += val or 0
+                    delta.phenotype[key] += sign * (val or 0)
 
                 for key, val in animal.ptas.items():
-                    capture[nms.PTA_KEY][key] += val
-
-            net_merit_capture = net_merit_capture / num_animals_alive
-
-            for key, val in capture[nms.GENOTYPE_KEY].items():
-                capture[nms.GENOTYPE_KEY][key] = val / num_animals_alive
+                    delta.ptas[key] += sign * val
 
-            for key, val in capture[nms.PHENOTYPE_KEY].items():
-                capture[nms.PHENOTYPE_KEY][key] = val / num_animals_alive
+        delta.save()
+        return delta
 
-            for key, val in capture[nms.PTA_KEY].items():
-                capture[nms.PTA_KEY][key] = val / num_animals_alive
+    def get_trend_log(self) -> list[dict[str, Any]]:
+        """Get the class averages after each recorded change"""
 
-            capture[nms.TIME_STAMP_KEY] = now().isoformat()
-            capture[nms.POPULATION_SIZE_KEY] = num_animals_alive
-            capture[nms.NETMERIT_KEY] = net_merit_capture
+        trend_log = []
+        population = 0
+        net_merit = 0
+        sums = {
+            nms.GENOTYPE_KEY: defaultdict(float),
+            nms.PHENOTYPE_KEY: defaultdict(float),
+            nms.PTA_KEY: defaultdict(float),
+        }
 
-        self.trend_log.append(capture)
+        for delta in TrendDelta.objects.filter(connectedclass=self).order_by("id"):
+            population += delta.population
+            net_merit += delta.net_merit
+            for key, values in (
+                (nms.GENOTYPE_KEY, delta.genotype),
+                (nms.PHENOTYPE_KEY, delta.phenotype),
+                (nms.PTA_KEY, delta.ptas),
+            ):
+                for trait, val in values.items():
+                    sums[key][trait] += val
+
+            divisor = population or 1
+            trend_log.append(
+                {
+                    nms.TIME_STAMP_KEY: delta.created.isoformat(),
+                    nms.POPULATION_SIZE_KEY: population,
+                    nms.NETMERIT_KEY: net_merit / divisor,
+                }
+                | {
+                    key: {trait: val / divisor for trait, val in values.items()}
+                    for key, values in sums.items()
+                }
+            )
 
-        if save:
-            self.save()
+        return trend_log
 
     def get_animal_file_headers(self) -> list[str]:
         """Get file headers for animal csv file for class"""
 
-        traitset = Traitset(self.traitset)
+        labels = self.get_export_labels()
 
         return (
             [
@@ -263,12 +272,51 @@ class Class(models.Model):
                 "Inbreeding Percent",
                 "Net Merit $",
             ]
-            + [filter_text_to_default(f"gen: <{x.uid}>", self) for x in traitset.traits]
-            + [filter_text_to_default(f"ph: <{x.uid}>", self) for x in traitset.traits]
-            + [filter_text_to_default(f"pta: <{x.uid}>", self) for x in traitset.traits]
-            + [filter_text_to_default(f"<{x.uid}>", self) for x in traitset.recessives]
+            + list(labels.genotypes)
+            + list(labels.phenotypes)
+            + list(labels.ptas)
+            + list(labels.recessives)
         )
 
+    def get_conversion_table(self) -> ConversionTable:
+        """Get the cached real unit conversion for the class's traitset and
+        default animal"""
+
+        return get_conversion_table(self.traitset, self.default_animal)
+
+    def iter_animal_file_rows(
+        self, real_units: bool = False, chunk_size: int = 5_000
+    ) -> Iterator[list[Any]]:
+        """Iterate over the animal file rows for the class. Trait values are
+        in genetic units unless real_units is set."""
+
+        data_keys = self.get_animal_file_data_order()
+        table = self.get_conversion_table() if real_units else None
+        animals = (
+            Animal.objects.select_related("herd", "connectedclass")
+            .filter(connectedclass=self)
+            .defer("pedigree")
+            .iterator(chunk_size=chunk_size)
+        )
+
+        for chunk in batched(animals, chunk_size):
+            rows = [
+                [animal.resolve_data_key(key) for key in data_keys] for animal in chunk
+            ]
+
+            if table is not None and table.uids:
+                table.convert_rows(
+                    rows, data_keys.index((nms.GENOTYPE_KEY, table.uids[0]))
+                )
+
+            yield from rows
+
+    def get_export_labels(self) -> ExportLabels:
+        """Get the cached column labels for the class's traitset and default
+        animal"""
+
+        return get_export_labels(self.traitset, self.default_animal)
+
     def get_animal_file_data_order(
         self,
     ) -> list[str | tuple[str, str]]:
@@ -294,49 +342,169 @@ class Class(models.Model):
             + [(nms.FORMATTED_RECESSIVES_KEY, x.uid) for x in traitset.recessives]
         )
 
-    @staticmethod
-    @background_task.background(schedule=0)
-    def recalculate_ptas(connectedclass: int, email: str, genomic_test: bool = False):
-        """Recalculate the PTAs on all male animals"""
+    def get_visibility_hash(self) -> str:
+        """Summarize the settings that change what students can see of an
+        animal"""
 
-        connectedclass = Class.objects.get(id=connectedclass)
-        traitset = Traitset(connectedclass.traitset)
-        sire_daughters = models.Count(
-            "animal_sire", filter=models.Q(animal_sire__male=False)
-        )
-        dam_daughters = models.Count(
-            "animal_dam", filter=models.Q(animal_dam__male=False)
+        settings = [
+            self.trait_visibility,
+            self.recessive_visibility,
+            self.hide_female_pta,
+            self.net_merit_visibility,
+        ]
+        return sha1(dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def get_data_fingerprint(self) -> str:
+        """Summarize the class animals so that unchanged exports can be reused"""
+
+        # Every change to the class animals bumps the version of the class or
+        # of the herds the animals are moved in and out of.
+        herds = Herd.objects.filter(connectedclass=self).aggregate(
+            models.Count("id"),
+            models.Sum("id"),
+            models.Sum("version"),
         )
-        animals = (
-            Animal.objects.annotate(
-                number_of_daughters_sire=sire_daughters,
-                number_of_daughters_dam=dam_daughters,
+        version = Class.objects.filter(id=self.id).values_list("version", flat=True)
+
+        parts = [self.name, self.default_animal, version.get()]
+        parts += list(herds.values())
+        return sha1("|".join(str(x) for x in parts).encode("utf-8")).hexdigest()
+
+    def delete_in_batches(
+        self,
+        batch_size: int = 5_000,
+        progress: Optional[Callable[[str, int], None]] = None,
+    ) -> None:
+        """Delete the class and everything connected to it using bulk deletes.
+        Dependents are removed in dependency order with small transactions so
+        that large classes do not need to be loaded into memory."""
+
+        def report(label: str, count: int) -> None:
+            if progress is not None:
+                progress(label, count)
+
+        def execute(sql: str, params: list[Any]) -> int:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.rowcount
+
+        def table(model: type[models.Model]) -> str:
+            return connection.ops.quote_name(model._meta.db_table)
+
+        def column(model: type[models.Model], field: str) -> str:
+            return connection.ops.quote_name(model._meta.get_field(field).column)
+
+        def delete_where(model: type[models.Model], where: str) -> int:
+            with transaction.atomic():
+                count = execute(f"DELETE FROM {table(model)} WHERE {where}", [self.id])
+
+            report(model.__name__, count)
+            return count
+
+        def in_class_assignments(model: type[models.Model]) -> str:
+            return (
+                f"{column(model, 'assignment')} IN"
+                + f" (SELECT {column(Assignment, 'id')} FROM {table(Assignment)}"
+                + f" WHERE {column(Assignment, 'connectedclass')} = %s)"
             )
-            .defer("pedigree")
-            .filter(connectedclass=connectedclass, herd__isnull=False)
+
+        with transaction.atomic():
+            Class.objects.filter(id=self.id).update(class_herd=None)
+            Herd.objects.filter(connectedclass=self).update(enrollment=None)
+
+        delete_where(AssignmentFulfillment, in_class_assignments(AssignmentFulfillment))
+        delete_where(AssignmentStep, in_class_assignments(AssignmentStep))
+        delete_where(Assignment, f"{column(Assignment, 'connectedclass')} = %s")
+        delete_where(
+            EnrollmentRequest, f"{column(EnrollmentRequest, 'connectedclass')} = %s"
         )
+        delete_where(ClassJob, f"{column(ClassJob, 'connectedclass')} = %s")
+        delete_where(TrendDelta, f"{column(TrendDelta, 'connectedclass')} = %s")
+
+        # Offspring always have higher ids than their parents. Deleting from the
+        # highest id down means no batch leaves a dangling sire or dam reference,
+        # so the SET_NULL updates Django would run are not needed.
+        animals = Animal.objects.filter(connectedclass=self).order_by("-id")
+        deleted = 0
+        while upper := animals.values_list("id", flat=True).first():
+            batch_end = animals.filter(id__lte=upper).values_list("id", flat=True)[
+                batch_size - 1 : batch_size
+            ]
+            lower = batch_end[0] if batch_end else 0
+
+            with transaction.atomic():
+                deleted += execute(
+                    f"DELETE FROM {table(Animal)}"
+                    + f" WHERE {column(Animal, 'connectedclass')} = %s"
+                    + f" AND {column(Animal, 'id')} >= %s"
+                    + f" AND {column(Animal, 'id')} <= %s",
+                    [self.id, lower, upper],
+                )
 
-        for animal in animals:
-            if genomic_test:
-                animal.genomic_tests += 1
+            report(Animal.__name__, deleted)
 
-            animal.recalculate_pta_unsaved(
-                animal.number_of_daughters_sire + animal.number_of_daughters_dam,
-                traitset,
+        delete_where(Enrollment, f"{column(Enrollment, 'connectedclass')} = %s")
+        delete_where(Herd, f"{column(Herd, 'connectedclass')} = %s")
+        delete_where(Class, f"{column(Class, 'id')} = %s")
+
+    @staticmethod
+    @tasks.task
+    def recalculate_ptas(
+        jobid: int, email: Optional[str] = None, genomic_test: bool = False
+    ):
+        """Recalculate the PTAs on all male animals. Tasks queued before
+        ClassJob existed pass (classid, email, genomic_test) and are
+        resubmitted as a job."""
+
+        if email is not None:
+            kind = (
+                ClassJob.KIND_GENOMIC_TEST
+                if genomic_test
+                else ClassJob.KIND_CALCULATE_PTAS
             )
+            ClassJob.submit_legacy(jobid, kind, email)
+            return
 
-        Animal.objects.bulk_update(animals, ["genomic_tests", "ptas"])
+        job = ClassJob.start(jobid)
+        genomic_test = job.kind == ClassJob.KIND_GENOMIC_TEST
 
-        send_mail(
-            "Genomic Test Complete" if genomic_test else "PTA Calculation Complete",
-            "The task you requested from HerdGenetics is complete.",
-            settings.EMAIL_HOST_USER,
-            [email],
-            fail_silently=False,
-        )
+        try:
+            connectedclass = job.connectedclass
+            traitset = Traitset(connectedclass.traitset)
+            sire_daughters = models.Count(
+                "animal_sire", filter=models.Q(animal_sire__male=False)
+            )
+            dam_daughters = models.Count(
+                "animal_dam", filter=models.Q(animal_dam__male=False)
+            )
+            animals = (
+                Animal.objects.annotate(
+                    number_of_daughters_sire=sire_daughters,
+                    number_of_daughters_dam=dam_daughters,
+                )
+                .defer("pedigree")
+                .filter(connectedclass=connectedclass, herd__isnull=False)
+            )
+
+            for animal in animals:
+                if genomic_test:
+                    animal.genomic_tests += 1
+
+                animal.recalculate_pta_unsaved(
+                    animal.number_of_daughters_sire + animal.number_of_daughters_dam,
+                    traitset,
+                )
 
+            Animal.objects.bulk_update(animals, ["genomic_tests", "ptas"])
+            Herd.bump_versions(connectedclass=connectedclass)
+        except Exception:
+            job.fail()
+            raise
 
-class Herd(models.Model):
+        job.finish()
+
+
+class Herd(VersionedModel):
     "Manages a group of animals"
 
     class Admin(ModelAdmin):
@@ -376,27 +544,36 @@ class Herd(models.Model):
     ) -> "Herd":
         "Create a random herd for new enrollment"
 
-        new = cls(name=name, connectedclass=connectedclass)
-        new.save()
+        herds, _animals = cls.generate_starter_herds(
+            [name], females, males, traitset, connectedclass
+        )
+        return herds[0]
 
-        male_animals = [
-            Animal.generate_random_unsaved(True, new, traitset, connectedclass)
-            for _ in range(males)
-        ]
+    @classmethod
+    def generate_starter_herds(
+        cls,
+        names: list[str],
+        females: int,
+        males: int,
+        traitset: Traitset,
+        connectedclass: Class,
+    ) -> tuple[list["Herd"], list["Animal"]]:
+        """Create a random herd for each name. Animals for every herd are
+        generated in one batch and inserted together."""
 
-        female_animals = [
-            Animal.generate_random_unsaved(False, new, traitset, connectedclass)
-            for _ in range(females)
-        ]
+        herds = cls.objects.bulk_create(
+            [cls(name=name, connectedclass=connectedclass) for name in names]
+        )
 
-        Animal.objects.bulk_create(male_animals + female_animals)
-        for animal in male_animals + female_animals:
-            animal.finalize_animal_unsaved(new)
-        Animal.objects.bulk_update(
-            male_animals + female_animals, ["name", "pedigree", "inbreeding"]
+        animals = Animal.generate_founders_unsaved(
+            [herd for herd in herds for _ in range(males + females)],
+            [male for _ in herds for male in [True] * males + [False] * females],
+            traitset,
+            connectedclass,
         )
+        Animal.create_finalized(animals)
 
-        return new
+        return herds, animals
 
     @classmethod
     def generate_empty_herd(cls, name: str, connectedclass: Class) -> "Herd":
@@ -414,75 +591,256 @@ class Herd(models.Model):
         """Calculate the number if male and females to be born to herd.
         Based on target number and number of possible mothers"""
 
-        def total_to_be_born():
-            return target_num_males + target_num_females
+        return simulation.get_total_to_be_born(
+            target_num_males, target_num_females, num_mothers
+        )
 
-        while total_to_be_born() > num_mothers:
-            if target_num_males > 0:
-                target_num_males -= 1
-            if target_num_females > 0:
-                target_num_females -= 1
+    @classmethod
+    def lock(cls, herdid: int) -> "Herd":
+        """Lock the herd row until the end of the transaction so that
+        simultaneous breedings and submissions run one after the other"""
 
-        return target_num_males, target_num_females, total_to_be_born()
+        return cls.objects.select_for_update().only("id", "breedings").get(id=herdid)
 
     def breed_herd(self, sires: list["Animal"], assignment: str) -> BreedingResults:
         """Run a breeding on herd"""
 
-        NUMBER_OF_MALES = 10
-        NUMBER_OF_FEMALES = 70
-        MAX_AGE = 5
+        connectedclass = self.connectedclass
+
+        with tracing.span(
+            "breed_herd", herd=self.id, connectedclass=self.connectedclass_id
+        ) as breeding_span:
+            self.breedings = Herd.lock(self.id).breedings
+            breeding_span.set("breedings", self.breedings)
+
+            with tracing.span("select_mothers") as phase:
+                mothers = list(
+                    Animal.objects.filter(male=False, herd=self)
+                    .only(
+                        "id",
+                        "sire",
+                        "dam",
+                        "genotype",
+                        "phenotype",
+                        "recessives",
+                        "pedigree",
+                    )
+                    .order_by("?")
+                )
+                phase.set("mothers", len(mothers))
 
-        mothers = Animal.objects.filter(male=False, herd=self).order_by("?")
-        num_males, _num_females, total_to_be_born = self.get_total_to_be_born(
-            NUMBER_OF_MALES, NUMBER_OF_FEMALES, len(mothers)
-        )
+            num_males, _num_females, total_to_be_born = self.get_total_to_be_born(
+                connectedclass.herd_males, connectedclass.herd_females, len(mothers)
+            )
 
-        traitset = Traitset(self.connectedclass.traitset)
-        self.breedings += 1
+            traitset = Traitset(connectedclass.traitset)
+            self.breedings += 1
+
+            with tracing.span("generate_calves", calves=total_to_be_born):
+                animals = Animal.generate_from_breeding_unsaved_batch(
+                    [i < num_males for i in range(total_to_be_born)],
+                    self,
+                    traitset,
+                    connectedclass,
+                    [sires[i % len(sires)] for i in range(total_to_be_born)],
+                    mothers[:total_to_be_born],
+                    assignment,
+                )
 
-        animals: list[Animal] = []
-        for i in range(total_to_be_born):
-            male = i < num_males
-            sire = sires[i % len(sires)]
-            dam = mothers[i]
+            with tracing.span("insert", animals=len(animals)) as phase:
+                phase.set("preallocated", Animal.create_finalized(animals))
+
+            with tracing.span("cull") as phase:
+                all_animals = list(
+                    Animal.objects.only(
+                        "id",
+                        "generation",
+                        "net_merit",
+                        "genotype",
+                        "phenotype",
+                        "ptas",
+                        "recessives",
+                    ).filter(herd=self)
+                )
+                recessive_deaths = self.collect_positive_fatal_recessive_animals(
+                    all_animals, traitset
+                )
+                age_deaths = self.collect_deaths_from_age(
+                    all_animals, connectedclass.max_age
+                )
+                total_dead = set(recessive_deaths + age_deaths)
 
-            animal = Animal.generate_from_breeding_unsaved(
-                male, self, traitset, self.connectedclass, sire, dam, assignment
-            )
-            animals.append(animal)
+                Animal.objects.filter(id__in=[x.id for x in total_dead]).update(
+                    herd=None
+                )
+                phase.set("recessive_deaths", len(recessive_deaths))
+                phase.set("age_deaths", len(age_deaths))
 
-        Animal.objects.bulk_create(animals)
-        for animal in animals:
-            animal.finalize_animal_unsaved(self)
-        Animal.objects.bulk_update(animals, ["name", "pedigree", "inbreeding"])
+            with tracing.span("trend_update"):
+                self.connectedclass.record_trend_delta(
+                    new_animals=animals, old_animals=list(total_dead)
+                )
 
-        all_animals = Animal.objects.defer("pedigree").filter(herd=self)
-        recessive_deaths = self.collect_positive_fatal_recessive_animals(
-            all_animals, traitset
-        )
-        age_deaths = self.collect_deaths_from_age(all_animals, MAX_AGE)
-        total_dead = set(recessive_deaths + age_deaths)
-        for animal in total_dead:
-            animal.herd = None
+            self.save(update_fields=["breedings"])
+            self.bump_version()
+
+            return self.BreedingResults(len(recessive_deaths), len(age_deaths))
+
+    def fast_forward(
+        self, generations: int, strategy: str, sires: int, assignment: str = ""
+    ) -> list[simulation.Generation]:
+        """Run generations breedings of the herd in memory, choosing sires
+        with a simulation strategy. Only the resulting animals and one trend
+        delta per breeding are saved."""
+
+        connectedclass = self.connectedclass
+        traitset = Traitset(connectedclass.traitset)
+        select_sires = simulation.get_sire_selector(traitset, strategy)
+
+        with tracing.span(
+            "fast_forward", herd=self.id, generations=generations
+        ) as fast_forward_span:
+            self.breedings = Herd.lock(self.id).breedings
+
+            with tracing.span("load") as phase:
+                snapshot = self.get_snapshot(traitset)
+                phase.set("animals", len(snapshot.animals))
+
+            with tracing.span("simulate"):
+                herd = snapshot.get_simulation(traitset)
+                kinship = herd.kinship
+                results = herd.run(generations, select_sires, sires)
+                fast_forward_span.set("breedings", len(results))
+
+            if not results:
+                return results
+
+            with tracing.span("insert") as phase:
+                born = simulation.Animals.concatenate([x.calves for x in results])
+                living = set(herd.animals.ids.tolist())
+                phase.set(
+                    "animals",
+                    self.save_simulated(born, living, kinship, traitset, assignment),
+                )
+
+            with tracing.span("cull"):
+                Animal.objects.filter(
+                    id__in=[x for x in snapshot.animals.ids.tolist() if x not in living]
+                ).update(herd=None)
+
+            with tracing.span("trend_update"):
+                TrendDelta.objects.bulk_create(
+                    [
+                        TrendDelta(
+                            connectedclass=connectedclass,
+                            **simulation.get_trend_delta(traitset, x.calves, x.dead),
+                        )
+                        for x in results
+                    ]
+                )
 
-        Animal.objects.bulk_update(total_dead, ["herd"])
+            self.breedings = herd.breedings
+            self.save(update_fields=["breedings"])
+            self.bump_version()
+
+            return results
+
+    def get_snapshot(
+        self, traitset: Optional[Traitset] = None
+    ) -> simulation.HerdSnapshot:
+        """The living animals of the herd as arrays for simulations"""
+
+        connectedclass = self.connectedclass
+        animals = list(
+            Animal.objects.filter(herd=self).only(
+                "id",
+                "sire",
+                "dam",
+                "male",
+                "generation",
+                "net_merit",
+                "inbreeding",
+                "genotype",
+                "phenotype",
+                "ptas",
+                "recessives",
+            )
+        )
 
-        self.connectedclass.update_trend_log(
-            new_animals=animals, old_animals=total_dead
+        return simulation.HerdSnapshot.from_animals(
+            traitset or Traitset(connectedclass.traitset),
+            animals,
+            Animal.get_kinship(animals),
+            self.breedings,
+            connectedclass.herd_males,
+            connectedclass.herd_females,
+            connectedclass.max_age,
         )
-        self.save()
 
-        return self.BreedingResults(len(recessive_deaths), len(age_deaths))
+    def save_simulated(
+        self,
+        born: simulation.Animals,
+        living: set[int],
+        kinship: pedigrees.Kinship,
+        traitset: Traitset,
+        assignment: str,
+    ) -> int:
+        """Insert every animal born in a simulation, replacing their temporary
+        ids in parents and pedigrees. Animals that died are saved outside the
+        herd, as in breed_herd, so later inbreeding sees all of their
+        ancestors. When ids can be reserved each row is written once,
+        otherwise calves are inserted and then updated. Returns the number of
+        animals saved."""
+
+        def create(row: int, id: int) -> Animal:
+            values = born.to_dicts(traitset, row)
+            return Animal(
+                herd=self if id in living else None,
+                connectedclass=self.connectedclass,
+                assignment=assignment,
+                generation=int(born.generation[row]),
+                male=bool(born.male[row]),
+                genotype=values[nms.GENOTYPE_KEY],
+                phenotype=values[nms.PHENOTYPE_KEY],
+                ptas=values[nms.PTA_KEY],
+                recessives=values[nms.RECESSIVES_KEY],
+                inbreeding=float(born.inbreeding[row]),
+                net_merit=float(born.net_merit[row]),
+                pedigree={},
+            )
+
+        temporary_ids = born.ids.tolist()
+        ids = Animal.allocate_ids(len(born))
+        preallocated = ids is not None
+
+        animals = [create(i, id) for i, id in enumerate(temporary_ids)]
+        if not preallocated:
+            Animal.objects.bulk_create(animals)
+            ids = [x.id for x in animals]
+
+        kinship.renumber(dict(zip(temporary_ids, ids)))
+        for animal, id in zip(animals, ids, strict=True):
+            animal.id = id
+            animal.sire_id, animal.dam_id = kinship.parents[animal.id]
+            animal.pedigree = kinship.get_pedigree(
+                animal.id, Animal.PEDIGREE_GENERATIONS
+            )
+            animal.finalize_animal_unsaved(self)
+
+        if preallocated:
+            Animal.objects.bulk_create(animals)
+        else:
+            Animal.objects.bulk_update(animals, ["sire", "dam", "name", "pedigree"])
+
+        return len(animals)
 
     def json_dict(self) -> dict[str, Any]:
         """Get herd as json serializable dict"""
 
-        animals = (
-            Animal.objects.select_related("connectedclass")
-            .defer("pedigree", "connectedclass__trend_log")
-            .filter(herd=self)
-        )
-        num_animals = animals.count()
+        connectedclass = self.connectedclass
+        trait_visibility = connectedclass.trait_visibility
+        animals = animal_rows.AnimalRow.query(Animal.objects.filter(herd=self))
+        num_animals = len(animals)
 
         summary = {
             nms.GENOTYPE_KEY: defaultdict(int),
@@ -495,13 +853,13 @@ class Herd(models.Model):
             for animal in animals:
                 summary[nms.NETMERIT_KEY] += animal.net_merit
                 for key, val in animal.genotype.items():
-                    if self.connectedclass.trait_visibility[key][0]:
+                    if trait_visibility[key][0]:
                         summary[nms.GENOTYPE_KEY][key] += val
                 for key, val in animal.phenotype.items():
-                    if self.connectedclass.trait_visibility[key][1]:
+                    if trait_visibility[key][1]:
                         summary[nms.PHENOTYPE_KEY][key] += val or 0
                 for key, val in animal.ptas.items():
-                    if self.connectedclass.trait_visibility[key][2]:
+                    if trait_visibility[key][2]:
                         summary[nms.PTA_KEY][key] += val
 
             summary[nms.NETMERIT_KEY] = summary[nms.NETMERIT_KEY] / num_animals
@@ -515,14 +873,16 @@ class Herd(models.Model):
             for key, val in summary[nms.PTA_KEY].items():
                 summary[nms.PTA_KEY][key] = val / num_animals
 
-        if not self.connectedclass.net_merit_visibility:
+        if not connectedclass.net_merit_visibility:
             summary.pop(nms.NETMERIT_KEY)
 
         return {
             nms.NAME_KEY: self.name,
             "connectedclass": self.connectedclass_id,
             "breedings": self.breedings,
-            "animals": {x.id: x.json_dict() for x in animals},
+            "animals": {
+                x.id: animal_rows.get_json_dict(x, connectedclass) for x in animals
+            },
             "summary": summary,
         }
 
@@ -531,14 +891,10 @@ class Herd(models.Model):
     ) -> list["Animal"]:
         """Get a list of all animals with fatal genetic recessives"""
 
-        dead = []
-        for animal in animals:
-            for key, val in animal.recessives.items():
-                if val == HOMOZYGOUS_CARRIER_KEY:
-                    if traitset.find_recessive_or_null(key).fatal:
-                        dead.append(animal)
+        alleles = traitset.to_recessive_alleles([x.recessives for x in animals])
+        dead = traitset.has_fatal_recessive(alleles).tolist()
 
-        return dead
+        return [animal for animal, fatal in zip(animals, dead) if fatal]
 
     def collect_deaths_from_age(
         self, animals: list["Animal"], maxage: int
@@ -584,40 +940,69 @@ class Enrollment(models.Model):
     def create_from_enrollment_request(
         cls, enrollment_request: "EnrollmentRequest"
     ) -> "Enrollment":
-        traitset = Traitset(enrollment_request.connectedclass.traitset)
+        return cls.create_from_enrollment_requests([enrollment_request])[0]
 
-        name = cls.generate_herd_from_team_name(
-            enrollment_request.student.get_full_name()
-        )
+    @classmethod
+    def create_from_enrollment_requests(
+        cls, enrollment_requests: list["EnrollmentRequest"]
+    ) -> list["Enrollment"]:
+        """Confirm enrollment requests to one class. Starter herds for all of
+        them are generated together and saved with a few bulk queries."""
 
-        new = cls(
-            student=enrollment_request.student,
-            connectedclass=enrollment_request.connectedclass,
-            animal=enrollment_request.connectedclass.default_animal,
+        if not enrollment_requests:
+            return []
+
+        connectedclass = enrollment_requests[0].connectedclass
+        if any(x.connectedclass_id != connectedclass.id for x in enrollment_requests):
+            raise ValueError("Enrollment requests must all be to the same class")
+
+        traitset = Traitset(connectedclass.traitset)
+        herds, animals = Herd.generate_starter_herds(
+            [
+                cls.generate_herd_from_team_name(x.student.get_full_name())
+                for x in enrollment_requests
+            ],
+            connectedclass.herd_females,
+            connectedclass.herd_males,
+            traitset,
+            connectedclass,
         )
-        new.herd = Herd.generate_starter_herd(
-            name, 70, 10, traitset, enrollment_request.connectedclass
+
+        enrollments = cls.objects.bulk_create(
+            [
+                cls(
+                    student=enrollment_request.student,
+                    connectedclass=connectedclass,
+                    animal=connectedclass.default_animal,
+                    herd=herd,
+                )
+                for enrollment_request, herd in zip(
+                    enrollment_requests, herds, strict=True
+                )
+            ]
         )
-        new.save()
-        new.herd.enrollment = new
-        new.herd.save()
-
-        enrollment_request.delete()
-        new.connectedclass.update_trend_log(
-            save=False,
-            new_animals=Animal.objects.defer("pedigree").filter(herd=new.herd),
-            old_animals=[],
+        for herd, enrollment in zip(herds, enrollments, strict=True):
+            herd.enrollment = enrollment
+        Herd.objects.bulk_update(herds, ["enrollment"])
+
+        EnrollmentRequest.objects.filter(
+            id__in=[x.id for x in enrollment_requests]
+        ).delete()
+        connectedclass.record_trend_delta(new_animals=animals, old_animals=[])
+        connectedclass.decrement_enrollment_tokens(len(enrollments))
+        connectedclass.bump_version()
+
+        AssignmentFulfillment.objects.bulk_create(
+            [
+                AssignmentFulfillment(assignment=assignment, enrollment=enrollment)
+                for assignment in Assignment.objects.filter(
+                    connectedclass=connectedclass
+                )
+                for enrollment in enrollments
+            ]
         )
-        new.connectedclass.decrement_enrollment_tokens()
 
-        assignment_fulfilments = []
-        for assignment in Assignment.objects.filter(connectedclass=new.connectedclass):
-            assignment_fulfilments.append(
-                AssignmentFulfillment(assignment=assignment, enrollment=new)
-            )
-        AssignmentFulfillment.objects.bulk_create(assignment_fulfilments)
-
-        return new
+        return enrollments
 
     def json_dict(self) -> dict[str, Any]:
         return {
@@ -635,7 +1020,16 @@ class Enrollment(models.Model):
         json = {}
 
         assignments = Assignment.objects.prefetch_related(
-            "assignmentstep_assignment"
+            models.Prefetch(
+                "assignmentstep_assignment",
+                queryset=AssignmentStep.objects.order_by("number"),
+                to_attr="ordered_steps",
+            ),
+            models.Prefetch(
+                "assignmentfulfillment_set",
+                queryset=AssignmentFulfillment.objects.filter(enrollment=self),
+                to_attr="enrollment_fulfillments",
+            ),
         ).filter(
             connectedclass=self.connectedclass,
             startdate__lte=now(),
@@ -649,14 +1043,9 @@ class Enrollment(models.Model):
                 "duedate": assignment.duedate,
                 "steps": [
                     {"key": x.step, "verbose": x.verbose_step()}
-                    for x in sorted(
-                        assignment.assignmentstep_assignment.all(),
-                        key=lambda y: y.number,
-                    )
+                    for x in assignment.ordered_steps
                 ],
-                "fulfillment": AssignmentFulfillment.objects.get(
-                    enrollment=self, assignment=assignment
-                ).current_step,
+                "fulfillment": assignment.enrollment_fulfillments[0].current_step,
             }
 
         return json
@@ -676,6 +1065,7 @@ class EnrollmentRequest(models.Model):
     def create_new(cls, student: User, connectedclass: "Class") -> "EnrollmentRequest":
         new = cls(student=student, connectedclass=connectedclass)
         new.save()
+        connectedclass.bump_version()
         return new
 
     def json_dict(self) -> dict[str, Any]:
@@ -736,6 +1126,11 @@ class Animal(models.Model):
     inbreeding = models.FloatField(default=0)
     net_merit = models.FloatField()
 
+    # Generations of ancestors kept in each stored pedigree. Pedigrees are
+    # only for display, inbreeding is worked out from the sire and dam columns
+    # so it includes every common ancestor however far back.
+    PEDIGREE_GENERATIONS = 5
+
     def __str__(self) -> str:
         return f"{self.id} | {self.name}"
 
@@ -767,115 +1162,274 @@ class Animal(models.Model):
         return new
 
     @classmethod
-    def generate_from_breeding_unsaved(
+    def generate_random_unsaved_batch(
         cls,
-        male: bool,
-        herd: Herd,
+        herds: list[Herd],
+        males: list[bool],
         traitset: Traitset,
         connectedclass: Class,
-        sire: "Animal",
-        dam: "Animal",
-        assignment: str,
-    ) -> "Animal":
-        new = cls(male=male, herd=herd, connectedclass=connectedclass)
-        new.pedigree = {
-            nms.SIRE_ID_KEY: sire.pedigree,
-            nms.DAM_ID_KEY: dam.pedigree,
-            nms.ID_KEY: None,
-        }
-        new.genotype = traitset.get_genotype_from_breeding(sire.genotype, dam.genotype)
-        new.net_merit = traitset.derive_net_merit_from_genotype(new.genotype)
-        new.inbreeding = inbreeding_calculator.InbreedingCalculator(
-            new.pedigree
-        ).get_coefficient()
-        new.sire = sire
-        new.dam = dam
+    ) -> list["Animal"]:
+        """generate_random_unsaved for many animals, using the traitset's
+        vectorized kernels. herds and males give each animal's herd and sex."""
+
+        count = len(herds)
+        genotypes = traitset.get_random_genotype_batch(count)
+        net_merits = traitset.derive_net_merit_batch(genotypes).tolist()
+        ptas = traitset.to_trait_dicts(
+            traitset.derive_ptas_batch(genotypes, np.zeros(count), np.zeros(count))
+        )
+        recessives = traitset.get_random_recessives_batch(count)
 
-        new.phenotype = (
-            dam.phenotype
-            if male
-            else traitset.derive_phenotype_from_genotype(new.genotype, new.inbreeding)
+        female_rows = [i for i, male in enumerate(males) if not male]
+        phenotypes = iter(
+            traitset.to_trait_dicts(
+                traitset.derive_phenotype_batch(
+                    genotypes[female_rows], np.zeros(len(female_rows))
+                )
+            )
         )
+        genotypes = traitset.to_trait_dicts(genotypes)
+
+        animals = []
+        for i, (herd, male) in enumerate(zip(herds, males, strict=True)):
+            new = cls(male=male, herd=herd, connectedclass=connectedclass)
+            new.genotype = genotypes[i]
+            new.net_merit = net_merits[i]
+            new.phenotype = (
+                traitset.get_null_phenotype() if male else next(phenotypes)
+            )
+            new.ptas = ptas[i]
+            new.recessives = recessives[i]
+            new.pedigree = {
+                nms.SIRE_ID_KEY: None,
+                nms.DAM_ID_KEY: None,
+                nms.ID_KEY: None,
+            }
+            animals.append(new)
 
-        new.ptas = traitset.derive_ptas_from_genotype(new.genotype, 0, 0)
+        return animals
 
-        new.recessives = traitset.get_recessives_from_breeding(
-            sire.recessives, dam.recessives
-        )
-        new.generation = herd.breedings
-        new.assignment = assignment
+    @classmethod
+    def generate_founders_unsaved(
+        cls,
+        herds: list[Herd],
+        males: list[bool],
+        traitset: Traitset,
+        connectedclass: Class,
+    ) -> list["Animal"]:
+        """Random animals for starter herds. Taken from the founder pool when
+        FOUNDER_POOL_ENABLED is set, with any shortfall generated here."""
 
-        return new
+        if not settings.FOUNDER_POOL_ENABLED:
+            return cls.generate_random_unsaved_batch(
+                herds, males, traitset, connectedclass
+            )
 
-    def finalize_animal_unsaved(self, herd: Herd) -> None:
-        if herd.name[-1].lower() == "s":
-            self.name = herd.name + "' " + str(self.id)
-        else:
-            self.name = herd.name + "'s " + str(self.id)
+        pooled = {
+            male: iter(Founder.take(traitset.name, male, males.count(male)))
+            for male in (True, False)
+        }
 
-        self.pedigree["id"] = self.id
+        animals: list[Optional[Animal]] = []
+        missing = []
+        for i, (herd, male) in enumerate(zip(herds, males, strict=True)):
+            founder = next(pooled[male], None)
+            if founder is None:
+                missing.append(i)
+                animals.append(None)
+            else:
+                animals.append(founder.to_animal_unsaved(herd, connectedclass))
+
+        if missing:
+            generated = cls.generate_random_unsaved_batch(
+                [herds[i] for i in missing],
+                [males[i] for i in missing],
+                traitset,
+                connectedclass,
+            )
+            for i, animal in zip(missing, generated):
+                animals[i] = animal
 
-    def resolve_data_key(
-        self,
-        data_key: str | tuple[str, str],
-        connectedclass: Optional[Class] = None,
-    ) -> Any:
-        class_traitset = (
-            None if connectedclass is None else Traitset(connectedclass.traitset)
-        )
+        Founder.request_refill(traitset.name)
+        return animals
 
-        def adjust_gen(val, uid):
-            return (
-                val
-                if class_traitset is None
-                else val
-                * class_traitset.find_trait_or_null(uid)
-                .animals[connectedclass.default_animal]
-                .standard_deviation
+    @classmethod
+    def get_kinship(cls, animals: list["Animal"]) -> pedigrees.Kinship:
+        """Kinship with every ancestor of animals, read from the sire and dam
+        columns with one query per generation"""
+
+        kinship = pedigrees.Kinship()
+        frontier = set()
+        for animal in animals:
+            kinship.add_animal(animal.id, animal.sire_id, animal.dam_id)
+            frontier |= {animal.sire_id, animal.dam_id}
+
+        while frontier := frontier - kinship.parents.keys() - {None}:
+            parents = set()
+            for id, sire, dam in cls.objects.filter(id__in=frontier).values_list(
+                "id", "sire_id", "dam_id"
+            ):
+                kinship.add_animal(id, sire, dam)
+                parents |= {sire, dam}
+
+            # Deleted ancestors are treated as founders
+            for id in frontier - kinship.parents.keys():
+                kinship.add_animal(id, None, None)
+
+            frontier = parents
+
+        return kinship
+
+    @classmethod
+    def generate_from_breeding_unsaved_batch(
+        cls,
+        males: list[bool],
+        herd: Herd,
+        traitset: Traitset,
+        connectedclass: Class,
+        sires: list["Animal"],
+        dams: list["Animal"],
+        assignment: str,
+    ) -> list["Animal"]:
+        """Calves of each sire and dam pair, generated with the traitset's
+        vectorized kernels so the cost per calf stays constant as herds grow"""
+
+        count = len(males)
+        uids = [x.uid for x in traitset.traits]
+
+        with tracing.total("genotype"):
+            genotypes = traitset.get_genotype_from_breeding_batch(
+                np.array([[x.genotype[uid] for uid in uids] for x in sires]),
+                np.array([[x.genotype[uid] for uid in uids] for x in dams]),
             )
+            net_merits = traitset.derive_net_merit_batch(genotypes).tolist()
 
-        def adjust_phen(val, uid):
-            return (
-                val
-                if class_traitset is None
-                else (
-                    val
-                    * class_traitset.find_trait_or_null(uid)
-                    .animals[connectedclass.default_animal]
-                    .standard_deviation
-                    * 2
-                    + class_traitset.find_trait_or_null(uid)
-                    .animals[connectedclass.default_animal]
-                    .phenotype_average
-                    if val is not None
-                    else None
+        with tracing.total("inbreeding"):
+            kinship = cls.get_kinship(sires + dams)
+            inbreeding = [
+                kinship.inbreeding(sire.id, dam.id)
+                for sire, dam in zip(sires, dams, strict=True)
+            ]
+
+        with tracing.total("phenotype"):
+            female_rows = [i for i, male in enumerate(males) if not male]
+            phenotypes = iter(
+                traitset.to_trait_dicts(
+                    traitset.derive_phenotype_batch(
+                        genotypes[female_rows], np.array(inbreeding)[female_rows]
+                    )
                 )
             )
 
-        def adjust_pta(val, uid):
-            return (
-                val
-                if class_traitset is None
-                else val
-                * class_traitset.find_trait_or_null(uid)
-                .animals[connectedclass.default_animal]
-                .standard_deviation
-                * 2
-                + class_traitset.find_trait_or_null(uid)
-                .animals[connectedclass.default_animal]
-                .phenotype_average
+        with tracing.total("ptas"):
+            ptas = traitset.to_trait_dicts(
+                traitset.derive_ptas_batch(genotypes, np.zeros(count), np.zeros(count))
+            )
+
+        with tracing.total("recessives"):
+            recessives = traitset.get_recessives_from_breeding_batch(
+                [x.recessives for x in sires], [x.recessives for x in dams]
+            )
+
+        genotypes = traitset.to_trait_dicts(genotypes)
+        generations = cls.PEDIGREE_GENERATIONS - 1
+
+        animals = []
+        for i, (male, sire, dam) in enumerate(zip(males, sires, dams, strict=True)):
+            new = cls(male=male, herd=herd, connectedclass=connectedclass)
+            new.pedigree = {
+                nms.SIRE_ID_KEY: pedigrees.trim(sire.pedigree, generations),
+                nms.DAM_ID_KEY: pedigrees.trim(dam.pedigree, generations),
+                nms.ID_KEY: None,
+            }
+            new.genotype = genotypes[i]
+            new.net_merit = net_merits[i]
+            new.inbreeding = inbreeding[i]
+            new.sire = sire
+            new.dam = dam
+            new.phenotype = dam.phenotype if male else next(phenotypes)
+            new.ptas = ptas[i]
+            new.recessives = recessives[i]
+            new.generation = herd.breedings
+            new.assignment = assignment
+            animals.append(new)
+
+        return animals
+
+    @classmethod
+    def allocate_ids(cls, count: int) -> Optional[list[int]]:
+        """Reserve count primary keys from the table's sequence. Returns None
+        on databases without sequences."""
+
+        features = connection.features
+        if connection.vendor == "sqlite" and features.can_return_columns_from_insert:
+            # Bumping the AUTOINCREMENT counter also takes the write lock, so
+            # no other connection can be handed the same ids
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s"
+                    " RETURNING seq",
+                    [count, cls._meta.db_table],
+                )
+                row = cursor.fetchone()
+
+            if row is None:
+                return None
+
+            return list(range(row[0] - count + 1, row[0] + 1))
+
+        if connection.vendor != "postgresql":
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, %s))"
+                " FROM generate_series(1, %s)",
+                [cls._meta.db_table, cls._meta.pk.column, count],
             )
+            return [x[0] for x in cursor.fetchall()]
+
+    @classmethod
+    def create_finalized(cls, animals: list["Animal"]) -> bool:
+        """Insert new animals with their names and pedigree ids, which both
+        depend on the primary key. When ids can be reserved up front every row
+        is written once, otherwise the rows are inserted and then updated in a
+        single batch. Returns whether the ids were reserved."""
+
+        ids = cls.allocate_ids(len(animals))
+
+        if ids is not None:
+            for animal, id in zip(animals, ids, strict=True):
+                animal.id = id
+                animal.finalize_animal_unsaved(animal.herd)
+            cls.objects.bulk_create(animals)
+        else:
+            cls.objects.bulk_create(animals)
+            for animal in animals:
+                animal.finalize_animal_unsaved(animal.herd)
+            cls.objects.bulk_update(animals, ["name", "pedigree"])
+
+        return ids is not None
 
+    def finalize_animal_unsaved(self, herd: Herd) -> None:
+        if herd.name[-1].lower() == "s":
+            self.name = herd.name + "' " + str(self.id)
+        else:
+            self.name = herd.name + "'s " + str(self.id)
+
+        self.pedigree["id"] = self.id
+
+    def resolve_data_key(self, data_key: str | tuple[str, str]) -> Any:
         if type(data_key) is tuple:
             match data_key[0]:
                 case nms.GENOTYPE_KEY:
-                    return adjust_gen(self.genotype[data_key[1]], data_key[1])
+                    return self.genotype[data_key[1]]
                 case nms.PHENOTYPE_KEY:
-                    return adjust_phen(self.phenotype[data_key[1]], data_key[1])
+                    return self.phenotype[data_key[1]]
                 case nms.RECESSIVES_KEY:
                     return self.recessives[data_key[1]]
                 case nms.PTA_KEY:
-                    return adjust_pta(self.ptas[data_key[1]], data_key[1])
+                    return self.ptas[data_key[1]]
                 case nms.FORMATTED_RECESSIVES_KEY:
                     match self.recessives[data_key[1]]:
                         case traitset.HOMOZYGOUS_FREE_KEY:
@@ -924,45 +1478,7 @@ class Animal(models.Model):
                     return self.assignment
 
     def json_dict(self) -> dict[str, Any]:
-        json = {}
-
-        data_keys = [
-            nms.ID_KEY,
-            nms.NAME_KEY,
-            nms.GENERATION_KEY,
-            nms.ASSIGNMENT_KEY,
-            nms.DAM_ID_KEY,
-            nms.SIRE_ID_KEY,
-            nms.INBREEDING_COEFFICIENT_KEY,
-            nms.MALE_KEY,
-        ] + ([nms.NETMERIT_KEY] if self.connectedclass.net_merit_visibility else [])
-
-        for data_key in data_keys:
-            json[data_key] = self.resolve_data_key(data_key)
-
-        return json | {
-            nms.GENOTYPE_KEY: {
-                key: val
-                for key, val in self.genotype.items()
-                if self.connectedclass.trait_visibility[key][0]
-            },
-            nms.PHENOTYPE_KEY: {
-                key: val
-                for key, val in self.phenotype.items()
-                if self.connectedclass.trait_visibility[key][1]
-            },
-            nms.PTA_KEY: {
-                key: val
-                for key, val in self.ptas.items()
-                if self.connectedclass.trait_visibility[key][2]
-                and (self.male or not self.connectedclass.hide_female_pta)
-            },
-            nms.RECESSIVES_KEY: {
-                key: val
-                for key, val in self.recessives.items()
-                if self.connectedclass.recessive_visibility[key]
-            },
-        }
+        return animal_rows.get_json_dict(self, self.connectedclass)
 
     def recalculate_pta_unsaved(self, number_of_daughters: int, traitset: Traitset):
         self.ptas = traitset.derive_ptas_from_genotype(
@@ -1013,6 +1529,7 @@ class Assignment(models.Model):
                 AssignmentStep(number=idx, assignment=new, step=step)
             )
         AssignmentStep.objects.bulk_create(assignment_steps)
+        connectedclass.bump_version()
 
         return new
 
@@ -1059,3 +1576,370 @@ class AssignmentFulfillment(models.Model):
 
     def __str__(self) -> str:
         return f"{self.id} | {self.assignment.name} for {self.enrollment.student.email}"
+
+
+class ClassJob(models.Model):
+    """Background job run for a class. Identical requests share one job."""
+
+    class Admin(ModelAdmin):
+        list_display = ["kind", "status", "connectedclass", "created"]
+        list_filter = ["kind", "status"]
+
+    KIND_CALCULATE_PTAS = "ptas"
+    KIND_GENOMIC_TEST = "genomic"
+    KIND_ANIMAL_CHART = "chart"
+    KIND_REAL_UNIT_ANIMAL_CHART = "chart-real"
+
+    KINDS = (
+        (KIND_CALCULATE_PTAS, "Calculate PTAs"),
+        (KIND_GENOMIC_TEST, "Genomic Test"),
+        (KIND_ANIMAL_CHART, "Animal Chart"),
+        (KIND_REAL_UNIT_ANIMAL_CHART, "Animal Chart (Real Units)"),
+    )
+    PTA_KINDS = [KIND_CALCULATE_PTAS, KIND_GENOMIC_TEST]
+    CHART_KINDS = [KIND_ANIMAL_CHART, KIND_REAL_UNIT_ANIMAL_CHART]
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    STATUSES = (
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    )
+    ACTIVE_STATUSES = [STATUS_QUEUED, STATUS_RUNNING]
+
+    # Jobs that have been active this long are assumed to be lost
+    STALE_AFTER = timedelta(hours=6)
+
+    connectedclass = models.ForeignKey(to="Class", on_delete=models.CASCADE)
+    kind = models.CharField(choices=KINDS, max_length=255)
+    status = models.CharField(
+        choices=STATUSES, max_length=255, default=STATUS_QUEUED
+    )
+    fingerprint = models.CharField(max_length=255, blank=True, default="")
+    result = models.TextField(blank=True, default="")
+    emails = models.JSONField(default=list, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f"{self.id} | {self.kind} for {self.connectedclass_id}"
+
+    @classmethod
+    def submit(cls, connectedclass: Class, kind: str, email: str) -> "ClassJob":
+        """Queue a job for the class, or attach to an equivalent job that is
+        already queued or running. Animal charts are reused when the class has
+        not changed since the last export."""
+
+        # Lock the class so that simultaneous requests see each other's jobs
+        Class.objects.select_for_update().only("id").get(id=connectedclass.id)
+
+        active = (
+            cls.objects.select_for_update()
+            .filter(
+                connectedclass=connectedclass,
+                kind=kind,
+                status__in=cls.ACTIVE_STATUSES,
+                created__gte=now() - cls.STALE_AFTER,
+            )
+            .order_by("id")
+            .first()
+        )
+        if active:
+            if email not in active.emails:
+                active.emails.append(email)
+                active.save(update_fields=["emails"])
+
+            return active
+
+        fingerprint = connectedclass.get_data_fingerprint()
+        if kind in cls.CHART_KINDS:
+            done = (
+                cls.objects.filter(
+                    connectedclass=connectedclass,
+                    kind=kind,
+                    status=cls.STATUS_DONE,
+                    fingerprint=fingerprint,
+                )
+                .order_by("-id")
+                .first()
+            )
+            if done:
+                # Sent after the class lock is released. A mail failure is
+                # logged rather than failing the request.
+                transaction.on_commit(lambda: done.notify([email]), robust=True)
+                return done
+
+        new = cls(
+            connectedclass=connectedclass,
+            kind=kind,
+            fingerprint=fingerprint,
+            emails=[email],
+        )
+        new.save()
+        new.dispatch()
+
+        return new
+
+    @classmethod
+    def submit_legacy(cls, classid: int, kind: str, email: str) -> None:
+        """Submit a job for a task queued with the arguments used before
+        ClassJob existed. Tasks for deleted classes are dropped."""
+
+        with transaction.atomic():
+            connectedclass = Class.objects.filter(id=classid).first()
+            if connectedclass is not None:
+                cls.submit(connectedclass, kind, email)
+
+    def dispatch(self) -> None:
+        """Enqueue the background task for the job"""
+
+        from .csv import create_animal_csv
+
+        match self.kind:
+            case self.KIND_CALCULATE_PTAS | self.KIND_GENOMIC_TEST:
+                Class.recalculate_ptas(self.id)
+            case self.KIND_ANIMAL_CHART | self.KIND_REAL_UNIT_ANIMAL_CHART:
+                create_animal_csv(self.id)
+
+    @classmethod
+    def start(cls, jobid: int) -> "ClassJob":
+        """Mark job as running. Called by the background task."""
+
+        job = cls.objects.select_related("connectedclass").get(id=jobid)
+        job.status = cls.STATUS_RUNNING
+        job.fingerprint = job.connectedclass.get_data_fingerprint()
+        job.save(update_fields=["status", "fingerprint"])
+
+        return job
+
+    def finish(self, result: str = "") -> None:
+        """Mark job as done and email everyone attached to it"""
+
+        with transaction.atomic():
+            job = ClassJob.objects.select_for_update().get(id=self.id)
+            job.status = self.STATUS_DONE
+            job.result = result
+            job.save(update_fields=["status", "result"])
+
+            ClassJob.objects.filter(
+                connectedclass_id=job.connectedclass_id,
+                kind=job.kind,
+                status=self.STATUS_DONE,
+                id__lt=job.id,
+            ).delete()
+
+        job.notify(job.emails)
+
+    def fail(self) -> None:
+        """Detach a failed job so that new requests start a fresh one"""
+
+        ClassJob.objects.filter(id=self.id).update(status=self.STATUS_FAILED)
+
+    def notify(self, emails: list[str]) -> None:
+        """Email the outcome of the job, one message per address so that
+        requesters don't see each other's emails"""
+
+        match self.kind:
+            case self.KIND_ANIMAL_CHART | self.KIND_REAL_UNIT_ANIMAL_CHART:
+                subject = "Animal Chart Ready"
+                message = (
+                    "The animal chart you requested from HerdGenetics is ready."
+                    + f" You can download the file at {self.result}"
+                )
+            case self.KIND_GENOMIC_TEST:
+                subject = "Genomic Test Complete"
+                message = "The task you requested from HerdGenetics is complete."
+            case _:
+                subject = "PTA Calculation Complete"
+                message = "The task you requested from HerdGenetics is complete."
+
+        send_mass_mail(
+            [(subject, message, settings.EMAIL_HOST_USER, [x]) for x in emails],
+            fail_silently=False,
+        )
+
+
+class TrendDelta(models.Model):
+    """A change to the living population of a class. Stored as sums rather than
+    averages so that breedings can append deltas concurrently without
+    updating a shared row."""
+
+    class Admin(ModelAdmin):
+        list_display = ["connectedclass", "population", "created"]
+
+    connectedclass = models.ForeignKey(to="Class", on_delete=models.CASCADE)
+    population = models.IntegerField()
+    net_merit = models.FloatField()
+    genotype = models.JSONField()
+    phenotype = models.JSONField()
+    ptas = models.JSONField()
+    created = models.DateTimeField(default=now)
+
+    def __str__(self) -> str:
+        return f"{self.id} | {self.population:+} for {self.connectedclass_id}"
+
+
+class Founder(models.Model):
+    """A ready-made random animal waiting to be placed in a starter herd.
+    Filled in the background so enrollments only have to copy rows."""
+
+    class Admin(ModelAdmin):
+        list_display = ["traitset", "male", "created"]
+        list_filter = ["traitset", "male"]
+
+    REFILL_BATCH_SIZE = 1_000
+
+    traitset = models.CharField(max_length=255)
+    male = models.BooleanField()
+    net_merit = models.FloatField()
+    genotype = models.JSONField()
+    phenotype = models.JSONField()
+    ptas = models.JSONField()
+    recessives = models.JSONField()
+    created = models.DateTimeField(default=now)
+
+    class Meta:
+        indexes = [models.Index(fields=["traitset", "male", "id"])]
+
+    def __str__(self) -> str:
+        return f"{self.id} | {self.traitset} {'male' if self.male else 'female'}"
+
+    def to_animal_unsaved(self, herd: Herd, connectedclass: Class) -> Animal:
+        new = Animal(male=self.male, herd=herd, connectedclass=connectedclass)
+        new.genotype = self.genotype
+        new.net_merit = self.net_merit
+        new.phenotype = self.phenotype
+        new.ptas = self.ptas
+        new.recessives = self.recessives
+        new.pedigree = {
+            nms.SIRE_ID_KEY: None,
+            nms.DAM_ID_KEY: None,
+            nms.ID_KEY: None,
+        }
+
+        return new
+
+    @classmethod
+    def take(cls, traitsetname: str, male: bool, count: int) -> list["Founder"]:
+        """Remove up to count founders from the pool. Rows locked by another
+        transaction are skipped, so concurrent enrollments never share one."""
+
+        with transaction.atomic():
+            founders = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(traitset=traitsetname, male=male)
+                .order_by("id")[:count]
+            )
+            cls.objects.filter(id__in=[x.id for x in founders]).delete()
+
+        return founders
+
+    @classmethod
+    def get_counts(cls, traitsetname: str) -> dict[bool, int]:
+        counts = cls.objects.filter(traitset=traitsetname).aggregate(
+            males=models.Count("id", filter=models.Q(male=True)),
+            females=models.Count("id", filter=models.Q(male=False)),
+        )
+        return {True: counts["males"], False: counts["females"]}
+
+    @classmethod
+    def request_refill(cls, traitsetname: str):
+        """Queue a refill if either sex has dropped below the watermark"""
+
+        counts = cls.get_counts(traitsetname)
+        if min(counts.values()) >= settings.FOUNDER_POOL_WATERMARK:
+            return
+
+        if FounderPoolRefill.claim(traitsetname):
+            Founder.refill_founder_pool(traitsetname)
+
+    @staticmethod
+    @tasks.task
+    def refill_founder_pool(traitsetname: str):
+        """Top the pool up to FOUNDER_POOL_SIZE founders of each sex"""
+
+        traitset = Traitset(traitsetname)
+
+        with transaction.atomic():
+            # Refills of one traitset run one at a time, so each counts what
+            # is missing after the previous one has finished
+            FounderPoolRefill.lock(traitsetname)
+            counts = Founder.get_counts(traitsetname)
+
+            for male in (True, False):
+                missing = settings.FOUNDER_POOL_SIZE - counts[male]
+                for start in range(0, max(missing, 0), Founder.REFILL_BATCH_SIZE):
+                    size = min(Founder.REFILL_BATCH_SIZE, missing - start)
+                    animals = Animal.generate_random_unsaved_batch(
+                        [None] * size, [male] * size, traitset, None
+                    )
+                    Founder.objects.bulk_create(
+                        [
+                            Founder(
+                                traitset=traitsetname,
+                                male=male,
+                                net_merit=x.net_merit,
+                                genotype=x.genotype,
+                                phenotype=x.phenotype,
+                                ptas=x.ptas,
+                                recessives=x.recessives,
+                            )
+                            for x in animals
+                        ]
+                    )
+
+
+class FounderPoolRefill(models.Model):
+    """Whether a refill of a traitset's founder pool is queued. Kept in the
+    database so every web and worker process sees the same state."""
+
+    class Admin(ModelAdmin):
+        list_display = ["traitset", "queued", "requested"]
+
+    # A refill queued this long ago is assumed to be lost
+    STALE_AFTER = timedelta(minutes=10)
+
+    traitset = models.CharField(max_length=255, unique=True)
+    queued = models.BooleanField(default=False)
+    requested = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.traitset} | {'queued' if self.queued else 'idle'}"
+
+    @classmethod
+    def claim(cls, traitsetname: str) -> bool:
+        """Mark a refill as queued. False if one is queued already."""
+
+        if cls.objects.filter(
+            traitset=traitsetname,
+            queued=True,
+            requested__gte=now() - cls.STALE_AFTER,
+        ).exists():
+            return False
+
+        cls.objects.get_or_create(traitset=traitsetname)
+
+        # A single conditional update, so only one caller can win
+        return bool(
+            cls.objects.filter(traitset=traitsetname)
+            .filter(
+                models.Q(queued=False)
+                | models.Q(requested__lt=now() - cls.STALE_AFTER)
+            )
+            .update(queued=True, requested=now())
+        )
+
+    @classmethod
+    def lock(cls, traitsetname: str):
+        """Take the traitset's refill lock until the transaction ends. The
+        queued refill is now running, so later requests queue a new one."""
+
+        cls.objects.get_or_create(traitset=traitsetname)
+
+        # Writing the row locks it on every backend, and takes SQLite's write
+        # lock before the pool is counted
+        cls.objects.filter(traitset=traitsetname).update(queued=False)
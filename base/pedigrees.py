@@ -0,0 +1,127 @@
+from typing import Optional
+
+from . import names as nms
+
+
+def trim(pedigree: Optional[dict], generations: int) -> Optional[dict]:
+    """Copy of pedigree keeping only the given number of generations of
+    ancestors. Stored pedigrees are trimmed so they stay a fixed size instead
+    of doubling with every breeding."""
+
+    if pedigree is None:
+        return None
+
+    if generations <= 0:
+        return {
+            nms.SIRE_ID_KEY: None,
+            nms.DAM_ID_KEY: None,
+            nms.ID_KEY: pedigree[nms.ID_KEY],
+        }
+
+    return {
+        nms.SIRE_ID_KEY: trim(pedigree.get(nms.SIRE_ID_KEY), generations - 1),
+        nms.DAM_ID_KEY: trim(pedigree.get(nms.DAM_ID_KEY), generations - 1),
+        nms.ID_KEY: pedigree[nms.ID_KEY],
+    }
+
+
+class Kinship:
+    """Coefficients of kinship between animals, memoized by id so ancestors
+    shared by many calves are only worked out once. A calf's inbreeding
+    coefficient is the kinship of its parents.
+
+    Ids must grow from parents to offspring, as database ids do. Ancestors
+    are all loaded with add_animal or add_pedigree before any coefficient is
+    asked for. Only ancestors that were loaded are counted, so stored
+    pedigrees, which are trimmed, give a lower bound."""
+
+    parents: dict[int, tuple[Optional[int], Optional[int]]]
+    cache: dict[tuple[int, int], float]
+
+    def __init__(self):
+        self.parents = {}
+        self.cache = {}
+
+    def add_pedigree(self, pedigree: Optional[dict]):
+        stack = [pedigree]
+        while stack:
+            node = stack.pop()
+            if node is None or node[nms.ID_KEY] is None:
+                continue
+
+            sire = node.get(nms.SIRE_ID_KEY)
+            dam = node.get(nms.DAM_ID_KEY)
+            parents = (
+                sire[nms.ID_KEY] if sire else None,
+                dam[nms.ID_KEY] if dam else None,
+            )
+
+            # A trimmed copy of the same animal may not show its parents
+            if parents != (None, None) or node[nms.ID_KEY] not in self.parents:
+                self.parents[node[nms.ID_KEY]] = parents
+
+            stack.append(sire)
+            stack.append(dam)
+
+    def add_animal(self, id: int, sire: Optional[int], dam: Optional[int]):
+        """Record the parents of a new animal, which must be younger than
+        every animal already known"""
+
+        self.parents[id] = (sire, dam)
+
+    def renumber(self, ids: dict[int, int]):
+        """Replace temporary ids, e.g. of simulated animals once they are
+        saved. The new ids must keep the same order."""
+
+        def rename(id: Optional[int]) -> Optional[int]:
+            return ids.get(id, id)
+
+        self.parents = {
+            rename(id): (rename(sire), rename(dam))
+            for id, (sire, dam) in self.parents.items()
+        }
+        self.cache = {
+            (rename(a), rename(b)): value for (a, b), value in self.cache.items()
+        }
+
+    def get_pedigree(self, id: Optional[int], generations: int) -> Optional[dict]:
+        """Nested pedigree of id going back the given number of generations"""
+
+        if id is None:
+            return None
+
+        sire, dam = self.parents.get(id, (None, None))
+        if generations <= 0:
+            sire = dam = None
+
+        return {
+            nms.SIRE_ID_KEY: self.get_pedigree(sire, generations - 1),
+            nms.DAM_ID_KEY: self.get_pedigree(dam, generations - 1),
+            nms.ID_KEY: id,
+        }
+
+    def coefficient(self, a: Optional[int], b: Optional[int]) -> float:
+        if a is None or b is None:
+            return 0
+
+        # Only the younger animal can be a descendant of the other, so it is
+        # the one replaced by its parents
+        if a < b:
+            a, b = b, a
+
+        key = (a, b)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        sire, dam = self.parents.get(a, (None, None))
+        if a == b:
+            value = (1 + self.coefficient(sire, dam)) / 2
+        else:
+            value = (self.coefficient(sire, b) + self.coefficient(dam, b)) / 2
+
+        self.cache[key] = value
+        return value
+
+    def inbreeding(self, sire: Optional[int], dam: Optional[int]) -> float:
+        return self.coefficient(sire, dam)
@@ -0,0 +1,453 @@
+from typing import IO, Any, Callable, Iterable, Optional
+
+import numpy as np
+
+from . import names as nms
+from .pedigrees import Kinship
+from .traitsets import Traitset
+
+
+class Animals:
+    """Columns of values for a group of animals, one row per animal. Trait
+    columns follow traitset.traits and recessives holds the two allele masks
+    of Traitset.get_random_recessive_alleles. Missing phenotypes are nan."""
+
+    COLUMNS = [
+        "ids",
+        "male",
+        "generation",
+        "net_merit",
+        "inbreeding",
+        "genotype",
+        "phenotype",
+        "ptas",
+        "recessives",
+        "sires",
+        "dams",
+    ]
+
+    ids: np.ndarray
+    male: np.ndarray
+    generation: np.ndarray
+    net_merit: np.ndarray
+    inbreeding: np.ndarray
+    genotype: np.ndarray
+    phenotype: np.ndarray
+    ptas: np.ndarray
+    recessives: np.ndarray
+    sires: np.ndarray
+    dams: np.ndarray
+
+    def __init__(self, **columns: np.ndarray):
+        for name in self.COLUMNS:
+            setattr(self, name, np.asarray(columns[name]))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def take(self, rows: np.ndarray) -> "Animals":
+        return Animals(**{x: getattr(self, x)[rows] for x in self.COLUMNS})
+
+    @classmethod
+    def concatenate(cls, groups: list["Animals"]) -> "Animals":
+        return cls(
+            **{
+                x: np.concatenate([getattr(group, x) for group in groups])
+                for x in cls.COLUMNS
+            }
+        )
+
+    @classmethod
+    def from_animals(cls, traitset: Traitset, animals: Iterable[Any]) -> "Animals":
+        """Columns for saved animals. Parents are not tracked for them, their
+        ancestry should be added to the simulation's kinship instead."""
+
+        animals = list(animals)
+        traits = [x.uid for x in traitset.traits]
+
+        def matrix(values: list[dict[str, Optional[float]]]) -> np.ndarray:
+            rows = [
+                [np.nan if x[uid] is None else x[uid] for uid in traits] for x in values
+            ]
+            return np.array(rows, dtype=float).reshape(len(values), len(traits))
+
+        return cls(
+            ids=np.array([x.id for x in animals], dtype=np.int64),
+            male=np.array([x.male for x in animals], dtype=bool),
+            generation=np.array([x.generation for x in animals], dtype=np.int64),
+            net_merit=np.array([x.net_merit for x in animals], dtype=float),
+            inbreeding=np.array([x.inbreeding for x in animals], dtype=float),
+            genotype=matrix([x.genotype for x in animals]),
+            phenotype=matrix([x.phenotype for x in animals]),
+            ptas=matrix([x.ptas for x in animals]),
+            recessives=traitset.to_recessive_alleles([x.recessives for x in animals]),
+            sires=np.full(len(animals), -1, dtype=np.int64),
+            dams=np.full(len(animals), -1, dtype=np.int64),
+        )
+
+    def to_dicts(self, traitset: Traitset, row: int) -> dict[str, Any]:
+        """Values of one row in the form they are stored on Animal"""
+
+        traits = [x.uid for x in traitset.traits]
+
+        return {
+            nms.GENOTYPE_KEY: dict(zip(traits, self.genotype[row].tolist())),
+            nms.PHENOTYPE_KEY: {
+                uid: None if np.isnan(val) else val
+                for uid, val in zip(traits, self.phenotype[row].tolist())
+            },
+            nms.PTA_KEY: dict(zip(traits, self.ptas[row].tolist())),
+            nms.RECESSIVES_KEY: traitset.to_recessive_dicts(
+                self.recessives[row : row + 1]
+            )[0],
+        }
+
+
+class Generation:
+    """Result of one simulated breeding. As in Herd.BreedingResults, an animal
+    with a fatal recessive that is also too old counts towards both deaths.
+    at_risk_matings counts the matings where both parents carry one fatal
+    recessive."""
+
+    breedings: int
+    calves: Animals
+    dead: Animals
+    recessive_deaths: int
+    age_deaths: int
+    at_risk_matings: int
+
+    def __init__(
+        self,
+        breedings: int,
+        calves: Animals,
+        dead: Animals,
+        recessive_deaths: int,
+        age_deaths: int,
+        at_risk_matings: int,
+    ):
+        self.breedings = breedings
+        self.calves = calves
+        self.dead = dead
+        self.recessive_deaths = recessive_deaths
+        self.age_deaths = age_deaths
+        self.at_risk_matings = at_risk_matings
+
+    def json_dict(self) -> dict[str, Any]:
+        return {
+            "breedings": self.breedings,
+            "calves": len(self.calves),
+            "recessive_deaths": self.recessive_deaths,
+            "age_deaths": self.age_deaths,
+            "at_risk_matings": self.at_risk_matings,
+            nms.NETMERIT_KEY: (
+                float(self.calves.net_merit.mean()) if len(self.calves) else None
+            ),
+            "inbreeding": (
+                float(self.calves.inbreeding.mean()) if len(self.calves) else None
+            ),
+        }
+
+
+SireSelector = Callable[[Animals, int], np.ndarray]
+
+
+def get_sire_selector(traitset: Traitset, strategy: str) -> SireSelector:
+    """Rows of the sires to breed from the living males. strategy is
+    "net_merit" for the top NM$ males, "pta:<trait>" for the top PTA of one
+    trait or "random"."""
+
+    if strategy == "random":
+        return lambda males, count: np.random.permutation(len(males))[:count]
+
+    if strategy == "net_merit":
+        return lambda males, count: np.argsort(-males.net_merit, kind="stable")[
+            :count
+        ]
+
+    traits = [x.uid for x in traitset.traits]
+    uid = strategy.removeprefix("pta:")
+    if strategy.startswith("pta:") and uid in traits:
+        column = traits.index(uid)
+        return lambda males, count: np.argsort(
+            -males.ptas[:, column], kind="stable"
+        )[:count]
+
+    raise ValueError(f"Unknown selection strategy {strategy!r}")
+
+
+def get_total_to_be_born(
+    target_num_males: int, target_num_females: int, num_mothers: int
+) -> tuple[int, int, int]:
+    """Calculate the number if male and females to be born to herd.
+    Based on target number and number of possible mothers"""
+
+    def total_to_be_born():
+        return target_num_males + target_num_females
+
+    while total_to_be_born() > num_mothers:
+        if target_num_males > 0:
+            target_num_males -= 1
+        if target_num_females > 0:
+            target_num_females -= 1
+
+    return target_num_males, target_num_females, total_to_be_born()
+
+
+class HerdSimulation:
+    """Consecutive breedings of one herd, run entirely in memory with the
+    same rules as Herd.breed_herd. New animals get ids counting up from
+    next_id so kinship can tell them apart from saved animals."""
+
+    traitset: Traitset
+    animals: Animals
+    kinship: Kinship
+    breedings: int
+    herd_males: int
+    herd_females: int
+    max_age: int
+    next_id: int
+
+    def __init__(
+        self,
+        traitset: Traitset,
+        animals: Animals,
+        kinship: Kinship,
+        breedings: int,
+        herd_males: int,
+        herd_females: int,
+        max_age: int,
+        next_id: Optional[int] = None,
+    ):
+        self.traitset = traitset
+        self.animals = animals
+        self.kinship = kinship
+        self.breedings = breedings
+        self.herd_males = herd_males
+        self.herd_females = herd_females
+        self.max_age = max_age
+
+        if next_id is None:
+            known = [*kinship.parents, *animals.ids.tolist(), 0]
+            next_id = max(known) + 1
+        self.next_id = next_id
+
+    def breed(self, sire_rows: np.ndarray) -> Generation:
+        """Breed the herd once. sire_rows index self.animals."""
+
+        traitset = self.traitset
+        animals = self.animals
+
+        mothers = np.random.permutation(np.flatnonzero(~animals.male))
+        num_males, _num_females, total = get_total_to_be_born(
+            self.herd_males, self.herd_females, len(mothers)
+        )
+        self.breedings += 1
+
+        sires = np.asarray(sire_rows)[np.arange(total) % len(sire_rows)]
+        dams = mothers[:total]
+        male = np.arange(total) < num_males
+
+        genotype = traitset.get_genotype_from_breeding_batch(
+            animals.genotype[sires], animals.genotype[dams]
+        )
+
+        ids = np.arange(self.next_id, self.next_id + total, dtype=np.int64)
+        self.next_id += total
+        sire_ids = animals.ids[sires]
+        dam_ids = animals.ids[dams]
+        inbreeding = np.array(
+            [
+                self.kinship.inbreeding(sire, dam)
+                for sire, dam in zip(sire_ids.tolist(), dam_ids.tolist())
+            ],
+            dtype=float,
+        )
+        for id, sire, dam in zip(ids.tolist(), sire_ids.tolist(), dam_ids.tolist()):
+            self.kinship.add_animal(id, sire, dam)
+
+        # Males take their dam's phenotype, as in breed_herd
+        phenotype = animals.phenotype[dams].copy()
+        phenotype[~male] = traitset.derive_phenotype_batch(
+            genotype[~male], inbreeding[~male]
+        )
+
+        calves = Animals(
+            ids=ids,
+            male=male,
+            generation=np.full(total, self.breedings, dtype=np.int64),
+            net_merit=traitset.derive_net_merit_batch(genotype),
+            inbreeding=inbreeding,
+            genotype=genotype,
+            phenotype=phenotype,
+            ptas=traitset.derive_ptas_batch(genotype, np.zeros(total), np.zeros(total)),
+            recessives=traitset.get_recessive_alleles_from_breeding(
+                animals.recessives[sires], animals.recessives[dams]
+            ),
+            sires=sire_ids,
+            dams=dam_ids,
+        )
+
+        herd = Animals.concatenate([animals, calves])
+        recessive_dead = traitset.has_fatal_recessive(herd.recessives)
+        age_dead = self.breedings - herd.generation >= self.max_age
+
+        dead = recessive_dead | age_dead
+        self.animals = herd.take(~dead)
+        return Generation(
+            self.breedings,
+            calves,
+            herd.take(dead),
+            int(recessive_dead.sum()),
+            int(age_dead.sum()),
+            int(
+                np.count_nonzero(
+                    traitset.count_at_risk_matings(
+                        animals.recessives[sires], animals.recessives[dams]
+                    )
+                )
+            ),
+        )
+
+    def run(
+        self, generations: int, select_sires: SireSelector, sires: int
+    ) -> list[Generation]:
+        results = []
+        for _ in range(generations):
+            males = np.flatnonzero(self.animals.male)
+            if len(males) == 0:
+                break
+
+            chosen = males[select_sires(self.animals.take(males), sires)]
+            results.append(self.breed(chosen))
+
+        return results
+
+
+class HerdSnapshot:
+    """Everything needed to simulate breeding a herd without the database:
+    its living animals, their known ancestry and the class's breeding
+    settings. Saved to and loaded from .npz files so it can be exported from
+    the server and simulated elsewhere."""
+
+    traitset: str
+    animals: Animals
+    parents: np.ndarray
+    breedings: int
+    herd_males: int
+    herd_females: int
+    max_age: int
+
+    SETTINGS = ["breedings", "herd_males", "herd_females", "max_age"]
+
+    def __init__(
+        self,
+        traitset: str,
+        animals: Animals,
+        parents: np.ndarray,
+        breedings: int,
+        herd_males: int,
+        herd_females: int,
+        max_age: int,
+    ):
+        self.traitset = traitset
+        self.animals = animals
+        self.parents = parents
+        self.breedings = breedings
+        self.herd_males = herd_males
+        self.herd_females = herd_females
+        self.max_age = max_age
+
+    @classmethod
+    def from_animals(
+        cls,
+        traitset: Traitset,
+        animals: list[Any],
+        kinship: Kinship,
+        breedings: int,
+        herd_males: int,
+        herd_females: int,
+        max_age: int,
+    ) -> "HerdSnapshot":
+        """Snapshot of saved animals, with the ancestry known to kinship"""
+
+        # Rows of id, sire and dam with -1 for unknown parents
+        parents = np.array(
+            [
+                [id, -1 if sire is None else sire, -1 if dam is None else dam]
+                for id, (sire, dam) in kinship.parents.items()
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 3)
+
+        return cls(
+            traitset.name,
+            Animals.from_animals(traitset, animals),
+            parents,
+            breedings,
+            herd_males,
+            herd_females,
+            max_age,
+        )
+
+    def get_kinship(self) -> Kinship:
+        kinship = Kinship()
+        for id, sire, dam in self.parents.tolist():
+            kinship.parents[id] = (
+                None if sire < 0 else sire,
+                None if dam < 0 else dam,
+            )
+
+        return kinship
+
+    def get_simulation(self, traitset: Optional[Traitset] = None) -> HerdSimulation:
+        return HerdSimulation(
+            traitset or Traitset(self.traitset),
+            self.animals,
+            self.get_kinship(),
+            self.breedings,
+            self.herd_males,
+            self.herd_females,
+            self.max_age,
+        )
+
+    def save(self, file: str | IO[bytes]):
+        np.savez_compressed(
+            file,
+            traitset=np.array(self.traitset),
+            parents=self.parents,
+            **{x: np.array(getattr(self, x)) for x in self.SETTINGS},
+            **{f"animals_{x}": getattr(self.animals, x) for x in Animals.COLUMNS},
+        )
+
+    @classmethod
+    def load(cls, file: str | IO[bytes]) -> "HerdSnapshot":
+        with np.load(file) as data:
+            return cls(
+                str(data["traitset"]),
+                Animals(**{x: data[f"animals_{x}"] for x in Animals.COLUMNS}),
+                data["parents"],
+                **{x: int(data[x]) for x in cls.SETTINGS},
+            )
+
+
+def get_trend_delta(
+    traitset: Traitset, new_animals: Animals, old_animals: Animals
+) -> dict[str, Any]:
+    """Sums of values joining and leaving the population, as stored on
+    TrendDelta"""
+
+    traits = [x.uid for x in traitset.traits]
+
+    def change(column: str) -> dict[str, float]:
+        sums = np.nansum(getattr(new_animals, column), axis=0) - np.nansum(
+            getattr(old_animals, column), axis=0
+        )
+        return dict(zip(traits, sums.tolist()))
+
+    return {
+        "population": len(new_animals) - len(old_animals),
+        "net_merit": float(new_animals.net_merit.sum() - old_animals.net_merit.sum()),
+        "genotype": change("genotype"),
+        "phenotype": change("phenotype"),
+        "ptas": change("ptas"),
+    }
@@ -44,6 +44,44 @@ function confirmEnrollment(classId, enrollmentRequestId) {
     });
 }
 
+function confirmEnrollments(classId, all) {
+    let selected = $(".enrollment-request-select:checked").map((_, e) => Number(e.value)).get();
+    if (!all && selected.length == 0) {
+        sendMessage("Select enrollment requests to confirm.", null, true);
+        return;
+    }
+
+    $.ajax({
+        dataType: "json",
+        url: `/class/${classId}/enrollments/requests/confirm`,
+        data: { ...getCSRFData(), requests: JSON.stringify(selected), all: all },
+        method: "POST",
+        success: (data) => {
+            $("#id_enrollment_tokens").val($("#id_enrollment_tokens").val() - data["enrollments"].length);
+            data["enrollments"].forEach((e, i) => {
+                $(`#enrollment-request-${data["requests"][i]}`).replaceWith(
+                    buildEnrollmentCard(
+                        e["student"]["name"],
+                        e["student"]["email"],
+                        e["id"],
+                        e["connectedclass"],
+                        e["herd"]
+                    )
+                );
+            });
+
+            if (data["out of tokens"]) {
+                sendMessage("Out of enrollment tokens. Some enrollments were not confirmed.", null, true);
+            }
+
+            filterAll();
+        }
+    }).fail((err) => {
+        sendMessage("Error: Could not confirm enrollments.", null, true);
+        console.log(err);
+    });
+}
+
 function denyEnrollment(classId, enrollmentRequestId) {
     if (!confirm("Are you sure you want to deny this enrollment?")) return;
 
@@ -104,8 +142,14 @@ function buildEnrollmentRequestCard(studentName, studentEmail, enrollmentRequest
         id: `enrollment-request-${enrollmentRequestId}`,
         class: ["grid-auto-row", "gap"].join(" ")
     });
-    let p = $("<p></p>");
-    p.text(`${studentName} (${studentEmail})`);
+    let label = $("<label></label>");
+    let checkbox = $("<input>", {
+        type: "checkbox",
+        class: "enrollment-request-select",
+        value: enrollmentRequestId,
+    });
+    label.append(checkbox);
+    label.append(document.createTextNode(` ${studentName} (${studentEmail})`));
 
     let button1 = $("<button></button>", { class: ["as-btn", "pad", "background-green", "border-radius"].join(" ") });
     button1.click(() => { confirmEnrollment(classId, enrollmentRequestId); });
@@ -116,7 +160,7 @@ function buildEnrollmentRequestCard(studentName, studentEmail, enrollmentRequest
     button2.text("Deny");
 
 
-    div.append(p);
+    div.append(label);
     div.append(button1);
     div.append(button2);
     return div;
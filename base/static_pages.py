@@ -0,0 +1,151 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable
+
+from django.contrib import messages
+from django.http import Http404, HttpRequest
+from django.utils.html import SafeString
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .traitsets import DOCUMENTED_FUNCS, Traitset
+from .traitsets import REGISTERED as registered_traitsets
+from .traitsets import traitset as traitset_module
+from .traitsets.traitset import TRAITSET_PATH
+
+TRAITSET_SOURCE = Path(traitset_module.__file__)
+
+
+def get_mtime(*paths: Path) -> float:
+    return max(path.stat().st_mtime for path in paths)
+
+
+def get_traitset_mtime(traitsetname: str) -> float:
+    """Last change to a traitset file or the code used to display it. Raises
+    FileNotFoundError for an unknown traitset."""
+
+    return get_mtime(TRAITSET_PATH / f"{traitsetname}.json", TRAITSET_SOURCE)
+
+
+def get_traitsets_mtime() -> float:
+    return get_mtime(
+        TRAITSET_SOURCE,
+        *(TRAITSET_PATH / f"{x.name}.json" for x in registered_traitsets),
+    )
+
+
+def get_equations_mtime() -> float:
+    return get_mtime(TRAITSET_SOURCE)
+
+
+def format_code(text: str) -> SafeString:
+    html = ""
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if "#" in stripped:
+            html += stripped.replace("#", "<span>#", 1) + "</span>"
+        else:
+            html += stripped
+
+        html += "<br>"
+
+    return SafeString(html)
+
+
+@lru_cache(maxsize=4)
+def get_equations(mtime: float) -> dict[str, list[tuple[SafeString, SafeString]]]:
+    """Equation signatures and documentation as html. mtime is part of the
+    cache key so the cache is refreshed when the source changes."""
+
+    return {
+        header: [(format_code(func._sig), format_code(func.__doc__)) for func in funcs]
+        for header, funcs in DOCUMENTED_FUNCS.items()
+    }
+
+
+class TraitsetOverview:
+    """Prerendered tables for the traitset overview page"""
+
+    name: str
+    desc: str | None
+    trait_table: SafeString
+    genotype_correlation_table: SafeString
+    phenotype_correlation_table: SafeString
+    recessive_table: SafeString
+    animal_table: SafeString
+    animal_trait_table: SafeString
+    animal_recessive_table: SafeString
+
+    def __init__(self, traitset: Traitset):
+        self.name = traitset.name
+        self.desc = traitset.desc
+        self.trait_table = traitset.get_html_trait_table()
+        self.genotype_correlation_table = (
+            traitset.get_html_genotype_correlation_table()
+        )
+        self.phenotype_correlation_table = (
+            traitset.get_html_phenotype_correlation_table()
+        )
+        self.recessive_table = traitset.get_html_recessive_table()
+        self.animal_table = traitset.get_html_animal_table()
+        self.animal_trait_table = traitset.get_html_animal_trait_table()
+        self.animal_recessive_table = traitset.get_html_animal_recessive_table()
+
+
+@lru_cache(maxsize=32)
+def get_traitset_overview(traitsetname: str, mtime: float) -> TraitsetOverview:
+    return TraitsetOverview(Traitset(traitsetname))
+
+
+@lru_cache(maxsize=4)
+def get_traitset_listing(
+    mtime: float,
+) -> tuple[list[TraitsetOverview], list[TraitsetOverview]]:
+    """Enabled and deprecated traitsets"""
+
+    enabled = [
+        get_traitset_overview(x.name, get_traitset_mtime(x.name))
+        for x in registered_traitsets
+        if x.enabled
+    ]
+    deprecated = [
+        get_traitset_overview(x.name, get_traitset_mtime(x.name))
+        for x in registered_traitsets
+        if not x.enabled
+    ]
+
+    return enabled, deprecated
+
+
+def static_page(get_page_mtime: Callable[..., float]):
+    """Serve a page that only changes when its source files change with an
+    ETag and Last-Modified so browsers can revalidate instead of
+    downloading it again.
+
+    The page header shows the logged in user and any pending messages, so
+    the ETag is per user, the response is private and no validators are sent
+    while messages are pending."""
+
+    def get_mtime_or_404(request: HttpRequest, *args, **kwargs) -> float | None:
+        if len(messages.get_messages(request)):
+            return None
+
+        try:
+            return get_page_mtime(*args, **kwargs)
+        except FileNotFoundError as e:
+            raise Http404(e)
+
+    def etag(request: HttpRequest, *args, **kwargs) -> str | None:
+        mtime = get_mtime_or_404(request, *args, **kwargs)
+        return None if mtime is None else f'"{mtime}-{request.user.pk}"'
+
+    def last_modified(request: HttpRequest, *args, **kwargs) -> datetime | None:
+        mtime = get_mtime_or_404(request, *args, **kwargs)
+        return None if mtime is None else datetime.fromtimestamp(mtime, timezone.utc)
+
+    def decorator(view: Callable) -> Callable:
+        view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+        return cache_control(private=True, no_cache=True)(view)
+
+    return decorator
@@ -0,0 +1,164 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import timedelta
+from importlib import import_module
+from multiprocessing import get_context
+from threading import Lock, Timer
+from typing import Any, Callable, Optional
+
+import background_task
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+
+DATABASE_BACKEND = "database"
+DJANGO_Q_BACKEND = "django-q"
+PROCESS_POOL_BACKEND = "process-pool"
+IMMEDIATE_BACKEND = "immediate"
+
+REGISTERED: dict[str, "Task"] = {}
+
+
+class Task:
+    """A background task that can be queued on any of the task backends."""
+
+    name: str
+    func: Callable
+
+    def __init__(self, name: str, func: Callable):
+        self.name = name
+        self.func = func
+
+        # Always registered with the database queue so that tasks queued
+        # before a backend change can still be run by its worker.
+        self.database_task = background_task.background(name=name, schedule=0)(
+            func
+        )
+
+    def __call__(self, *args, schedule: int = 0, **kwargs) -> Any:
+        """Queue the task on the configured backend. schedule is a delay in
+        seconds."""
+
+        return get_backend().dispatch(self, args, kwargs, schedule)
+
+    def now(self, *args, **kwargs) -> Any:
+        """Run the task in the current process"""
+
+        return self.func(*args, **kwargs)
+
+
+def task(func: Callable) -> Task:
+    """Register a function as a background task"""
+
+    name = f"{func.__module__}.{func.__name__}"
+    new = Task(name, func)
+    REGISTERED[name] = new
+
+    return new
+
+
+def run_task(name: str, args: tuple, kwargs: dict) -> Any:
+    """Run a registered task by name. Entry point for worker processes."""
+
+    if name not in REGISTERED:
+        import_module(name.rsplit(".", 1)[0])
+
+    return REGISTERED[name].func(*args, **kwargs)
+
+
+class DatabaseBackend:
+    """Queue tasks in the database for the background_task worker
+    (manage.py process_tasks)."""
+
+    def dispatch(self, task: Task, args: tuple, kwargs: dict, schedule: int):
+        return task.database_task(*args, schedule=schedule, **kwargs)
+
+
+class DjangoQBackend:
+    """Queue tasks on the django-q cluster (manage.py qcluster), normally
+    brokered through Redis."""
+
+    def dispatch(self, task: Task, args: tuple, kwargs: dict, schedule: int):
+        transaction.on_commit(lambda: self.submit(task, args, kwargs, schedule))
+
+    def submit(self, task: Task, args: tuple, kwargs: dict, schedule: int):
+        from django_q.models import Schedule
+        from django_q.tasks import async_task
+        from django_q.tasks import schedule as q_schedule
+
+        if schedule:
+            return q_schedule(
+                "base.tasks.run_task",
+                task.name,
+                args,
+                kwargs,
+                schedule_type=Schedule.ONCE,
+                next_run=now() + timedelta(seconds=schedule),
+            )
+
+        return async_task("base.tasks.run_task", task.name, args, kwargs)
+
+
+def _init_worker():
+    import django
+
+    django.setup()
+
+
+class ProcessPoolBackend:
+    """Run tasks in a pool of local worker processes. Intended for local
+    development where CPU heavy tasks should use every core without running
+    a separate worker."""
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _lock = Lock()
+
+    @classmethod
+    def get_executor(cls) -> ProcessPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=settings.TASK_PROCESSES,
+                    mp_context=get_context("spawn"),
+                    initializer=_init_worker,
+                )
+
+        return cls._executor
+
+    def dispatch(self, task: Task, args: tuple, kwargs: dict, schedule: int):
+        # Workers have their own connections, so wait until they can see the
+        # data written by this transaction.
+        transaction.on_commit(lambda: self.submit(task, args, kwargs, schedule))
+
+    def submit(
+        self, task: Task, args: tuple, kwargs: dict, schedule: int = 0
+    ) -> Optional[Future]:
+        if schedule:
+            timer = Timer(schedule, self.submit, (task, args, kwargs))
+            timer.daemon = True
+            timer.start()
+            return None
+
+        return self.get_executor().submit(run_task, task.name, args, kwargs)
+
+
+class ImmediateBackend:
+    """Run tasks inline as soon as they are queued. Used for tests."""
+
+    def dispatch(self, task: Task, args: tuple, kwargs: dict, schedule: int):
+        return task.now(*args, **kwargs)
+
+
+BACKENDS = {
+    DATABASE_BACKEND: DatabaseBackend,
+    DJANGO_Q_BACKEND: DjangoQBackend,
+    PROCESS_POOL_BACKEND: ProcessPoolBackend,
+    IMMEDIATE_BACKEND: ImmediateBackend,
+}
+
+
+def get_backend() -> (
+    DatabaseBackend | DjangoQBackend | ProcessPoolBackend | ImmediateBackend
+):
+    """Get the backend selected by settings.TASK_BACKEND"""
+
+    return BACKENDS[getattr(settings, "TASK_BACKEND", DATABASE_BACKEND)]()
@@ -1,3 +1,5 @@
+import re
+from functools import lru_cache
 from json import dumps
 from django import template
 from django.utils.safestring import SafeString
@@ -15,55 +17,64 @@ register = template.Library()
 
 
 class ContextCast:
-    traitset: Traitset
+    traitset_name: str
     animal: str
-    animalfilter: TraitsetAnimalFilter
 
     def __init__(self, context: dict[str, Any] | None):
         if context is None:
             return
 
         if enrollment := context.get("enrollment", None):
-            self.traitset = Traitset(enrollment.connectedclass.traitset)
+            self.traitset_name = enrollment.connectedclass.traitset
             self.animal = enrollment.animal
 
         elif connectedclass := context.get("connectedclass", None):
-            self.traitset = Traitset(connectedclass.traitset)
+            self.traitset_name = connectedclass.traitset
             self.animal = connectedclass.default_animal
 
         elif connectedclass := context.get("class", None):
-            self.traitset = Traitset(connectedclass.traitset)
+            self.traitset_name = connectedclass.traitset
             self.animal = connectedclass.default_animal
 
-        self.animalfilter = self.traitset.animals[self.animal]
-
     @classmethod
     def from_class(cls, connectedclass: "Class") -> "ContextCast":
         new = cls(None)
 
-        new.traitset = Traitset(connectedclass.traitset)
+        new.traitset_name = connectedclass.traitset
         new.animal = connectedclass.default_animal
-        new.animalfilter = new.traitset.animals[new.animal]
         return new
 
 
 def get_filter_dict(
     contextcast: ContextCast,
 ) -> dict[str, dict[str, str] | dict[str, Any] | str]:
+    return build_filter_dict(contextcast.traitset_name, contextcast.animal)
+
+
+@lru_cache
+def build_filter_dict(
+    traitset_name: str, animal: str
+) -> dict[str, dict[str, str] | dict[str, Any] | str]:
+    """Build the filter dictionary for a traitset and animal. The result is
+    cached and shared, so it must not be modified."""
+
+    traitset = Traitset(traitset_name)
+    animalfilter: TraitsetAnimalFilter = traitset.animals[animal]
+
     filter_dict = {
-        "herds": contextcast.animalfilter.herds,
-        "herd": contextcast.animalfilter.herd,
-        "male": contextcast.animalfilter.male,
-        "males": contextcast.animalfilter.males,
-        "female": contextcast.animalfilter.female,
-        "females": contextcast.animalfilter.females,
-        "sire": contextcast.animalfilter.sire,
-        "sires": contextcast.animalfilter.sires,
-        "dam": contextcast.animalfilter.dam,
-        "dams": contextcast.animalfilter.dams,
-        "phenotype_prefix": contextcast.animalfilter.phenotype_prefix,
-        "genotype_prefix": contextcast.animalfilter.genotype_prefix,
-        "pta_prefix": contextcast.animalfilter.pta_prefix,
+        "herds": animalfilter.herds,
+        "herd": animalfilter.herd,
+        "male": animalfilter.male,
+        "males": animalfilter.males,
+        "female": animalfilter.female,
+        "females": animalfilter.females,
+        "sire": animalfilter.sire,
+        "sires": animalfilter.sires,
+        "dam": animalfilter.dam,
+        "dams": animalfilter.dams,
+        "phenotype_prefix": animalfilter.phenotype_prefix,
+        "genotype_prefix": animalfilter.genotype_prefix,
+        "pta_prefix": animalfilter.pta_prefix,
     }
 
     cap_filter_dict = {}
@@ -76,51 +87,96 @@ def get_filter_dict(
         filter_dict
         | {
             x.uid: {
-                "name": x.animals[contextcast.animal].name,
-                "standard_deviation": x.animals[contextcast.animal].standard_deviation,
-                "phenotype_average": x.animals[contextcast.animal].phenotype_average,
-                "unit": x.animals[contextcast.animal].unit,
+                "name": x.animals[animal].name,
+                "standard_deviation": x.animals[animal].standard_deviation,
+                "phenotype_average": x.animals[animal].phenotype_average,
+                "unit": x.animals[animal].unit,
             }
-            for x in contextcast.traitset.traits
+            for x in traitset.traits
         }
         | {
             x.uid: {
-                "name": x.animals[contextcast.animal].name,
+                "name": x.animals[animal].name,
             }
-            for x in contextcast.traitset.recessives
+            for x in traitset.recessives
         }
         | cap_filter_dict
     )
 
 
+@lru_cache
+def get_filter_substitution(
+    traitset_name: str, animal: str
+) -> tuple[re.Pattern, dict[str, str]]:
+    """Get a pattern matching every <key> token and the text each key is
+    replaced with"""
+
+    replacements = {
+        key: val["name"] if type(val) is dict else val
+        for key, val in build_filter_dict(traitset_name, animal).items()
+    }
+    pattern = re.compile(
+        "<(" + "|".join(re.escape(key) for key in replacements) + ")>"
+    )
+
+    return pattern, replacements
+
+
+@lru_cache
+def get_filter_script(traitset_name: str, animal: str) -> SafeString:
+    filter_dict = build_filter_dict(traitset_name, animal)
+    return SafeString(f"<script>var Filter = {dumps(filter_dict)}</script>")
+
+
+def filter_text(text: str, contextcast: ContextCast) -> str:
+    pattern, replacements = get_filter_substitution(
+        contextcast.traitset_name, contextcast.animal
+    )
+
+    return pattern.sub(lambda match: replacements[match[1]], text)
+
+
 @register.simple_tag(takes_context=True)
 def load_filter_dict(context: dict[str, Any]) -> SafeString:
     contextcast = ContextCast(context)
-    safe_text = f"<script>var Filter = {dumps(get_filter_dict(contextcast))}</script>"
-
-    return SafeString(safe_text)
+    return get_filter_script(contextcast.traitset_name, contextcast.animal)
 
 
 @register.simple_tag(takes_context=True)
 def auto_filter_text(context: dict[str, Any], text: str) -> str:
-    contextcast = ContextCast(context)
+    return filter_text(text, ContextCast(context))
 
-    for key, val in get_filter_dict(contextcast).items():
-        if type(val) is dict:
-            text = text.replace(f"<{key}>", val["name"])
-        else:
-            text = text.replace(f"<{key}>", val)
 
-    return text
+def filter_text_to_default(text: str, connectedclass: "Class"):
+    return filter_text(text, ContextCast.from_class(connectedclass))
 
 
-def filter_text_to_default(text: str, connectedclass: "Class"):
-    contextcast = ContextCast.from_class(connectedclass)
+class ExportLabels:
+    """Column labels shared by every class export"""
+
+    traits: tuple[str, ...]
+    genotypes: tuple[str, ...]
+    phenotypes: tuple[str, ...]
+    ptas: tuple[str, ...]
+    recessives: tuple[str, ...]
+
+    def __init__(self, traitset_name: str, animal: str):
+        traitset = Traitset(traitset_name)
+        pattern, replacements = get_filter_substitution(traitset_name, animal)
+
+        def label(text: str) -> str:
+            return pattern.sub(lambda match: replacements[match[1]], text)
+
+        self.traits = tuple(label(f"<{x.uid}>") for x in traitset.traits)
+        self.genotypes = tuple(label(f"gen: <{x.uid}>") for x in traitset.traits)
+        self.phenotypes = tuple(label(f"ph: <{x.uid}>") for x in traitset.traits)
+        self.ptas = tuple(label(f"pta: <{x.uid}>") for x in traitset.traits)
+        self.recessives = tuple(label(f"<{x.uid}>") for x in traitset.recessives)
+
 
-    for key, val in get_filter_dict(contextcast).items():
-        if type(val) is dict:
-            text = text.replace(f"<{key}>", val["name"])
-        else:
-            text = text.replace(f"<{key}>", val)
+@lru_cache
+def get_export_labels(traitset_name: str, animal: str) -> ExportLabels:
+    """Get the cached export labels for a traitset and animal. Keyed by the
+    animal so changing a class's default animal picks up new labels."""
 
-    return text
+    return ExportLabels(traitset_name, animal)
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.utils.timezone import now
+
+from .. import models
+
+
+def create_teacher(username: str = "teacher") -> User:
+    return User.objects.create_user(username, f"{username}@example.com", "password")
+
+
+def create_class(
+    teacher: User,
+    traitset: str = "ANIMAL_SCIENCE_322",
+    males: int = 2,
+    females: int = 5,
+) -> models.Class:
+    return models.Class.create_new(
+        teacher, f"{teacher.username}'s Class", traitset, "", males, females
+    )
+
+
+def enroll_student(connectedclass: models.Class, username: str) -> models.Enrollment:
+    student = User.objects.create_user(
+        username,
+        f"{username}@example.com",
+        "password",
+        first_name=username.title(),
+        last_name="Student",
+    )
+    request = models.EnrollmentRequest.create_new(student, connectedclass)
+
+    return models.Enrollment.create_from_enrollment_request(request)
+
+
+def create_assignment(
+    connectedclass: models.Class, steps: list[str], name: str = "Assignment"
+) -> models.Assignment:
+    return models.Assignment.create_new(
+        name,
+        now() - timedelta(days=1),
+        now() + timedelta(days=1),
+        steps,
+        connectedclass,
+    )
+
+
+def get_males(herd: models.Herd, count: int = 2) -> list[models.Animal]:
+    return list(models.Animal.objects.filter(herd=herd, male=True)[:count])
@@ -0,0 +1,49 @@
+from django.test import SimpleTestCase
+
+from ..templatetags import animal_filters
+from ..traitsets import Traitset
+
+
+class TestAnimalFilters(SimpleTestCase):
+    traitset_name = "ANIMAL_SCIENCE_322"
+
+    def setUp(self):
+        self.traitset = Traitset(self.traitset_name)
+        self.animal = next(iter(self.traitset.animals))
+        self.contextcast = animal_filters.ContextCast(None)
+        self.contextcast.traitset_name = self.traitset_name
+        self.contextcast.animal = self.animal
+
+    def test_filter_text(self):
+        trait = self.traitset.traits[0]
+        animalfilter = self.traitset.animals[self.animal]
+
+        text = animal_filters.filter_text(
+            f"<Sires> and <{trait.uid}>: <pta_prefix> <unknown>", self.contextcast
+        )
+
+        self.assertEqual(
+            text,
+            f"{animalfilter.sires[0].upper()}{animalfilter.sires[1:]} and "
+            f"{trait.animals[self.animal].name}: "
+            f"{animalfilter.pta_prefix} <unknown>",
+        )
+
+    def test_filter_dict_is_cached(self):
+        first = animal_filters.get_filter_dict(self.contextcast)
+        second = animal_filters.get_filter_dict(self.contextcast)
+
+        self.assertIs(first, second)
+
+    def test_export_labels(self):
+        labels = animal_filters.get_export_labels(self.traitset_name, self.animal)
+        trait = self.traitset.traits[0]
+
+        self.assertIs(
+            labels, animal_filters.get_export_labels(self.traitset_name, self.animal)
+        )
+        self.assertEqual(len(labels.ptas), len(self.traitset.traits))
+        self.assertEqual(
+            labels.ptas[0],
+            animal_filters.filter_text(f"pta: <{trait.uid}>", self.contextcast),
+        )
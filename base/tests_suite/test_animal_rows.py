@@ -0,0 +1,39 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .. import models
+from ..animal_rows import AnimalRow
+from . import helpers
+
+
+class TestAnimalRows(TestCase):
+    def setUp(self):
+        self.connectedclass = helpers.create_class(helpers.create_teacher())
+        self.herd = self.connectedclass.class_herd
+
+    def test_json_columns_decoded_on_first_access(self):
+        (row,) = AnimalRow.query(models.Animal.objects.filter(herd=self.herd)[:1])
+        animal = models.Animal.objects.get(id=row.id)
+
+        self.assertIsInstance(row._genotype, str)
+        self.assertEqual(row.genotype, animal.genotype)
+        self.assertIsInstance(row._genotype, dict)
+        self.assertIsInstance(row._recessives, str)
+        self.assertEqual((row.name, row.male), (animal.name, animal.male))
+
+    def test_herd_json_matches_animals(self):
+        self.connectedclass.hide_female_pta = True
+        self.connectedclass.net_merit_visibility = False
+        self.connectedclass.save()
+        herd = models.Herd.objects.get(id=self.herd.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            json = herd.json_dict()
+
+        # One query for the class and one for the animals
+        self.assertEqual(len(queries.captured_queries), 2)
+        self.assertEqual(
+            json["animals"],
+            {x.id: x.json_dict() for x in models.Animal.objects.filter(herd=herd)},
+        )
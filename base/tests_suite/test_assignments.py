@@ -0,0 +1,65 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .. import models
+from . import helpers
+
+
+class TestAssignmentQueries(TestCase):
+    def setUp(self):
+        self.teacher = helpers.create_teacher()
+        self.connectedclass = helpers.create_class(self.teacher)
+
+    def add_assignments_and_students(self, count: int):
+        existing = models.Enrollment.objects.filter(
+            connectedclass=self.connectedclass
+        ).count()
+
+        for i in range(count):
+            helpers.create_assignment(
+                self.connectedclass,
+                [models.AssignmentStep.CHOICE_BREED] * i
+                + [models.AssignmentStep.CHOICE_MALE_SUBMISSION],
+                f"Assignment {existing + i}",
+            )
+            helpers.enroll_student(self.connectedclass, f"student{existing + i}")
+
+    def count_assignments_page_queries(self) -> int:
+        self.client.force_login(self.teacher)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                f"/class/{self.connectedclass.id}/assignments"
+            )
+
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_assignments_page_query_count_is_constant(self):
+        self.add_assignments_and_students(1)
+        small = self.count_assignments_page_queries()
+
+        self.add_assignments_and_students(4)
+        large = self.count_assignments_page_queries()
+
+        self.assertEqual(small, large)
+
+    def test_open_assignments_json_query_count_is_constant(self):
+        self.add_assignments_and_students(5)
+        enrollment = (
+            models.Enrollment.objects.select_related("connectedclass")
+            .filter(connectedclass=self.connectedclass)
+            .first()
+        )
+
+        # Assignments, their steps and the enrollment's fulfillments
+        with self.assertNumQueries(3):
+            json = enrollment.get_open_assignments_json_dict()
+
+        self.assertEqual(len(json), 5)
+        for assignment in json.values():
+            self.assertEqual(assignment["fulfillment"], 0)
+            self.assertEqual(
+                [x["key"] for x in assignment["steps"]][-1],
+                models.AssignmentStep.CHOICE_MALE_SUBMISSION,
+            )
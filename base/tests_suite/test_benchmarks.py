@@ -0,0 +1,92 @@
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+
+from .. import benchmarks, models
+from ..traitsets import REGISTERED, Traitset
+
+
+class TestKernelEquivalence(SimpleTestCase):
+    def test_kernels_match_reference(self):
+        for registration in REGISTERED:
+            traitset = Traitset(registration.name)
+
+            for kernel in benchmarks.KERNELS:
+                with self.subTest(traitset=registration.name, kernel=kernel.name):
+                    equivalence = benchmarks.check_equivalence(
+                        kernel, traitset, samples=2000
+                    )
+                    self.assertTrue(equivalence.passed, equivalence.json_dict())
+
+    def test_pedigrees_are_inbred(self):
+        traitset = Traitset("ANIMAL_SCIENCE_322")
+        inputs = benchmarks.KernelInputs(traitset, 50)
+        kernel = next(x for x in benchmarks.KERNELS if x.name == "inbreeding")
+
+        self.assertGreater(max(kernel.run(traitset, inputs, 50)), 0)
+
+
+class TestCompareDistributions(SimpleTestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.covariance = [[1, 0.6], [0.6, 1]]
+
+    def sample(self, mean=0.0, scale=1.0, covariance=None) -> np.ndarray:
+        return mean + scale * self.rng.multivariate_normal(
+            [0, 0], covariance or self.covariance, 10_000
+        )
+
+    def test_same_distribution_passes(self):
+        self.assertTrue(
+            benchmarks.compare_distributions(self.sample(), self.sample()).passed
+        )
+
+    def test_shifted_mean_fails(self):
+        result = benchmarks.compare_distributions(self.sample(), self.sample(0.1))
+        self.assertFalse(result.passed)
+        self.assertGreater(result.mean_z, result.z)
+
+    def test_scaled_variance_fails(self):
+        result = benchmarks.compare_distributions(
+            self.sample(), self.sample(scale=1.1)
+        )
+        self.assertFalse(result.passed)
+        self.assertGreater(result.variance_z, result.z)
+
+    def test_lost_correlation_fails(self):
+        result = benchmarks.compare_distributions(
+            self.sample(), self.sample(covariance=[[1, 0.5], [0.5, 1]])
+        )
+        self.assertFalse(result.passed)
+        self.assertGreater(result.correlation_z, result.z)
+
+    def test_constant_columns(self):
+        ones = np.ones((100, 1))
+
+        self.assertTrue(benchmarks.compare_distributions(ones, ones).passed)
+        self.assertFalse(benchmarks.compare_distributions(ones, ones * 2).passed)
+
+
+class TestRunBenchmarks(SimpleTestCase):
+    def test_report(self):
+        report = benchmarks.run_benchmarks(
+            ["STANDARD_A"], sizes=(1, 10), repeat=1, samples=0
+        )
+
+        self.assertEqual(len(report["timings"]), len(benchmarks.KERNELS) * 2)
+        self.assertEqual(report["equivalence"], [])
+        self.assertEqual(
+            {x["kernel"] for x in report["timings"]},
+            {x.name for x in benchmarks.KERNELS},
+        )
+
+
+class TestBenchmarkBreeding(TestCase):
+    def test_rolled_back(self):
+        classes = models.Class.objects.count()
+
+        timings = benchmarks.benchmark_breeding("ANIMAL_SCIENCE_322", 50, 2)
+
+        self.assertEqual([x["breeding"] for x in timings], [1, 2])
+        self.assertEqual(timings[0]["animals"], 50)
+        self.assertEqual(timings[0]["calves"], 10)
+        self.assertEqual(models.Class.objects.count(), classes)
@@ -0,0 +1,319 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipUnless
+from unittest.mock import patch
+
+from background_task.models import Task
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from .. import forms, models, pedigrees
+from . import helpers
+
+
+def get_living_average(connectedclass: models.Class) -> tuple[int, float]:
+    animals = models.Animal.objects.filter(
+        connectedclass=connectedclass, herd__isnull=False
+    )
+    net_merit = [x.net_merit for x in animals]
+
+    return len(net_merit), sum(net_merit) / len(net_merit)
+
+
+class TestTrendLog(TestCase):
+    def setUp(self):
+        self.connectedclass = helpers.create_class(helpers.create_teacher())
+        self.enrollment = helpers.enroll_student(self.connectedclass, "student")
+
+    def test_trend_log_matches_living_animals(self):
+        herd = self.enrollment.herd
+        for _ in range(3):
+            herd = models.Herd.objects.get(id=herd.id)
+            herd.breed_herd(helpers.get_males(herd, 2), "")
+
+        trend_log = self.connectedclass.get_trend_log()
+        population, net_merit = get_living_average(self.connectedclass)
+
+        self.assertEqual(len(trend_log), 5)
+        self.assertEqual(trend_log[-1]["populationsize"], population)
+        self.assertAlmostEqual(trend_log[-1]["NM$"], net_merit)
+        self.assertEqual(models.Herd.objects.get(id=herd.id).breedings, 3)
+
+
+class TestClassHerdSettings(TestCase):
+    def setUp(self):
+        self.connectedclass = helpers.create_class(helpers.create_teacher())
+        self.connectedclass.herd_males = 2
+        self.connectedclass.herd_females = 3
+        self.connectedclass.max_age = 1
+        self.connectedclass.save()
+        self.herd = helpers.enroll_student(self.connectedclass, "student").herd
+
+    def breed(self):
+        herd = models.Herd.objects.get(id=self.herd.id)
+        herd.breed_herd(helpers.get_males(herd, 2), "")
+
+    def test_starter_herd_size(self):
+        animals = models.Animal.objects.filter(herd=self.herd)
+
+        self.assertEqual(animals.filter(male=True).count(), 2)
+        self.assertEqual(animals.filter(male=False).count(), 3)
+
+    def test_breeding_uses_class_settings(self):
+        self.breed()
+
+        # Only 3 mothers, so both targets are reduced until 3 calves are born
+        calves = models.Animal.objects.filter(
+            connectedclass=self.connectedclass, generation=1
+        )
+        self.assertEqual(calves.filter(male=True).count(), 1)
+        self.assertEqual(calves.filter(male=False).count(), 2)
+        self.assertFalse(
+            models.Animal.objects.filter(herd=self.herd, generation=0).exists()
+        )
+
+    def test_pedigrees_are_trimmed(self):
+        def depth(pedigree) -> int:
+            if pedigree is None:
+                return 0
+            return 1 + max(depth(pedigree["sire"]), depth(pedigree["dam"]))
+
+        self.connectedclass.max_age = 5
+        self.connectedclass.save()
+
+        with patch.object(models.Animal, "PEDIGREE_GENERATIONS", 1):
+            for _ in range(3):
+                self.breed()
+
+        for animal in models.Animal.objects.filter(generation=3):
+            self.assertEqual(depth(animal.pedigree), 2)
+
+    def test_inbreeding_counts_ancestors_beyond_pedigrees(self):
+        # Two lines of six generations descending from one common ancestor,
+        # further back than stored pedigrees go
+        self.connectedclass.herd_females = 10
+        self.connectedclass.save()
+        helpers.enroll_student(self.connectedclass, "second")
+        animals = list(
+            models.Animal.objects.filter(connectedclass=self.connectedclass).order_by(
+                "id"
+            )[:13]
+        )
+        ancestor, first_line, second_line = animals[0], animals[1:7], animals[7:]
+        for line in (first_line, second_line):
+            parent = ancestor
+            for animal in line:
+                animal.sire, animal.dam = parent, None
+                parent = animal
+        models.Animal.objects.bulk_update(animals, ["sire", "dam"])
+
+        (calf,) = models.Animal.generate_from_breeding_unsaved_batch(
+            [False],
+            self.herd,
+            models.Traitset(self.connectedclass.traitset),
+            self.connectedclass,
+            [first_line[-1]],
+            [second_line[-1]],
+            "",
+        )
+
+        self.assertEqual(calf.inbreeding, 0.5**13)
+
+    def test_kinship_of_half_siblings(self):
+        kinship = pedigrees.Kinship()
+        for pedigree in [
+            {"sire": {"sire": None, "dam": None, "id": 1}, "dam": None, "id": 3},
+            {
+                "sire": {"sire": None, "dam": None, "id": 1},
+                "dam": {"sire": None, "dam": None, "id": 2},
+                "id": 4,
+            },
+            {"sire": None, "dam": {"sire": None, "dam": None, "id": 2}, "id": 5},
+        ]:
+            kinship.add_pedigree(pedigree)
+
+        # Animal 3 appears twice, once trimmed
+        kinship.add_pedigree({"sire": None, "dam": None, "id": 3})
+        self.assertEqual(kinship.parents[3], (1, None))
+        self.assertEqual(kinship.inbreeding(3, 4), 0.125)
+        self.assertEqual(kinship.inbreeding(1, 2), 0)
+        self.assertEqual(kinship.coefficient(4, 4), 0.5)
+
+
+class TestCreateFinalized(TestCase):
+    def setUp(self):
+        self.connectedclass = helpers.create_class(helpers.create_teacher())
+        self.herd = helpers.enroll_student(self.connectedclass, "student").herd
+        models.Herd.objects.filter(id=self.herd.id).update(name="Students")
+
+    def breed(self) -> list[str]:
+        herd = models.Herd.objects.get(id=self.herd.id)
+        with CaptureQueriesContext(connection) as queries:
+            herd.breed_herd(helpers.get_males(herd, 2), "")
+
+        return [x["sql"] for x in queries.captured_queries]
+
+    def test_names_and_pedigree_ids(self):
+        self.breed()
+
+        animals = models.Animal.objects.filter(herd=self.herd, generation=1)
+        self.assertTrue(animals.exists())
+        for animal in animals:
+            self.assertEqual(animal.name, f"Students' {animal.id}")
+            self.assertEqual(animal.pedigree["id"], animal.id)
+
+    def test_pedigree_written_once(self):
+        table = models.Animal._meta.db_table
+        updates = [
+            x
+            for x in self.breed()
+            if x.startswith(f'UPDATE "{table}"') and "pedigree" in x
+        ]
+
+        if models.Animal.allocate_ids(1) is None:
+            self.assertEqual(len(updates), 1)
+        else:
+            self.assertEqual(updates, [])
+
+
+class TestHerdLock(TestCase):
+    """Checks the locking that TestConcurrentBreeding exercises, on backends
+    without row level locks"""
+
+    def setUp(self):
+        self.connectedclass = helpers.create_class(helpers.create_teacher())
+        self.herd = helpers.enroll_student(self.connectedclass, "student").herd
+
+    def test_lock_selects_for_update(self):
+        with patch.object(
+            QuerySet,
+            "select_for_update",
+            autospec=True,
+            side_effect=QuerySet.select_for_update,
+        ) as select_for_update:
+            herd = models.Herd.lock(self.herd.id)
+
+        select_for_update.assert_called_once()
+        self.assertEqual(select_for_update.call_args.args[0].model, models.Herd)
+        self.assertEqual(herd.id, self.herd.id)
+
+    def test_breed_herd_locks_herd(self):
+        herd = models.Herd.objects.get(id=self.herd.id)
+        with patch.object(models.Herd, "lock", wraps=models.Herd.lock) as lock:
+            herd.breed_herd(helpers.get_males(herd, 2), "")
+
+        lock.assert_called_once_with(self.herd.id)
+
+    def test_breed_herd_counts_from_locked_row(self):
+        stale = models.Herd.objects.get(id=self.herd.id)
+        fresh = models.Herd.objects.get(id=self.herd.id)
+        fresh.breed_herd(helpers.get_males(fresh, 2), "")
+
+        stale.breed_herd(helpers.get_males(stale, 2), "")
+
+        self.assertEqual(models.Herd.objects.get(id=self.herd.id).breedings, 2)
+
+
+class TestSubmitAnimal(TestCase):
+    def setUp(self):
+        self.connectedclass = helpers.create_class(helpers.create_teacher())
+        self.enrollment = helpers.enroll_student(self.connectedclass, "student")
+        self.herd = self.enrollment.herd
+        self.assignment = helpers.create_assignment(
+            self.connectedclass, [models.AssignmentStep.CHOICE_MALE_SUBMISSION]
+        )
+        self.animal = helpers.get_males(self.herd, 1)[0]
+        self.client.force_login(self.enrollment.student)
+
+    def submit(self):
+        return self.client.post(
+            f"/class/{self.connectedclass.id}/herd/{self.herd.id}"
+            + f"/assignments/submit-animal/{self.animal.id}",
+            {"assignment": self.assignment.id},
+        )
+
+    def get_step(self) -> int:
+        return models.AssignmentFulfillment.objects.get(
+            assignment=self.assignment, enrollment=self.enrollment
+        ).current_step
+
+    def test_submission_moves_animal_to_class_herd(self):
+        step = self.get_step()
+        self.assertEqual(self.submit().status_code, 302)
+        self.assertIsNone(models.Animal.objects.get(id=self.animal.id).herd_id)
+        self.assertEqual(self.get_step(), step + 1)
+
+        forms.SubmitAnimal.move_animal.now(self.animal.id)
+        self.assertEqual(
+            models.Animal.objects.get(id=self.animal.id).herd_id,
+            self.connectedclass.class_herd_id,
+        )
+
+    def test_animal_culled_before_lock(self):
+        lock = models.Herd.lock
+
+        def cull_then_lock(herdid: int):
+            models.Animal.objects.filter(id=self.animal.id).update(herd=None)
+            return lock(herdid)
+
+        step = self.get_step()
+        with patch.object(models.Herd, "lock", side_effect=cull_then_lock):
+            self.assertEqual(self.submit().status_code, 404)
+
+        self.assertEqual(self.get_step(), step)
+        self.assertFalse(Task.objects.filter(task_name="base.forms.move_animal"))
+
+    def test_move_animal_only_writes_herd(self):
+        models.Animal.objects.filter(id=self.animal.id).update(herd=None)
+
+        table = models.Animal._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            forms.SubmitAnimal.move_animal.now(self.animal.id)
+
+        updates = [
+            x["sql"]
+            for x in queries.captured_queries
+            if x["sql"].startswith(f'UPDATE "{table}"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn("ptas", updates[0])
+
+
+@skipUnless(
+    connection.features.has_select_for_update, "Requires row level locking"
+)
+class TestConcurrentBreeding(TransactionTestCase):
+    BREEDINGS = 50
+
+    def setUp(self):
+        self.connectedclass = helpers.create_class(helpers.create_teacher())
+        self.herds = [
+            helpers.enroll_student(self.connectedclass, f"student{i}").herd
+            for i in range(5)
+        ]
+
+    def breed(self, herdid: int):
+        try:
+            with transaction.atomic():
+                herd = models.Herd.objects.select_related("connectedclass").get(
+                    id=herdid
+                )
+                herd.breed_herd(helpers.get_males(herd, 2), "")
+        finally:
+            connection.close()
+
+    def test_no_lost_updates(self):
+        herdids = [self.herds[i % len(self.herds)].id for i in range(self.BREEDINGS)]
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            list(executor.map(self.breed, herdids))
+
+        for herd in models.Herd.objects.filter(id__in=herdids):
+            self.assertEqual(herd.breedings, self.BREEDINGS // len(self.herds))
+
+        trend_log = self.connectedclass.get_trend_log()
+        population, net_merit = get_living_average(self.connectedclass)
+
+        self.assertEqual(len(trend_log), 1 + len(self.herds) + self.BREEDINGS)
+        self.assertEqual(trend_log[-1]["populationsize"], population)
+        self.assertAlmostEqual(trend_log[-1]["NM$"], net_merit)
@@ -0,0 +1,62 @@
+import numpy as np
+from django.test import TestCase
+
+from .. import models
+from ..traitsets import Traitset
+from . import helpers
+
+
+class TestConversionTable(TestCase):
+    def setUp(self):
+        self.connectedclass = helpers.create_class(helpers.create_teacher())
+        self.table = self.connectedclass.get_conversion_table()
+        self.traits = Traitset(self.connectedclass.traitset).traits
+        animal = self.connectedclass.default_animal
+        self.filters = [x.animals[animal] for x in self.traits]
+
+    def test_convert_matrix(self):
+        n = len(self.traits)
+        matrix = np.array([[0.5] * n * 3, [-1.0] * n * 3])
+        matrix[1, n] = np.nan
+        converted = self.table.convert_matrix(matrix)
+
+        for i, x in enumerate(self.filters):
+            sd, avg = x.standard_deviation, x.phenotype_average
+            self.assertAlmostEqual(converted[0, i], 0.5 * sd)
+            self.assertAlmostEqual(converted[0, n + i], sd + avg)
+            self.assertAlmostEqual(converted[1, n * 2 + i], avg - sd * 2)
+
+        self.assertTrue(np.isnan(converted[1, n]))
+
+    def test_real_unit_rows(self):
+        data_keys = self.connectedclass.get_animal_file_data_order()
+        genetic = list(self.connectedclass.iter_animal_file_rows(chunk_size=3))
+        real = list(
+            self.connectedclass.iter_animal_file_rows(real_units=True, chunk_size=3)
+        )
+        self.assertEqual(
+            len(real),
+            models.Animal.objects.filter(connectedclass=self.connectedclass).count(),
+        )
+
+        for genetic_row, real_row in zip(genetic, real):
+            for key, before, after in zip(data_keys, genetic_row, real_row):
+                if type(key) is not tuple or key[0] not in self.table.scale:
+                    self.assertEqual(after, before)
+                elif before is None:
+                    self.assertIsNone(after)
+                else:
+                    i = self.table.uids.index(key[1])
+                    self.assertAlmostEqual(
+                        after,
+                        before * self.table.scale[key[0]][i]
+                        + self.table.offset[key[0]][i],
+                    )
+
+    def test_rows_without_ptas(self):
+        n = len(self.traits)
+        row = ["id"] + [None] * n * 3 + ["recessive"]
+
+        self.table.convert_rows([row], 1)
+
+        self.assertEqual(row, ["id"] + [None] * n * 3 + ["recessive"])
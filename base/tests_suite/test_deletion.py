@@ -0,0 +1,53 @@
+from django.test import TestCase
+
+from .. import models
+from . import helpers
+
+
+class TestClassDeletion(TestCase):
+    def setUp(self):
+        self.connectedclass = helpers.create_class(helpers.create_teacher())
+        self.other_class = helpers.create_class(helpers.create_teacher("other"))
+
+        for connectedclass in [self.connectedclass, self.other_class]:
+            helpers.create_assignment(
+                connectedclass, [models.AssignmentStep.CHOICE_BREED]
+            )
+            for i in range(2):
+                enrollment = helpers.enroll_student(
+                    connectedclass, f"student{connectedclass.id}-{i}"
+                )
+                enrollment.herd.breed_herd(helpers.get_males(enrollment.herd), "1")
+
+    def count_rows(self, connectedclass: models.Class) -> dict[str, int]:
+        return {
+            "animals": models.Animal.objects.filter(
+                connectedclass=connectedclass
+            ).count(),
+            "herds": models.Herd.objects.filter(connectedclass=connectedclass).count(),
+            "enrollments": models.Enrollment.objects.filter(
+                connectedclass=connectedclass
+            ).count(),
+            "assignments": models.Assignment.objects.filter(
+                connectedclass=connectedclass
+            ).count(),
+            "fulfillments": models.AssignmentFulfillment.objects.filter(
+                assignment__connectedclass=connectedclass
+            ).count(),
+            "classes": models.Class.objects.filter(id=connectedclass.id).count(),
+        }
+
+    def test_delete_in_batches(self):
+        other_before = self.count_rows(self.other_class)
+        progress = []
+
+        self.connectedclass.delete_in_batches(
+            batch_size=7, progress=lambda label, count: progress.append(label)
+        )
+
+        for key, count in self.count_rows(self.connectedclass).items():
+            self.assertEqual(count, 0, key)
+
+        self.assertEqual(self.count_rows(self.other_class), other_before)
+        self.assertGreater(progress.count("Animal"), 1)
+        self.assertEqual(progress[-1], "Class")
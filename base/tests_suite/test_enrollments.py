@@ -0,0 +1,197 @@
+from json import dumps
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .. import models
+from . import helpers
+
+
+class TestConfirmEnrollments(TestCase):
+    def setUp(self):
+        self.teacher = helpers.create_teacher()
+        self.connectedclass = helpers.create_class(self.teacher)
+        self.connectedclass.enrollment_tokens = 10
+        self.connectedclass.save()
+        self.assignment = helpers.create_assignment(
+            self.connectedclass, [models.AssignmentStep.CHOICE_BREED]
+        )
+        self.client.force_login(self.teacher)
+
+    def request_enrollments(self, count: int) -> list[models.EnrollmentRequest]:
+        start = User.objects.count()
+        return [
+            models.EnrollmentRequest.create_new(
+                User.objects.create_user(
+                    f"student{start + i}",
+                    f"student{start + i}@example.com",
+                    "password",
+                    first_name="Student",
+                    last_name=str(start + i),
+                ),
+                self.connectedclass,
+            )
+            for i in range(count)
+        ]
+
+    def confirm(
+        self, enrollment_requests
+    ) -> tuple[list[models.Enrollment], list[str]]:
+        enrollment_requests = list(
+            models.EnrollmentRequest.objects.select_related(
+                "connectedclass", "student"
+            ).filter(id__in=[x.id for x in enrollment_requests])
+        )
+        with CaptureQueriesContext(connection) as queries:
+            enrollments = models.Enrollment.create_from_enrollment_requests(
+                enrollment_requests
+            )
+
+        return enrollments, [x["sql"] for x in queries.captured_queries]
+
+    def test_create_from_enrollment_requests(self):
+        deltas = models.TrendDelta.objects.filter(
+            connectedclass=self.connectedclass
+        ).count()
+
+        enrollments, _queries = self.confirm(self.request_enrollments(3))
+
+        self.assertEqual(len(enrollments), 3)
+        self.assertFalse(
+            models.EnrollmentRequest.objects.filter(
+                connectedclass=self.connectedclass
+            ).exists()
+        )
+        for enrollment in enrollments:
+            herd = models.Herd.objects.get(id=enrollment.herd_id)
+            self.assertEqual(herd.enrollment_id, enrollment.id)
+            self.assertEqual(models.Animal.objects.filter(herd=herd).count(), 80)
+            self.assertEqual(
+                models.Animal.objects.filter(herd=herd, male=True).count(), 10
+            )
+            self.assertTrue(
+                models.AssignmentFulfillment.objects.filter(
+                    enrollment=enrollment, assignment=self.assignment
+                ).exists()
+            )
+
+        self.connectedclass.refresh_from_db()
+        self.assertEqual(self.connectedclass.enrollment_tokens, 7)
+        self.assertEqual(
+            models.TrendDelta.objects.filter(
+                connectedclass=self.connectedclass
+            ).count(),
+            deltas + 1,
+        )
+        # The 7 animal class herd and three starter herds
+        self.assertEqual(self.connectedclass.get_trend_log()[-1]["populationsize"], 247)
+
+    def test_query_count_does_not_grow(self):
+        def split(queries: list[str]) -> tuple[int, int]:
+            animal = [x for x in queries if '"base_animal"' in x.split(" SET ")[0]]
+            return len(animal), len(queries) - len(animal)
+
+        one_animal, one_other = split(self.confirm(self.request_enrollments(1))[1])
+        five_animal, five_other = split(self.confirm(self.request_enrollments(5))[1])
+
+        # Animal inserts are only split into more statements by the database's
+        # parameter limit
+        self.assertEqual(one_other, five_other)
+        self.assertLess(five_animal, one_animal * 5)
+
+    def test_requests_must_share_class(self):
+        other_class = helpers.create_class(helpers.create_teacher("other"))
+        enrollment_requests = self.request_enrollments(1)
+        enrollment_requests.append(
+            models.EnrollmentRequest.create_new(
+                User.objects.create_user("otherstudent"), other_class
+            )
+        )
+
+        with self.assertRaises(ValueError):
+            models.Enrollment.create_from_enrollment_requests(enrollment_requests)
+
+    def test_confirm_selected(self):
+        enrollment_requests = self.request_enrollments(3)
+        selected = [enrollment_requests[0].id, enrollment_requests[2].id]
+
+        response = self.client.post(
+            f"/class/{self.connectedclass.id}/enrollments/requests/confirm",
+            {"requests": dumps(selected)},
+        )
+
+        self.assertEqual(response.json()["requests"], selected)
+        self.assertFalse(response.json()["out of tokens"])
+        self.assertEqual(
+            list(
+                models.EnrollmentRequest.objects.filter(
+                    connectedclass=self.connectedclass
+                ).values_list("id", flat=True)
+            ),
+            [enrollment_requests[1].id],
+        )
+
+    def test_confirm_all_stops_at_tokens(self):
+        self.connectedclass.enrollment_tokens = 2
+        self.connectedclass.save()
+        enrollment_requests = self.request_enrollments(3)
+
+        response = self.client.post(
+            f"/class/{self.connectedclass.id}/enrollments/requests/confirm",
+            {"all": "true"},
+        )
+
+        self.assertEqual(
+            response.json()["requests"], [x.id for x in enrollment_requests[:2]]
+        )
+        self.assertTrue(response.json()["out of tokens"])
+        self.connectedclass.refresh_from_db()
+        self.assertEqual(self.connectedclass.enrollment_tokens, 0)
+
+    def test_malformed_selection(self):
+        response = self.client.post(
+            f"/class/{self.connectedclass.id}/enrollments/requests/confirm",
+            {"requests": dumps(["abc"])},
+        )
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_repeated_confirm_all(self):
+        self.request_enrollments(3)
+        path = f"/class/{self.connectedclass.id}/enrollments/requests/confirm"
+
+        first = self.client.post(path, {"all": "true"})
+        second = self.client.post(path, {"all": "true"})
+
+        self.assertEqual(len(first.json()["enrollments"]), 3)
+        self.assertEqual(second.json()["enrollments"], [])
+        self.assertEqual(
+            models.Enrollment.objects.filter(
+                connectedclass=self.connectedclass
+            ).count(),
+            3,
+        )
+        self.connectedclass.refresh_from_db()
+        self.assertEqual(self.connectedclass.enrollment_tokens, 7)
+
+    def test_tokens_spent_while_waiting_for_lock(self):
+        self.request_enrollments(3)
+        lock = models.Class.lock
+
+        def spend_then_lock(classid: int):
+            models.Class.objects.filter(id=classid).update(enrollment_tokens=0)
+            return lock(classid)
+
+        with patch.object(models.Class, "lock", side_effect=spend_then_lock):
+            response = self.client.post(
+                f"/class/{self.connectedclass.id}/enrollments/requests/confirm",
+                {"all": "true"},
+            )
+
+        self.assertEqual(response.json()["enrollments"], [])
+        self.assertTrue(response.json()["out of tokens"])
+        self.connectedclass.refresh_from_db()
+        self.assertEqual(self.connectedclass.enrollment_tokens, 0)
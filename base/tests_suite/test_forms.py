@@ -0,0 +1,58 @@
+from json import dumps
+
+from django.test import TestCase
+
+from .. import forms, models
+from ..views_utils import ClassAuth
+from . import helpers
+
+
+class TestBreedHerd(TestCase):
+    def setUp(self):
+        self.connectedclass = helpers.create_class(helpers.create_teacher())
+        self.assignment = helpers.create_assignment(
+            self.connectedclass, [models.AssignmentStep.CHOICE_BREED]
+        )
+        self.enrollment = helpers.enroll_student(self.connectedclass, "student")
+        self.other_enrollment = helpers.enroll_student(self.connectedclass, "other")
+        self.class_auth = ClassAuth.Student(
+            models.Enrollment.objects.select_related("connectedclass").get(
+                id=self.enrollment.id
+            )
+        )
+
+    def get_form(self, males: list) -> forms.BreedHerd:
+        return forms.BreedHerd(
+            {"males": dumps(males), "assignment": self.assignment.id}
+        )
+
+    def test_valid_males_fetched_in_one_query(self):
+        males = helpers.get_males(self.enrollment.herd, 2) + helpers.get_males(
+            self.connectedclass.class_herd, 1
+        )
+        form = self.get_form([x.id for x in males])
+
+        # One query for the sires and three for the assignment
+        with self.assertNumQueries(4):
+            self.assertTrue(form.is_valid(self.class_auth))
+
+        self.assertEqual(
+            [x.id for x in form.validation_catch.males], [x.id for x in males]
+        )
+
+    def test_female_is_invalid(self):
+        female = models.Animal.objects.filter(
+            herd=self.enrollment.herd, male=False
+        ).first()
+
+        self.assertFalse(self.get_form([female.id]).is_valid(self.class_auth))
+
+    def test_other_enrollment_herd_is_invalid(self):
+        male = helpers.get_males(self.other_enrollment.herd, 1)[0]
+
+        self.assertFalse(self.get_form([male.id]).is_valid(self.class_auth))
+
+    def test_missing_or_malformed_males_are_invalid(self):
+        self.assertFalse(self.get_form([]).is_valid(self.class_auth))
+        self.assertFalse(self.get_form([0]).is_valid(self.class_auth))
+        self.assertFalse(self.get_form(["abc"]).is_valid(self.class_auth))
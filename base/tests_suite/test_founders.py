@@ -0,0 +1,105 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.utils.timezone import now
+
+from .. import models
+from . import helpers
+
+TRAITSET = "ANIMAL_SCIENCE_322"
+
+
+@override_settings(
+    FOUNDER_POOL_ENABLED=True,
+    FOUNDER_POOL_SIZE=100,
+    FOUNDER_POOL_WATERMARK=80,
+    TASK_BACKEND="immediate",
+)
+class TestFounderPool(TestCase):
+    def setUp(self):
+        self.connectedclass = helpers.create_class(helpers.create_teacher())
+
+    def get_counts(self) -> dict[bool, int]:
+        return models.Founder.get_counts(TRAITSET)
+
+    def test_refill(self):
+        models.Founder.objects.all().delete()
+
+        models.Founder.refill_founder_pool.now(TRAITSET)
+
+        self.assertEqual(self.get_counts(), {True: 100, False: 100})
+        founder = models.Founder.objects.filter(male=True).first()
+        self.assertEqual(
+            founder.phenotype,
+            models.Traitset(TRAITSET).get_null_phenotype(),
+        )
+
+    def test_enrollment_uses_pool(self):
+        models.Founder.objects.all().delete()
+        models.Founder.refill_founder_pool.now(TRAITSET)
+        genotypes = {
+            male: list(
+                models.Founder.objects.filter(male=male)
+                .order_by("id")
+                .values_list("genotype", flat=True)
+            )
+            for male in (True, False)
+        }
+
+        with override_settings(FOUNDER_POOL_WATERMARK=0):
+            herd = helpers.enroll_student(self.connectedclass, "student").herd
+
+        for male, count in [(True, 10), (False, 70)]:
+            animals = models.Animal.objects.filter(herd=herd, male=male).order_by("id")
+            self.assertEqual(
+                [x.genotype for x in animals], genotypes[male][:count]
+            )
+        self.assertEqual(self.get_counts(), {True: 90, False: 30})
+
+    def test_refills_below_watermark(self):
+        models.Founder.objects.all().delete()
+        models.Founder.refill_founder_pool.now(TRAITSET)
+
+        helpers.enroll_student(self.connectedclass, "student")
+
+        self.assertEqual(self.get_counts(), {True: 100, False: 100})
+
+    def test_empty_pool_falls_back(self):
+        models.Founder.objects.all().delete()
+
+        with override_settings(FOUNDER_POOL_SIZE=0):
+            herd = helpers.enroll_student(self.connectedclass, "student").herd
+
+        self.assertEqual(models.Animal.objects.filter(herd=herd).count(), 80)
+        self.assertEqual(
+            models.Animal.objects.filter(herd=herd, male=True).count(), 10
+        )
+
+    def test_refill_does_not_overfill(self):
+        models.Founder.objects.all().delete()
+
+        models.Founder.refill_founder_pool.now(TRAITSET)
+        models.Founder.refill_founder_pool.now(TRAITSET)
+
+        self.assertEqual(self.get_counts(), {True: 100, False: 100})
+
+    def test_one_refill_queued_at_a_time(self):
+        models.Founder.objects.all().delete()
+
+        with patch.object(models.Founder, "refill_founder_pool") as refill:
+            models.Founder.request_refill(TRAITSET)
+            models.Founder.request_refill(TRAITSET)
+            self.assertEqual(refill.call_count, 1)
+
+            # Once the refill starts another can be queued
+            models.FounderPoolRefill.lock(TRAITSET)
+            models.Founder.request_refill(TRAITSET)
+            self.assertEqual(refill.call_count, 2)
+
+            # A refill that never started is eventually given up on
+            models.FounderPoolRefill.objects.update(
+                requested=now() - timedelta(hours=1)
+            )
+            models.Founder.request_refill(TRAITSET)
+            self.assertEqual(refill.call_count, 3)
@@ -0,0 +1,47 @@
+from json import loads
+
+from django.core.cache import caches
+from django.test import TestCase
+
+from .. import herd_cache, models
+from . import helpers
+
+
+class TestHerdCache(TestCase):
+    def setUp(self):
+        caches[herd_cache.CACHE_ALIAS].clear()
+        herd_cache.reset_stats()
+
+        self.teacher = helpers.create_teacher()
+        self.connectedclass = helpers.create_class(self.teacher)
+        self.herd = self.connectedclass.class_herd
+        self.path = f"/class/{self.connectedclass.id}/herd/{self.herd.id}/get"
+        self.client.force_login(self.teacher)
+
+    def test_hit_after_miss(self):
+        first = self.client.get(self.path)
+        second = self.client.get(self.path)
+
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(loads(first.content), loads(second.content))
+        self.assertEqual(herd_cache.stats()["hits"], 1)
+        self.assertEqual(herd_cache.stats()["misses"], 1)
+
+    def test_breeding_invalidates(self):
+        self.client.get(self.path)
+
+        herd = models.Herd.objects.get(id=self.herd.id)
+        herd.breed_herd(helpers.get_males(herd, 1), "")
+
+        response = self.client.get(self.path)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(loads(response.content)["breedings"], 1)
+
+    def test_visibility_is_part_of_key(self):
+        self.client.get(self.path)
+
+        self.connectedclass.hide_female_pta = True
+        self.connectedclass.save()
+
+        self.assertEqual(self.client.get(self.path)["X-Cache"], "MISS")
@@ -0,0 +1,171 @@
+from smtplib import SMTPException
+from unittest.mock import patch
+
+from background_task.models import Task
+from background_task.tasks import tasks as background_tasks
+from django.contrib.auth.models import User
+from django.core import mail
+from django.test import TestCase
+
+from .. import csv
+from .. import models
+
+
+class TestClassJobs(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(
+            "teacher", "teacher@example.com", "password"
+        )
+        self.connectedclass = models.Class.create_new(
+            self.teacher, "Test Class", "ANIMAL_SCIENCE_322", "", 2, 5
+        )
+
+    def test_identical_requests_share_job(self):
+        kind = models.ClassJob.KIND_CALCULATE_PTAS
+        first = models.ClassJob.submit(self.connectedclass, kind, "a@example.com")
+        second = models.ClassJob.submit(self.connectedclass, kind, "b@example.com")
+        third = models.ClassJob.submit(self.connectedclass, kind, "a@example.com")
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(first.id, third.id)
+        self.assertEqual(Task.objects.count(), 1)
+
+        second.refresh_from_db()
+        self.assertEqual(second.emails, ["a@example.com", "b@example.com"])
+
+    def test_different_kinds_do_not_share_job(self):
+        pta = models.ClassJob.submit(
+            self.connectedclass, models.ClassJob.KIND_CALCULATE_PTAS, "a@example.com"
+        )
+        genomic = models.ClassJob.submit(
+            self.connectedclass, models.ClassJob.KIND_GENOMIC_TEST, "a@example.com"
+        )
+
+        self.assertNotEqual(pta.id, genomic.id)
+        self.assertEqual(Task.objects.count(), 2)
+
+    def test_finished_job_notifies_all_requesters(self):
+        kind = models.ClassJob.KIND_GENOMIC_TEST
+        job = models.ClassJob.submit(self.connectedclass, kind, "a@example.com")
+        models.ClassJob.submit(self.connectedclass, kind, "b@example.com")
+
+        models.Class.recalculate_ptas.now(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.ClassJob.STATUS_DONE)
+        self.assertEqual(
+            [x.to for x in mail.outbox], [["a@example.com"], ["b@example.com"]]
+        )
+        self.assertFalse(
+            models.Animal.objects.filter(
+                connectedclass=self.connectedclass, genomic_tests=0
+            ).exists()
+        )
+
+    def test_unchanged_animal_chart_is_reused(self):
+        kind = models.ClassJob.KIND_ANIMAL_CHART
+        job = models.ClassJob.submit(self.connectedclass, kind, "a@example.com")
+        job = models.ClassJob.start(job.id)
+        job.finish("https://example.com/chart.csv")
+        Task.objects.all().delete()
+        mail.outbox.clear()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            reused = models.ClassJob.submit(
+                self.connectedclass, kind, "b@example.com"
+            )
+
+        # Not sent while the class is locked
+        self.assertEqual(mail.outbox, [])
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(reused.id, job.id)
+        self.assertEqual(Task.objects.count(), 0)
+        self.assertEqual(mail.outbox[0].to, ["b@example.com"])
+        self.assertIn("https://example.com/chart.csv", mail.outbox[0].body)
+
+    def test_reused_animal_chart_mail_failure(self):
+        kind = models.ClassJob.KIND_ANIMAL_CHART
+        job = models.ClassJob.submit(self.connectedclass, kind, "a@example.com")
+        job = models.ClassJob.start(job.id)
+        job.finish("https://example.com/chart.csv")
+
+        self.client.force_login(self.teacher)
+        with (
+            patch.object(models, "send_mass_mail", side_effect=SMTPException),
+            self.assertLogs(level="ERROR"),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            response = self.client.get(
+                f"/class/{self.connectedclass.id}/get-animal-chart"
+            )
+
+        self.assertEqual(response.status_code, 302)
+
+    def test_changed_class_regenerates_animal_chart(self):
+        kind = models.ClassJob.KIND_ANIMAL_CHART
+        job = models.ClassJob.submit(self.connectedclass, kind, "a@example.com")
+        job = models.ClassJob.start(job.id)
+        job.finish("https://example.com/chart.csv")
+
+        genomic = models.ClassJob.submit(
+            self.connectedclass, models.ClassJob.KIND_GENOMIC_TEST, "a@example.com"
+        )
+        models.Class.recalculate_ptas.now(genomic.id)
+
+        new = models.ClassJob.submit(self.connectedclass, kind, "a@example.com")
+        self.assertNotEqual(new.id, job.id)
+
+    def test_real_unit_animal_chart_requests(self):
+        self.client.force_login(self.teacher)
+        path = f"/class/{self.connectedclass.id}/get-animal-chart"
+        self.client.get(path)
+        self.client.get(f"{path}?units=real")
+        self.client.get(f"{path}?units=real")
+
+        self.assertEqual(
+            sorted(models.ClassJob.objects.values_list("kind", flat=True)),
+            [
+                models.ClassJob.KIND_ANIMAL_CHART,
+                models.ClassJob.KIND_REAL_UNIT_ANIMAL_CHART,
+            ],
+        )
+        self.assertEqual(Task.objects.count(), 2)
+
+    def test_legacy_pta_task_becomes_job(self):
+        # Queued with the arguments used before ClassJob existed
+        models.Class.recalculate_ptas.database_task(
+            self.connectedclass.id, "a@example.com", True
+        )
+
+        background_tasks.run_next_task()
+        job = models.ClassJob.objects.get()
+        self.assertEqual(job.kind, models.ClassJob.KIND_GENOMIC_TEST)
+        self.assertEqual(job.emails, ["a@example.com"])
+        self.assertEqual(Task.objects.count(), 1)
+
+        background_tasks.run_next_task()
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.ClassJob.STATUS_DONE)
+        self.assertEqual(mail.outbox[0].to, ["a@example.com"])
+        self.assertEqual(Task.objects.count(), 0)
+
+    def test_legacy_animal_chart_task_becomes_job(self):
+        csv.create_animal_csv.database_task(self.connectedclass.id, self.teacher.id)
+
+        background_tasks.run_next_task()
+        job = models.ClassJob.objects.get()
+        self.assertEqual(job.kind, models.ClassJob.KIND_ANIMAL_CHART)
+        self.assertEqual(job.emails, ["teacher@example.com"])
+        self.assertEqual(Task.objects.get().task_params, f"[[{job.id}], {{}}]")
+
+    def test_legacy_task_for_deleted_class_is_dropped(self):
+        models.Class.recalculate_ptas.database_task(
+            self.connectedclass.id, "a@example.com"
+        )
+        self.connectedclass.delete()
+
+        background_tasks.run_next_task()
+        self.assertFalse(models.ClassJob.objects.exists())
+        self.assertEqual(Task.objects.count(), 0)
@@ -0,0 +1,38 @@
+import tracemalloc
+
+from django.test import TestCase, override_settings
+
+from ..loadtest import LoadTest
+
+
+@override_settings(TASK_BACKEND="immediate")
+class TestLoadTest(TestCase):
+    def test_report(self):
+        report = LoadTest(enrollments=1, rounds=1).run()
+
+        self.assertEqual(report["config"]["enrollments"], 1)
+        for name in [
+            "get_herd",
+            "breed_herd",
+            "submit_animal",
+            "calculate_ptas",
+            "animal_csv",
+        ]:
+            self.assertEqual(report["endpoints"][name]["errors"], 0, name)
+            self.assertGreater(report["endpoints"][name]["p95_ms"], 0)
+            self.assertNotIn("peak_alloc_kb_max", report["endpoints"][name])
+
+    def test_peak_memory_is_per_request(self):
+        loadtest = LoadTest(enrollments=1, rounds=1, trace_memory=True)
+
+        tracemalloc.start()
+        try:
+            loadtest.measure("large", lambda: bytearray(8 * 1024 * 1024))
+            loadtest.measure("small", lambda: None)
+        finally:
+            tracemalloc.stop()
+
+        large = loadtest.stats["large"].summary()["peak_alloc_kb_max"]
+        small = loadtest.stats["small"].summary()["peak_alloc_kb_max"]
+        self.assertGreaterEqual(large, 8 * 1024)
+        self.assertLess(small, 1024)
@@ -0,0 +1,129 @@
+from json import loads
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Barrier, Thread
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from .. import metrics
+from . import helpers
+
+
+class TestMetricsMiddleware(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.connectedclass = helpers.create_class(helpers.create_teacher())
+        self.enrollment = helpers.enroll_student(self.connectedclass, "student")
+        self.client.force_login(self.enrollment.student)
+        self.herd_path = (
+            f"/class/{self.connectedclass.id}/herd/{self.enrollment.herd_id}"
+        )
+
+    def test_records_view(self):
+        response = self.client.get(f"{self.herd_path}/get")
+
+        stats = metrics.Registry.views["base.views.get_herd"]
+        self.assertEqual(stats.requests, 1)
+        self.assertEqual(stats.errors, 0)
+        self.assertGreater(stats.queries, 0)
+        self.assertGreater(stats.seconds, 0)
+        self.assertGreaterEqual(stats.seconds, stats.query_seconds)
+        self.assertEqual(stats.response_bytes, len(response.content))
+        self.assertEqual(stats.buckets[-1], 1)
+
+    def test_logs_json_line(self):
+        with self.assertLogs("base.metrics", "INFO") as logs:
+            self.client.get(f"{self.herd_path}/get")
+
+        line = loads(logs.records[0].getMessage())
+        self.assertEqual(line["view"], "base.views.get_herd")
+        self.assertEqual(line["status"], 200)
+        self.assertGreater(line["queries"], 0)
+
+    def test_profile_sampling(self):
+        with TemporaryDirectory() as directory:
+            with override_settings(
+                METRICS_PROFILE_RATE=1.0, METRICS_PROFILE_DIR=directory
+            ):
+                self.client.get(f"{self.herd_path}/get")
+
+            profiles = list(Path(directory).iterdir())
+            self.assertEqual(len(profiles), 1)
+            self.assertTrue(profiles[0].name.endswith("base.views.get_herd.prof"))
+
+    def test_overlapping_profiled_requests(self):
+        with TemporaryDirectory() as directory:
+            with override_settings(
+                METRICS_PROFILE_RATE=1.0, METRICS_PROFILE_DIR=directory
+            ):
+                # A request sampled while another is being profiled still
+                # succeeds, without a profile
+                with metrics.Profiler() as running:
+                    self.assertTrue(running.active)
+                    response = self.client.get(f"{self.herd_path}/get")
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(Path(directory).iterdir()), [])
+
+                self.client.get(f"{self.herd_path}/get")
+                self.assertEqual(len(list(Path(directory).iterdir())), 1)
+
+    def test_profilers_in_threads(self):
+        barrier = Barrier(2, timeout=10)
+        active = []
+
+        def profile():
+            with metrics.Profiler() as profiler:
+                barrier.wait()
+                active.append(profiler.active)
+                barrier.wait()
+
+        threads = [Thread(target=profile) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(active), [False, True])
+
+
+class TestMetricsEndpoint(TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_requires_superuser_or_token(self):
+        User.objects.create_user("user", "user@example.com", "password")
+        self.client.login(username="user", password="password")
+
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+        with override_settings(METRICS_TOKEN="secret"):
+            response = self.client.get(
+                "/metrics", headers={"Authorization": "Bearer wrong"}
+            )
+            self.assertEqual(response.status_code, 404)
+
+            response = self.client.get(
+                "/metrics", headers={"Authorization": "Bearer secret"}
+            )
+            self.assertEqual(response.status_code, 200)
+
+            response = self.client.get(
+                "/metrics", headers={"Authorization": "Bearer sécret"}
+            )
+            self.assertEqual(response.status_code, 404)
+
+    def test_prometheus_format(self):
+        User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.login(username="admin", password="password")
+        self.client.get("/about")
+
+        content = self.client.get("/metrics").content.decode()
+
+        self.assertIn(
+            'herdgen_request_duration_seconds_count{view="base.views.about"} 1',
+            content,
+        )
+        self.assertIn('herdgen_request_queries_total{view="base.views.about"}', content)
+        self.assertIn("herdgen_herd_cache_hits_total", content)
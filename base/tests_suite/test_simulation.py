@@ -0,0 +1,118 @@
+from io import StringIO
+from json import loads
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .. import models
+from . import helpers
+from .test_breeding import get_living_average
+
+
+class TestFastForward(TestCase):
+    def setUp(self):
+        self.connectedclass = helpers.create_class(helpers.create_teacher())
+        self.herd = helpers.enroll_student(self.connectedclass, "student").herd
+
+    def fast_forward(self, generations: int, strategy: str = "net_merit") -> list:
+        herd = models.Herd.objects.get(id=self.herd.id)
+        return herd.fast_forward(generations, strategy, 2)
+
+    def test_trend_log_matches_living_animals(self):
+        trend_log = self.connectedclass.get_trend_log()
+
+        results = self.fast_forward(8)
+
+        self.assertEqual(len(results), 8)
+        self.assertEqual(models.Herd.objects.get(id=self.herd.id).breedings, 8)
+
+        new_trend_log = self.connectedclass.get_trend_log()
+        population, net_merit = get_living_average(self.connectedclass)
+        self.assertEqual(len(new_trend_log), len(trend_log) + 8)
+        self.assertEqual(new_trend_log[-1]["populationsize"], population)
+        self.assertAlmostEqual(new_trend_log[-1]["NM$"], net_merit)
+
+        # Starter animals are older than the default max age of 5
+        self.assertFalse(
+            models.Animal.objects.filter(herd=self.herd, generation=0).exists()
+        )
+
+    def test_saved_pedigrees(self):
+        def pedigree_ids(pedigree) -> set[int]:
+            if pedigree is None:
+                return set()
+            return (
+                {pedigree["id"]}
+                | pedigree_ids(pedigree["sire"])
+                | pedigree_ids(pedigree["dam"])
+            )
+
+        other_class = helpers.create_class(helpers.create_teacher("other"))
+        self.fast_forward(3, "random")
+        helpers.enroll_student(other_class, "otherstudent")
+
+        animals = models.Animal.objects.filter(connectedclass=self.connectedclass)
+        for animal in animals.filter(generation=3):
+            self.assertEqual(animal.pedigree["id"], animal.id)
+            self.assertEqual(animal.sire_id, animal.pedigree["sire"]["id"])
+            self.assertEqual(animal.dam_id, animal.pedigree["dam"]["id"])
+            self.assertTrue(animal.name.endswith(str(animal.id)))
+
+            # Ancestors that died in the simulation are saved outside the herd
+            ids = pedigree_ids(animal.pedigree)
+            self.assertEqual(animals.filter(id__in=ids).count(), len(ids))
+            self.assertFalse(
+                models.Animal.objects.filter(
+                    id__in=pedigree_ids(animal.pedigree), connectedclass=other_class
+                ).exists()
+            )
+
+    def test_selects_top_sires(self):
+        herd = models.Herd.objects.get(id=self.herd.id)
+        best = list(
+            models.Animal.objects.filter(herd=herd, male=True).order_by("-net_merit")[
+                :2
+            ]
+        )
+
+        self.fast_forward(1)
+
+        sires = set(
+            models.Animal.objects.filter(
+                connectedclass=self.connectedclass, generation=1
+            ).values_list("sire_id", flat=True)
+        )
+        self.assertEqual(sires, {x.id for x in best})
+
+    def test_queries_do_not_grow_with_generations(self):
+        def count(generations: int, student: str) -> int:
+            # A new herd each time, as ancestry takes a query per generation
+            herd = helpers.enroll_student(self.connectedclass, student).herd
+            herd = models.Herd.objects.get(id=herd.id)
+            with CaptureQueriesContext(connection) as queries:
+                herd.fast_forward(generations, "net_merit", 2)
+
+            return len(
+                [
+                    x
+                    for x in queries.captured_queries
+                    if not x["sql"].startswith(('INSERT INTO "base_animal"', "UPDATE"))
+                ]
+            )
+
+        self.assertEqual(count(2, "first"), count(6, "second"))
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            self.fast_forward(1, "pta:missing")
+
+    def test_command(self):
+        output = StringIO()
+
+        call_command(
+            "fastforward", self.herd.id, "--generations", "2", stdout=output
+        )
+
+        self.assertEqual([x["breedings"] for x in loads(output.getvalue())], [1, 2])
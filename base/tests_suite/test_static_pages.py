@@ -0,0 +1,39 @@
+from django.test import TestCase
+
+from .. import static_pages
+from ..traitsets import Traitset
+from . import helpers
+
+
+class TestStaticPages(TestCase):
+    def test_revalidated_page_is_not_modified(self):
+        for path in ["/equations", "/traitsets", "/traitsets/ANIMAL_SCIENCE_322"]:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("private", response["Cache-Control"])
+
+            response = self.client.get(
+                path, headers={"If-None-Match": response["ETag"]}
+            )
+            self.assertEqual(response.status_code, 304)
+
+    def test_etag_depends_on_user(self):
+        anonymous = self.client.get("/equations")["ETag"]
+        self.client.force_login(helpers.create_teacher())
+
+        self.assertNotEqual(self.client.get("/equations")["ETag"], anonymous)
+
+    def test_unknown_traitset(self):
+        self.assertEqual(self.client.get("/traitsets/UNKNOWN").status_code, 404)
+
+    def test_overview_is_prerendered(self):
+        mtime = static_pages.get_traitset_mtime("ANIMAL_SCIENCE_322")
+        overview = static_pages.get_traitset_overview("ANIMAL_SCIENCE_322", mtime)
+
+        self.assertIs(
+            overview, static_pages.get_traitset_overview("ANIMAL_SCIENCE_322", mtime)
+        )
+        self.assertEqual(
+            overview.trait_table,
+            Traitset("ANIMAL_SCIENCE_322").get_html_trait_table(),
+        )
@@ -0,0 +1,42 @@
+from background_task.models import Task
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .. import tasks
+
+
+@tasks.task
+def add(x: int, y: int) -> int:
+    return x + y
+
+
+class TestTasks(TestCase):
+    def test_registration(self):
+        self.assertIs(tasks.REGISTERED[add.name], add)
+        self.assertEqual(add.name, f"{__name__}.add")
+        self.assertIn("base.models.recalculate_ptas", tasks.REGISTERED)
+        self.assertIn("base.csv.create_animal_csv", tasks.REGISTERED)
+        self.assertIn("base.forms.move_animal", tasks.REGISTERED)
+        self.assertIn("base.views_utils.deleteclass_background", tasks.REGISTERED)
+
+    @override_settings(TASK_BACKEND=tasks.DATABASE_BACKEND)
+    def test_database_backend(self):
+        add(1, 2, schedule=10)
+
+        task = Task.objects.get()
+        self.assertEqual(task.task_name, add.name)
+
+    @override_settings(TASK_BACKEND=tasks.IMMEDIATE_BACKEND)
+    def test_immediate_backend(self):
+        self.assertEqual(add(1, 2), 3)
+        self.assertFalse(Task.objects.exists())
+
+    def test_run_task(self):
+        self.assertEqual(tasks.run_task(add.name, (2, 3), {}), 5)
+
+
+class TestProcessPoolBackend(SimpleTestCase):
+    def test_submit(self):
+        backend = tasks.ProcessPoolBackend()
+        future = backend.submit(add, (4, 5), {})
+
+        self.assertEqual(future.result(timeout=60), 9)
@@ -0,0 +1,130 @@
+from json import loads
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+try:
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+        InMemorySpanExporter,
+    )
+except ImportError:
+    TracerProvider = None
+
+from .. import models, tracing
+from . import helpers
+
+
+class TracingTestMixin:
+    def setUp(self):
+        super().setUp()
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = Path(directory.name) / "trace.jsonl"
+
+        settings = override_settings(TRACING_FILENAME=str(self.filename))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def read_traces(self) -> list[dict]:
+        return [loads(x) for x in self.filename.read_text().splitlines()]
+
+
+class TestSpans(TracingTestMixin, SimpleTestCase):
+    def test_nested_spans_export_once(self):
+        with tracing.span("outer", size=3) as outer:
+            with tracing.span("inner") as inner:
+                for _ in range(3):
+                    with tracing.total("step"):
+                        pass
+                inner.set("steps", 3)
+            outer.set("done", True)
+
+        (trace,) = self.read_traces()
+        self.assertEqual(trace["name"], "outer")
+        self.assertEqual(trace["attributes"], {"size": 3, "done": True})
+
+        (child,) = trace["children"]
+        self.assertEqual(child["name"], "inner")
+        self.assertEqual(child["attributes"], {"steps": 3})
+        self.assertEqual(child["totals"]["step"]["count"], 3)
+        self.assertGreaterEqual(trace["ms"], child["ms"])
+
+    def test_total_outside_span_is_ignored(self):
+        with tracing.total("step"):
+            pass
+
+        self.assertFalse(self.filename.exists())
+
+    @override_settings(TRACING_FILENAME="")
+    @patch.object(tracing, "get_otel_tracer", return_value=None)
+    def test_disabled(self, get_otel_tracer):
+        with tracing.span("outer") as span:
+            span.set("ignored", 1)
+
+        self.assertIs(span, tracing.NULL_SPAN)
+        self.assertFalse(self.filename.exists())
+
+
+@skipUnless(TracerProvider, "opentelemetry-sdk is not installed")
+@override_settings(TRACING_FILENAME="")
+class TestOpenTelemetry(SimpleTestCase):
+    def test_totals_reach_exporter(self):
+        exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+
+        with patch.object(
+            tracing, "get_otel_tracer", return_value=provider.get_tracer("test")
+        ):
+            with tracing.span("outer", size=3) as outer:
+                for _ in range(2):
+                    with tracing.total("step"):
+                        pass
+                outer.set("done", True)
+
+        (exported,) = exporter.get_finished_spans()
+        self.assertEqual(exported.name, "outer")
+        self.assertEqual(exported.attributes["size"], 3)
+        self.assertEqual(exported.attributes["done"], True)
+        self.assertEqual(exported.attributes["step.count"], 2)
+        self.assertIn("step.ms", exported.attributes)
+
+
+class TestBreedHerdTrace(TracingTestMixin, TestCase):
+    def test_phases(self):
+        connectedclass = helpers.create_class(helpers.create_teacher())
+        herd = helpers.enroll_student(connectedclass, "student").herd
+        herd = models.Herd.objects.get(id=herd.id)
+
+        herd.breed_herd(helpers.get_males(herd, 2), "")
+
+        (trace,) = self.read_traces()
+        self.assertEqual(trace["name"], "breed_herd")
+        self.assertEqual(trace["attributes"]["herd"], herd.id)
+        self.assertEqual(
+            [x["name"] for x in trace["children"]],
+            [
+                "select_mothers",
+                "generate_calves",
+                "insert",
+                "cull",
+                "trend_update",
+            ],
+        )
+
+        calves = trace["children"][1]
+        self.assertEqual(
+            set(calves["totals"]),
+            {"genotype", "inbreeding", "phenotype", "ptas", "recessives"},
+        )
+        # Calves are generated as one batch
+        self.assertEqual(
+            {x["count"] for x in calves["totals"].values()},
+            {1},
+        )
@@ -1,6 +1,7 @@
+import numpy as np
 from django.test import TestCase
 from ..traitsets import Traitset, REGISTERED
-from ..traitsets.traitset import Trait, Recessive
+from ..traitsets.traitset import RECESSIVE_COPIES, Trait, Recessive
 from random import random
 
 
@@ -100,6 +101,55 @@ class TestTraitsets(TestCase):
 
         self._test_on_each(test)
 
+    def test_packed_recessives(self):
+        def test(x: Traitset):
+            recessives = [
+                {r.uid: key for r in x.recessives} for key in RECESSIVE_COPIES
+            ]
+            alleles = x.to_recessive_alleles(recessives)
+
+            self.assertEqual(x.to_recessive_dicts(alleles), recessives)
+            self.assertEqual(
+                x.count_carried_recessives(alleles).tolist(),
+                [0, len(x.recessives), len(x.recessives)],
+            )
+
+            fatal = len([r for r in x.recessives if r.fatal])
+            self.assertEqual(
+                x.count_at_risk_matings(alleles, alleles[::-1]).tolist(),
+                [0, fatal, 0],
+            )
+            self.assertEqual(
+                x.has_fatal_recessive(alleles).tolist(), [False, False, fatal > 0]
+            )
+
+            # Calves of two carriers of everything carry everything
+            calves = x.get_recessive_alleles_from_breeding(alleles[2:], alleles[2:])
+            self.assertEqual(x.to_recessive_dicts(calves), recessives[2:])
+
+        self._test_on_each(test)
+
+    def test_pta_weights(self):
+        def test(x: Traitset):
+            daughters = np.array([0, 10, 10, 10000])
+            tests = np.array([0, 1, 1, 0])
+            genotype_weights, noise_weights = x.get_pta_weights_batch(
+                daughters, tests
+            )
+
+            for i, t in enumerate(x.traits):
+                h2 = t.heritability
+                n = daughters + tests * 2 / h2
+                rel = np.minimum(h2 + n / (n + (4 - h2) / h2), 0.99)
+                np.testing.assert_allclose(
+                    genotype_weights[:, i], np.sqrt(rel) * rel**0.25 / 2
+                )
+                np.testing.assert_allclose(
+                    noise_weights[:, i], np.sqrt(1 - rel) * rel**0.25 / 2
+                )
+
+        self._test_on_each(test)
+
     def test_find_trait_or_null(self):
         def test(x: Traitset):
             for uid in x.traits:
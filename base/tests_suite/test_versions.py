@@ -0,0 +1,67 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .. import models
+from . import helpers
+
+
+class TestVersionedModels(TestCase):
+    def setUp(self):
+        self.teacher = helpers.create_teacher()
+        self.connectedclass = helpers.create_class(self.teacher)
+        self.enrollment = helpers.enroll_student(self.connectedclass, "student")
+        self.herd = self.enrollment.herd
+
+    def get(self, path: str, etag: str | None = None):
+        headers = {} if etag is None else {"If-None-Match": etag}
+        return self.client.get(path, headers=headers)
+
+    def test_stale_save_does_not_reset_version(self):
+        stale = models.Herd.objects.get(id=self.herd.id)
+        self.herd.bump_version()
+
+        stale.name = "Renamed"
+        stale.save()
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.name, "Renamed")
+        self.assertEqual(stale.version, self.herd.version + 1)
+
+    def test_herd_not_modified_until_breeding(self):
+        self.client.force_login(self.enrollment.student)
+        path = f"/class/{self.connectedclass.id}/herd/{self.herd.id}/get"
+
+        etag = self.get(path)["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(path, etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any("base_animal" in x["sql"] for x in queries))
+
+        herd = models.Herd.objects.get(id=self.herd.id)
+        herd.breed_herd(helpers.get_males(herd, 1), "")
+
+        self.assertEqual(self.get(path, etag).status_code, 200)
+
+    def test_herd_etag_changes_with_visibility(self):
+        self.client.force_login(self.teacher)
+        path = f"/class/{self.connectedclass.id}/herd/{self.herd.id}/get"
+        etag = self.get(path)["ETag"]
+
+        self.connectedclass.net_merit_visibility = False
+        self.connectedclass.save()
+
+        self.assertEqual(self.get(path, etag).status_code, 200)
+
+    def test_enrollments_not_modified_until_request(self):
+        self.client.force_login(self.teacher)
+        path = f"/class/{self.connectedclass.id}/get-enrollments"
+
+        etag = self.get(path)["ETag"]
+        self.assertEqual(self.get(path, etag).status_code, 304)
+
+        student = helpers.create_teacher("other")
+        models.EnrollmentRequest.create_new(student, self.connectedclass)
+
+        self.assertEqual(self.get(path, etag).status_code, 200)
@@ -0,0 +1,92 @@
+from io import BytesIO, StringIO
+from json import loads
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase
+
+from .. import models, simulation, whatif
+from ..traitsets import Traitset
+from . import helpers
+
+
+class TestWhatIf(TestCase):
+    def setUp(self):
+        self.connectedclass = helpers.create_class(helpers.create_teacher())
+        herd = helpers.enroll_student(self.connectedclass, "student").herd
+        self.herd = models.Herd.objects.get(id=herd.id)
+        self.snapshot = self.herd.get_snapshot()
+
+    def test_snapshot_round_trip(self):
+        file = BytesIO()
+        self.snapshot.save(file)
+        file.seek(0)
+        loaded = simulation.HerdSnapshot.load(file)
+
+        self.assertEqual(loaded.traitset, self.connectedclass.traitset)
+        self.assertEqual(loaded.herd_females, self.connectedclass.herd_females)
+        self.assertEqual(len(loaded.animals), self.herd.animal_set.count())
+        for column in simulation.Animals.COLUMNS:
+            np.testing.assert_array_equal(
+                getattr(loaded.animals, column), getattr(self.snapshot.animals, column)
+            )
+        self.assertEqual(
+            loaded.get_kinship().parents, self.snapshot.get_kinship().parents
+        )
+
+    def test_distributions(self):
+        report = whatif.run_whatif(
+            self.snapshot, ["net_merit", "random"], 6, 3, 2, workers=2
+        )
+
+        self.assertEqual(list(report), ["net_merit", "random"])
+        first = report["net_merit"][0]
+        self.assertEqual(first["generation"], self.herd.breedings + 1)
+        self.assertEqual(first["replicates"], 6)
+        self.assertLessEqual(first["inbreeding"]["p5"], first["inbreeding"]["p95"])
+        self.assertEqual(
+            set(first) - {"generation", "replicates"},
+            set(whatif.get_metrics(Traitset(self.snapshot.traitset))),
+        )
+
+        # Choosing the best sires gains more than choosing at random
+        self.assertGreater(
+            report["net_merit"][-1]["net_merit_gain"]["mean"],
+            report["random"][-1]["net_merit_gain"]["mean"],
+        )
+
+    def test_same_seed_same_results(self):
+        def run(workers: int) -> dict:
+            return whatif.run_whatif(
+                self.snapshot, ["random"], 3, 2, 2, seed=7, workers=workers
+            )
+
+        self.assertEqual(run(1), run(3))
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            whatif.run_whatif(self.snapshot, ["pta:missing"], 1, 1, 1, workers=1)
+
+    def test_commands(self):
+        with TemporaryDirectory() as directory:
+            path = str(Path(directory) / "herd.npz")
+            call_command("exportherd", self.herd.id, path, stderr=StringIO())
+
+            output = StringIO()
+            call_command(
+                "whatif",
+                path,
+                "--replicates",
+                "2",
+                "--generations",
+                "2",
+                "--workers",
+                "1",
+                stdout=output,
+            )
+
+        report = loads(output.getvalue())
+        self.assertEqual(list(report), ["net_merit", "random"])
+        self.assertEqual(len(report["random"]), 2)
@@ -0,0 +1,153 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from json import dumps
+from threading import Lock
+from time import perf_counter
+from typing import Any, Iterator, Optional
+
+from django.conf import settings
+from django.utils.timezone import now
+
+
+class Span:
+    """A timed section of work. Spans opened inside another span are recorded
+    as its children. Work repeated many times inside a span, like generating
+    each calf, is summed into totals instead of getting a span each."""
+
+    name: str
+    attributes: dict[str, Any]
+    children: list["Span"]
+    totals: dict[str, list[float]]
+    started: str
+    seconds: float
+
+    def __init__(self, name: str, attributes: dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.children = []
+        self.totals = {}
+        self.started = now().isoformat()
+        self.seconds = 0
+        self.otel_span = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+        if self.otel_span is not None:
+            self.otel_span.set_attribute(key, value)
+
+    def add_total(self, name: str, seconds: float):
+        total = self.totals.setdefault(name, [0, 0])
+        total[0] += seconds
+        total[1] += 1
+
+    def json_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "started": self.started,
+            "ms": round(self.seconds * 1000, 3),
+            "attributes": self.attributes,
+            "totals": {
+                name: {"ms": round(seconds * 1000, 3), "count": count}
+                for name, (seconds, count) in self.totals.items()
+            },
+            "children": [x.json_dict() for x in self.children],
+        }
+
+
+class NullSpan:
+    """Stands in for a span when tracing is off"""
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def add_total(self, name: str, seconds: float):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+_current: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+_export_lock = Lock()
+
+
+@lru_cache
+def get_otel_tracer():
+    """OpenTelemetry tracer if the package is installed. Spans are then also
+    sent to whatever exporter the OpenTelemetry SDK has been set up with."""
+
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        return None
+
+    return trace.get_tracer("herdgen")
+
+
+def is_enabled() -> bool:
+    return bool(settings.TRACING_FILENAME) or get_otel_tracer() is not None
+
+
+def export(span: Span):
+    """Append a finished root span and its children to TRACING_FILENAME as a
+    single json line"""
+
+    if not settings.TRACING_FILENAME:
+        return
+
+    line = dumps(span.json_dict(), default=str)
+    with _export_lock, open(settings.TRACING_FILENAME, "a") as file:
+        file.write(line + "\n")
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | NullSpan]:
+    """Time the enclosed block as a span called name"""
+
+    if not is_enabled():
+        yield NULL_SPAN
+        return
+
+    parent = _current.get()
+    current = Span(name, attributes)
+    token = _current.set(current)
+    tracer = get_otel_tracer()
+    start = perf_counter()
+
+    try:
+        if tracer is None:
+            yield current
+        else:
+            with tracer.start_as_current_span(name, attributes=attributes) as otel:
+                current.otel_span = otel
+                try:
+                    yield current
+                finally:
+                    # Attributes must be set before the span ends
+                    for total, (seconds, count) in current.totals.items():
+                        otel.set_attribute(f"{total}.ms", seconds * 1000)
+                        otel.set_attribute(f"{total}.count", count)
+    finally:
+        current.seconds = perf_counter() - start
+        _current.reset(token)
+
+        if parent is None:
+            export(current)
+        else:
+            parent.children.append(current)
+
+
+@contextmanager
+def total(name: str) -> Iterator[None]:
+    """Add the time spent in the enclosed block to the current span's totals"""
+
+    current = _current.get()
+    if current is None:
+        yield
+        return
+
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        current.add_total(name, perf_counter() - start)
@@ -0,0 +1,163 @@
+"""Frozen copies of the genetics kernels in traitset.py, kept exactly as they
+were before any optimization work. Do not change these. The benchmark suite
+draws from both and checks that faster kernels still produce the same
+distributions."""
+
+from random import random
+
+import inbreeding_calculator
+import numpy as np
+
+from .traitset import (
+    HETEROZYGOUS_KEY,
+    HOMOZYGOUS_CARRIER_KEY,
+    HOMOZYGOUS_FREE_KEY,
+    Trait,
+    Traitset,
+)
+
+
+def get_random_genotype(traitset: Traitset) -> dict[str, float]:
+    initial_values = np.array([np.random.normal() for _ in traitset.traits])
+    L = np.linalg.cholesky(np.array(traitset.genotype_correlations))
+    correlated_values = L @ initial_values
+
+    return {
+        trait.uid: val
+        for trait, val in zip(traitset.traits, correlated_values, strict=True)
+    }
+
+
+def get_genotype_from_breeding(
+    traitset: Traitset, sire_genotype: dict[str, float], dam_genotype: dict[str, float]
+) -> dict[str, float]:
+    mendelian_sample = get_random_genotype(traitset)
+    genotype = {}
+
+    for trait in traitset.traits:
+        sd = trait.calculated_standard_deviation
+        sire_val = sire_genotype[trait.uid] * sd
+        dam_val = dam_genotype[trait.uid] * sd
+        parent_average = (sire_val + dam_val) / 2
+        result = parent_average + np.sqrt(2) / 2 * mendelian_sample[trait.uid] * sd
+        genotype[trait.uid] = result / sd
+
+    return genotype
+
+
+def convert_genotype_to_phenotype(
+    trait: Trait, genotype: float, inbreeding_coefficient: float
+) -> float:
+    sd = trait.calculated_standard_deviation
+    genotype = genotype * sd
+
+    phenotypic_variance = (sd**2) / trait.heritability
+    residual_variance = phenotypic_variance * (1 - trait.heritability)
+    phenotype = genotype * 2 + np.random.normal(scale=np.sqrt(residual_variance))
+    phenotype += inbreeding_coefficient * 100 * trait.inbreeding_depression_percentage
+
+    return phenotype / sd
+
+
+def derive_phenotype_from_genotype(
+    traitset: Traitset, genotype: dict[str, float], inbreeding_coefficient: float
+) -> dict[str, float]:
+    initial_values = np.array(
+        [
+            convert_genotype_to_phenotype(x, genotype[x.uid], inbreeding_coefficient)
+            for x in traitset.traits
+        ]
+    )
+    L = np.linalg.cholesky(traitset.phenotype_correlations)
+    correlated_values = L @ initial_values
+
+    return {
+        trait.uid: val
+        for trait, val in zip(traitset.traits, correlated_values, strict=True)
+    }
+
+
+def convert_genotype_to_pta(
+    trait: Trait, genotype: float, number_of_daughters: int, genomic_tests: int
+) -> float:
+    sd = trait.calculated_standard_deviation
+    h2 = trait.heritability
+    bv = genotype * sd
+
+    n = number_of_daughters + genomic_tests * 2 * (1 / h2)
+    k = (4 - h2) / h2
+    rel = min(h2 + (n / (n + k)), 0.99)
+
+    noise = np.random.normal(scale=sd)
+    pta = np.sqrt(rel) * bv + np.sqrt(1 - rel) * noise
+    pta *= rel**0.25
+    pta /= 2
+
+    return pta / sd
+
+
+def derive_ptas_from_genotype(
+    traitset: Traitset,
+    genotype: dict[str, float],
+    number_of_daughters: int,
+    genomic_tests: int,
+) -> dict[str, float]:
+    return {
+        key: convert_genotype_to_pta(
+            traitset.find_trait_or_null(key), val, number_of_daughters, genomic_tests
+        )
+        for key, val in genotype.items()
+    }
+
+
+def derive_net_merit_from_genotype(
+    traitset: Traitset, genotype: dict[str, float]
+) -> float:
+    net_merit = 0
+    for trait in traitset.traits:
+        net_merit += (
+            genotype[trait.uid]
+            * trait.calculated_standard_deviation
+            * trait.net_merit_dollars
+        )
+
+    return net_merit
+
+
+def get_random_recessives(traitset: Traitset) -> dict[str, str]:
+    recessives = {}
+    for recessive in traitset.recessives:
+        alleles = [random() * 100 < recessive.prevalence_percent for _ in range(2)]
+
+        if all(alleles):
+            recessives[recessive.uid] = HOMOZYGOUS_CARRIER_KEY
+        elif any(alleles):
+            recessives[recessive.uid] = HETEROZYGOUS_KEY
+        else:
+            recessives[recessive.uid] = HOMOZYGOUS_FREE_KEY
+
+    return recessives
+
+
+def get_passed_from_parent(parent_allele: str) -> bool:
+    if parent_allele == HOMOZYGOUS_CARRIER_KEY:
+        return True
+    elif parent_allele == HETEROZYGOUS_KEY:
+        return random() < 0.5
+    else:
+        return False
+
+
+def get_recessive_from_breeding(sire_allele: str, dam_allele: str) -> str:
+    alleles = [get_passed_from_parent(sire_allele), get_passed_from_parent(dam_allele)]
+
+    if all(alleles):
+        return HOMOZYGOUS_CARRIER_KEY
+    elif any(alleles):
+        return HETEROZYGOUS_KEY
+    else:
+        return HOMOZYGOUS_FREE_KEY
+
+
+def get_inbreeding(pedigree: dict) -> float:
+    return inbreeding_calculator.InbreedingCalculator(pedigree).get_coefficient()
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from json import load
 from pathlib import Path
 from random import random
@@ -25,6 +26,21 @@ def serializable_funcs(klass: Type):
     return [x for x in attrs if getattr(x, "_is_serialized", False)]
 
 
+@lru_cache(maxsize=4096)
+def get_reliability_weights(
+    heritability: float, number_of_daughters: int, genomic_tests: int
+) -> tuple[float, float, float]:
+    """Weights of the breeding value and of the noise in a PTA, and the
+    rel**0.25 scale, which only depend on heritability, daughters and genomic
+    tests. See Trait.convert_genotype_to_pta."""
+
+    n = number_of_daughters + genomic_tests * 2 * (1 / heritability)
+    k = (4 - heritability) / heritability
+    rel = min(heritability + (n / (n + k)), 0.99)
+
+    return float(np.sqrt(rel)), float(np.sqrt(1 - rel)), rel**0.25
+
+
 TRAITSET_PATH = Path(__file__).parent / "traitsets"
 
 DESC_KEY = "desc"
@@ -61,6 +77,14 @@ HETEROZYGOUS_KEY = "he"
 HOMOZYGOUS_CARRIER_KEY = "ho(c)"
 HOMOZYGOUS_FREE_KEY = "ho(f)"
 
+# Recessive keys indexed by the number of copies carried
+RECESSIVE_COPIES = [HOMOZYGOUS_FREE_KEY, HETEROZYGOUS_KEY, HOMOZYGOUS_CARRIER_KEY]
+
+# Batches of animals pack their recessives into two uint64 masks, one per
+# allele. Bit i of a mask is set when that allele carries recessives[i], so a
+# traitset can have at most this many recessives.
+RECESSIVE_BITS = 64
+
 PHENOTYPE_PREFIX_KEY = "phenotype_prefix"
 GENOTYPE_PREFIX_KEY = "genotype_prefix"
 PTA_PREFIX_KEY = "pta_prefix"
@@ -164,6 +188,11 @@ class Trait:
         self.calculated_standard_deviation = calculated_standard_deviation
         self.animals = animals
 
+        phenotypic_variance = calculated_standard_deviation**2 / heritability
+        self.residual_standard_deviation = float(
+            np.sqrt(phenotypic_variance * (1 - heritability))
+        )
+
     @classmethod
     @document(
         """sqrt:
@@ -211,13 +240,8 @@ class Trait:
 
         genotype = genotype * self.calculated_standard_deviation
 
-        phenotypic_variance = (
-            self.calculated_standard_deviation**2
-        ) / self.heritability
-        residual_variance = phenotypic_variance * (1 - self.heritability)
-        residual_standard_deviation = self.sqrt(residual_variance)
         phenotype = genotype * 2 + self.mendelian_sample(
-            scale=residual_standard_deviation
+            scale=self.residual_standard_deviation
         )
 
         phenotype += (
@@ -253,21 +277,13 @@ class Trait:
 
         bv = genotype * self.calculated_standard_deviation
 
-        n = number_of_daughters + genomic_tests * 2 * (1 / self.heritability)
-
-        k = (4 - self.heritability) / self.heritability
-
-        rel = self.heritability + (n / (n + k))
-
-        rel = self.limit(rel, 0.99)
-
-        w1 = self.sqrt(rel)
-
-        w2 = self.sqrt(1 - rel)
+        w1, w2, scale = get_reliability_weights(
+            self.heritability, int(number_of_daughters), int(genomic_tests)
+        )
         noise = self.mendelian_sample(self.calculated_standard_deviation)
 
         PTA = w1 * bv + w2 * noise
-        PTA *= rel**0.25
+        PTA *= scale
         PTA /= 2
 
         return PTA / self.calculated_standard_deviation
@@ -442,8 +458,43 @@ class Traitset:
             for x in recessives_dict
         ]
 
+        if len(recessives) > RECESSIVE_BITS:
+            raise ValueError(
+                f"Traitset {name} has more than {RECESSIVE_BITS} recessives"
+            )
+
         self.traits = traits
         self.recessives = recessives
+
+        # Per trait constants of the batch kernels
+        self.heritabilities = np.array([x.heritability for x in traits])
+        self.net_merit_weights = np.array(
+            [x.calculated_standard_deviation * x.net_merit_dollars for x in traits]
+        )
+        self.inbreeding_depressions = np.array(
+            [
+                x.inbreeding_depression_percentage / x.calculated_standard_deviation
+                for x in traits
+            ]
+        )
+        self.residual_scales = np.array(
+            [
+                x.residual_standard_deviation / x.calculated_standard_deviation
+                for x in traits
+            ]
+        )
+        self.genotype_cholesky = np.linalg.cholesky(
+            np.array(genotype_correlations_list)
+        )
+        self.phenotype_cholesky = np.linalg.cholesky(
+            np.array(phenotype_correlations_list)
+        )
+        self.recessive_bits = np.left_shift(
+            np.uint64(1), np.arange(len(recessives), dtype=np.uint64)
+        )
+        self.fatal_recessives_mask = np.bitwise_or.reduce(
+            self.recessive_bits[[x.fatal for x in recessives]], initial=np.uint64(0)
+        )
         self.genotype_correlations = genotype_correlations_list
         self.phenotype_correlations = phenotype_correlations_list
         self.animals = {
@@ -483,8 +534,7 @@ class Traitset:
         initial_values = np.array(
             [Trait.mendelian_sample() for _ in self.traits]
         )
-        L = np.linalg.cholesky(np.array(self.genotype_correlations))
-        correlated_values = L @ initial_values
+        correlated_values = self.genotype_cholesky @ initial_values
 
         return {
             trait.uid: val
@@ -537,8 +587,7 @@ class Traitset:
                 for x in self.traits
             ]
         )
-        L = np.linalg.cholesky(self.phenotype_correlations)
-        correlated_values = L @ initial_values
+        correlated_values = self.phenotype_cholesky @ initial_values
 
         return {
             trait.uid: val
@@ -595,6 +644,192 @@ class Traitset:
         }
         return recessives
 
+    def get_random_genotype_batch(self, count: int) -> np.ndarray:
+        """get_random_genotype for count animals at once. Rows are animals and
+        columns follow self.traits."""
+
+        initial_values = np.random.normal(size=(count, len(self.traits)))
+        return initial_values @ self.genotype_cholesky.T
+
+    def get_genotype_from_breeding_batch(
+        self, sire_genotypes: np.ndarray, dam_genotypes: np.ndarray
+    ) -> np.ndarray:
+        """get_genotype_from_breeding for matrices of parent genotypes"""
+
+        mendelian_samples = self.get_random_genotype_batch(len(sire_genotypes))
+        return (sire_genotypes + dam_genotypes) / 2 + np.sqrt(2) / 2 * mendelian_samples
+
+    def derive_net_merit_batch(self, genotypes: np.ndarray) -> np.ndarray:
+        return genotypes @ self.net_merit_weights
+
+    def derive_phenotype_batch(
+        self, genotypes: np.ndarray, inbreeding_coefficients: np.ndarray
+    ) -> np.ndarray:
+        """derive_phenotype_from_genotype for a matrix of genotypes. Values
+        stay in standard deviations throughout."""
+
+        phenotypes = (
+            genotypes * 2
+            + np.random.normal(size=genotypes.shape) * self.residual_scales
+            + np.asarray(inbreeding_coefficients)[:, None]
+            * 100
+            * self.inbreeding_depressions
+        )
+        return phenotypes @ self.phenotype_cholesky.T
+
+    def get_pta_weights_batch(
+        self, numbers_of_daughters: np.ndarray, genomic_tests: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Weights of the genotype and of unit noise in the PTA of each animal
+        and trait. Herds only have a few distinct daughter and genomic test
+        counts, so weights are looked up once per distinct pair."""
+
+        daughters = np.asarray(numbers_of_daughters, dtype=np.int64).reshape(-1)
+        tests = np.asarray(genomic_tests, dtype=np.int64).reshape(-1)
+        keys, rows = np.unique((daughters << 32) | tests, return_inverse=True)
+
+        table = np.array(
+            [
+                [
+                    get_reliability_weights(h2, key >> 32, key & 0xFFFFFFFF)
+                    for h2 in self.heritabilities.tolist()
+                ]
+                for key in keys.tolist()
+            ]
+        ).reshape(len(keys), len(self.traits), 3)
+
+        w1, w2, scale = table[rows].transpose(2, 0, 1)
+        return w1 * scale / 2, w2 * scale / 2
+
+    def derive_ptas_batch(
+        self,
+        genotypes: np.ndarray,
+        numbers_of_daughters: np.ndarray,
+        genomic_tests: np.ndarray,
+    ) -> np.ndarray:
+        """derive_ptas_from_genotype for a matrix of genotypes"""
+
+        genotype_weights, noise_weights = self.get_pta_weights_batch(
+            numbers_of_daughters, genomic_tests
+        )
+        noise = np.random.normal(size=genotypes.shape)
+        return genotype_weights * genotypes + noise_weights * noise
+
+    def get_random_recessives_batch(self, count: int) -> list[dict[str, str]]:
+        return self.to_recessive_dicts(self.get_random_recessive_alleles(count))
+
+    def get_random_recessive_alleles(self, count: int) -> np.ndarray:
+        """Allele masks of count random animals, one row of two masks each"""
+
+        prevalence = np.array([x.prevalence_percent for x in self.recessives])
+        carried = (
+            np.random.random((count, 2, len(self.recessives))) * 100
+            < prevalence[None, None, :]
+        )
+        return self.pack_recessives(carried)
+
+    def get_recessives_from_breeding_batch(
+        self,
+        sire_recessives: list[dict[str, str]],
+        dam_recessives: list[dict[str, str]],
+    ) -> list[dict[str, str]]:
+        """get_recessives_from_breeding for many pairs of parents"""
+
+        return self.to_recessive_dicts(
+            self.get_recessive_alleles_from_breeding(
+                self.to_recessive_alleles(sire_recessives),
+                self.to_recessive_alleles(dam_recessives),
+            )
+        )
+
+    def get_recessive_alleles_from_breeding(
+        self, sire_alleles: np.ndarray, dam_alleles: np.ndarray
+    ) -> np.ndarray:
+        """Allele masks of calves. Each parent passes on one of its two
+        alleles of every recessive, picked by the bits of one random word."""
+
+        def passed(parents: np.ndarray) -> np.ndarray:
+            choice = np.random.randint(
+                0, 2**64, size=len(parents), dtype=np.uint64
+            )
+            return (parents[:, 0] & choice) | (parents[:, 1] & ~choice)
+
+        return np.stack([passed(sire_alleles), passed(dam_alleles)], axis=1)
+
+    def pack_recessives(self, carried: np.ndarray) -> np.ndarray:
+        """Allele masks from booleans shaped (animals, 2, recessives)"""
+
+        return np.bitwise_or.reduce(
+            np.where(carried, self.recessive_bits, np.uint64(0)),
+            axis=2,
+            initial=np.uint64(0),
+        )
+
+    def count_recessive_copies(self, alleles: np.ndarray) -> np.ndarray:
+        """Copies of each recessive carried, one row per animal"""
+
+        carried = (alleles[:, :, None] & self.recessive_bits) != 0
+        return carried.sum(axis=1, dtype=np.int8)
+
+    def get_affected_mask(self, alleles: np.ndarray) -> np.ndarray:
+        """Recessives carried on both alleles"""
+
+        return alleles[:, 0] & alleles[:, 1]
+
+    def get_carrier_mask(self, alleles: np.ndarray) -> np.ndarray:
+        """Recessives carried on at least one allele"""
+
+        return alleles[:, 0] | alleles[:, 1]
+
+    def count_carried_recessives(self, alleles: np.ndarray) -> np.ndarray:
+        """Number of recessives each animal carries at least one copy of"""
+
+        return np.bitwise_count(self.get_carrier_mask(alleles))
+
+    def count_at_risk_matings(
+        self, sire_alleles: np.ndarray, dam_alleles: np.ndarray
+    ) -> np.ndarray:
+        """Number of fatal recessives both parents carry for each pair, i.e.
+        that can give the calf two copies"""
+
+        return np.bitwise_count(
+            self.get_carrier_mask(sire_alleles)
+            & self.get_carrier_mask(dam_alleles)
+            & self.fatal_recessives_mask
+        )
+
+    def has_fatal_recessive(self, alleles: np.ndarray) -> np.ndarray:
+        return (self.get_affected_mask(alleles) & self.fatal_recessives_mask) != 0
+
+    def to_recessive_alleles(self, recessives: list[dict[str, str]]) -> np.ndarray:
+        """Turn recessive dicts into allele masks. A heterozygous animal
+        carries its copy on the first allele."""
+
+        first = {HETEROZYGOUS_KEY, HOMOZYGOUS_CARRIER_KEY}
+        carried = np.array(
+            [
+                [
+                    [x[r.uid] in first for r in self.recessives],
+                    [x[r.uid] == HOMOZYGOUS_CARRIER_KEY for r in self.recessives],
+                ]
+                for x in recessives
+            ],
+            dtype=bool,
+        ).reshape(len(recessives), 2, len(self.recessives))
+        return self.pack_recessives(carried)
+
+    def to_recessive_dicts(self, alleles: np.ndarray) -> list[dict[str, str]]:
+        uids = [x.uid for x in self.recessives]
+        keys = np.array(RECESSIVE_COPIES)
+        copies = self.count_recessive_copies(alleles)
+        return [dict(zip(uids, row)) for row in keys[copies].tolist()]
+
+    def to_trait_dicts(self, values: np.ndarray) -> list[dict[str, float]]:
+        """Turn the rows of a batch result back into dicts keyed by trait"""
+
+        uids = [x.uid for x in self.traits]
+        return [dict(zip(uids, row)) for row in values.tolist()]
+
     def find_trait_or_null(self, trait: str) -> Optional[Trait]:
         for t in self.traits:
             if t.uid == trait:
@@ -36,6 +36,10 @@ urlpatterns = [
         "class/<int:classid>/enrollments/<int:enrollmentid>/remove",
         views.remove_enrollment,
     ),
+    path(
+        "class/<int:classid>/enrollments/requests/confirm",
+        views.confirm_enrollments,
+    ),
     path(
         "class/<int:classid>/enrollments/requests/<int:requestid>/confirm",
         views.confirm_enrollment,
@@ -70,4 +74,5 @@ urlpatterns = [
     path("traitsets", views.traitsets),
     path("equations", views.equations),
     path("about", views.about),
+    path("metrics", views.metrics),
 ]
@@ -1,9 +1,12 @@
+from hmac import compare_digest
 from sys import prefix
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LoginView
 from django.db import transaction
+from django.db.models import Count, Prefetch, Q
 from django.http import (
     FileResponse,
     Http404,
@@ -13,26 +16,25 @@ from django.http import (
     JsonResponse,
 )
 from django.shortcuts import get_object_or_404, render
-from django.utils.html import SafeString
 from django.utils.timezone import now
 from django.views.decorators.http import require_POST
 
-from base.traitsets import (
-    DOCUMENTED_FUNCS,
-    Traitset,
-    REGISTERED as registered_traitsets,
-)
+from base.traitsets import Traitset
 
 from . import forms
+from . import herd_cache
+from . import metrics as request_metrics
 from . import models
 from . import csv
 from . import names as nms
-from .templatetags.animal_filters import filter_text_to_default
+from . import static_pages
+from .static_pages import static_page
 from .views_utils import (
     ClassAuth,
     HerdAuth,
     auth_class,
     auth_herd,
+    conditional_json_response,
     deleteclass_background,
 )
 
@@ -74,6 +76,10 @@ def account(request: HttpRequest) -> HttpResponse | HttpResponseRedirect:
             form = forms.Account(request.POST, prefix="normal", instance=request.user)
             if form.is_valid():
                 form.save()
+                models.Class.bump_versions(
+                    Q(enrollment__student=request.user)
+                    | Q(enrollmentrequest__student=request.user)
+                )
                 return HttpResponseRedirect("/auth/account")
 
     return render(
@@ -204,20 +210,26 @@ def assignments(
     if type(class_auth) not in ClassAuth.TEACHER_ADMIN:
         raise Http404("Must be teacher to access assignments page")
 
-    enrollments = models.Enrollment.objects.filter(
-        connectedclass=connectedclass
-    ).order_by("student__first_name", "student__last_name")
+    enrollments = (
+        models.Enrollment.objects.select_related("student")
+        .filter(connectedclass=connectedclass)
+        .order_by("student__first_name", "student__last_name")
+    )
     assignments = [
-        (
-            a,
-            models.AssignmentStep.objects.filter(assignment=a).count(),
-            models.AssignmentFulfillment.objects.filter(assignment=a).order_by(
-                "enrollment__student__first_name", "enrollment__student__last_name"
-            ),
+        (a, a.step_count, a.ordered_fulfillments)
+        for a in models.Assignment.objects.filter(connectedclass=connectedclass)
+        .annotate(step_count=Count("assignmentstep_assignment"))
+        .prefetch_related(
+            Prefetch(
+                "assignmentfulfillment_set",
+                queryset=models.AssignmentFulfillment.objects.order_by(
+                    "enrollment__student__first_name",
+                    "enrollment__student__last_name",
+                ),
+                to_attr="ordered_fulfillments",
+            )
         )
-        for a in models.Assignment.objects.filter(
-            connectedclass=connectedclass
-        ).order_by("duedate")
+        .order_by("duedate")
     ]
 
     return render(
@@ -248,6 +260,7 @@ def openassignment(
         form = forms.UpdateAssignment(request.POST, instance=assignment)
         if form.is_valid():
             form.save()
+            class_auth.connectedclass.bump_version()
             HttpResponseRedirect("")
     else:
         form = forms.UpdateAssignment(instance=assignment)
@@ -295,50 +308,26 @@ def openherd(request: HttpRequest, classid: int, herdid: int) -> HttpResponse:
     return render(request, "base/openherd.html", context)
 
 
+@static_page(static_pages.get_equations_mtime)
 def equations(request: HttpRequest) -> HttpResponse:
-    equations = {}
-    for header, funcs in DOCUMENTED_FUNCS.items():
-        equations[header] = []
-        for func in funcs:
-            doc_string = ""
-            for line in func.__doc__.split("\n"):
-                stripped = line.strip()
-                if "#" in stripped:
-                    html = stripped.replace("#", "<span>#", 1) + "</span>"
-                else:
-                    html = stripped
-
-                doc_string += html + "<br>"
-
-            sig = ""
-            for line in func._sig.split("\n"):
-                stripped = line.strip()
-                if "#" in stripped:
-                    html = stripped.replace("#", "<span>#", 1) + "</span>"
-                else:
-                    html = stripped
-
-                sig += html + "<br>"
-
-            equations[header].append((SafeString(sig), SafeString(doc_string)))
-
+    equations = static_pages.get_equations(static_pages.get_equations_mtime())
     return render(request, "base/equations.html", {"equations": equations})
 
 
+@static_page(static_pages.get_traitset_mtime)
 def traitset_overview(request: HttpRequest, traitsetname: str) -> HttpResponse:
-    try:
-        traitset = Traitset(traitsetname)
-    except FileNotFoundError as e:
-        raise Http404(e)
+    traitset = static_pages.get_traitset_overview(
+        traitsetname, static_pages.get_traitset_mtime(traitsetname)
+    )
 
     return render(request, "base/traitset_overview.html", {"traitset": traitset})
 
 
+@static_page(static_pages.get_traitsets_mtime)
 def traitsets(request: HttpRequest) -> HttpResponse:
-    traitsets = [(Traitset(x.name)) for x in registered_traitsets if x.enabled]
-    deprecated_traitsets = [
-        Traitset(x.name) for x in registered_traitsets if not x.enabled
-    ]
+    traitsets, deprecated_traitsets = static_pages.get_traitset_listing(
+        static_pages.get_traitsets_mtime()
+    )
 
     return render(
         request,
@@ -379,6 +368,7 @@ def delete_assignment(
         raise Http404("Must be teacher to delete assignments")
 
     assignment.delete()
+    class_auth.connectedclass.bump_version()
 
     return HttpResponseRedirect(f"/class/{classid}/assignments")
 
@@ -446,7 +436,11 @@ def genomic_test(request: HttpRequest, classid: int) -> HttpResponseRedirect:
     if type(class_auth) not in ClassAuth.TEACHER_ADMIN:
         raise Http404("Must be teacher to genomic test")
 
-    class_auth.connectedclass.recalculate_ptas(classid, request.user.email, True)
+    models.ClassJob.submit(
+        class_auth.connectedclass,
+        models.ClassJob.KIND_GENOMIC_TEST,
+        request.user.email,
+    )
 
     return HttpResponseRedirect(f"/class/{classid}/running-genomic-test")
 
@@ -459,8 +453,10 @@ def calculate_ptas(request: HttpRequest, classid: int) -> HttpResponseRedirect:
     if type(class_auth) not in ClassAuth.TEACHER_ADMIN:
         raise Http404("Must be teacher to calculate ptas")
 
-    class_auth.connectedclass.recalculate_ptas(
-        class_auth.connectedclass.id, request.user.email
+    models.ClassJob.submit(
+        class_auth.connectedclass,
+        models.ClassJob.KIND_CALCULATE_PTAS,
+        request.user.email,
     )
 
     return HttpResponseRedirect(f"/class/{classid}/running-calculate-ptas")
@@ -475,12 +471,6 @@ def submit_animal(
     form = forms.SubmitAnimal(request.POST)
     class_auth = auth_class(request, classid)
     herd_auth = auth_herd(class_auth, herdid)
-    animal = get_object_or_404(
-        models.Animal.objects.defer("pedigree"),
-        connectedclass=classid,
-        herd=herdid,
-        id=animalid,
-    )
 
     if type(class_auth) is not ClassAuth.Student:
         raise Http404("Must be student to submit animal")
@@ -488,12 +478,23 @@ def submit_animal(
     if type(herd_auth) is not HerdAuth.EnrollmentHerd:
         raise Http404("Must be enrollment herd to submit animal")
 
-    if form.is_valid(class_auth):
-        form.save(class_auth, animal)
-        return HttpResponseRedirect(f"/class/{classid}/herd/{herdid}")
-    else:
+    # Lock before loading so a breeding can't cull the animal in between
+    models.Herd.lock(herdid)
+    animal = get_object_or_404(
+        models.Animal.objects.only("id", "herd"),
+        connectedclass=classid,
+        herd=herdid,
+        id=animalid,
+    )
+
+    if not form.is_valid(class_auth):
         raise Http404(f"Animal submission is invalid: {form.errors}")
 
+    if not form.save(class_auth, animal):
+        raise Http404("Animal is no longer in the herd")
+
+    return HttpResponseRedirect(f"/class/{classid}/herd/{herdid}")
+
 
 @login_required
 @transaction.atomic
@@ -506,7 +507,7 @@ def confirm_enrollment(
     if type(class_auth) not in ClassAuth.TEACHER_ADMIN:
         raise Http404("Must be teacher to confirm enrollment")
 
-    if class_auth.connectedclass.enrollment_tokens > 0:
+    if models.Class.lock(classid).enrollment_tokens > 0:
         enrollment_request = get_object_or_404(
             models.EnrollmentRequest.objects.select_related(
                 "connectedclass", "student"
@@ -526,6 +527,41 @@ def confirm_enrollment(
     return JsonResponse(data)
 
 
+@login_required
+@transaction.atomic
+@require_POST
+def confirm_enrollments(request: HttpRequest, classid: int) -> JsonResponse:
+    class_auth = auth_class(request, classid)
+
+    if type(class_auth) not in ClassAuth.TEACHER_ADMIN:
+        raise Http404("Must be teacher to confirm enrollment")
+
+    # Read the tokens and requests under the class lock so that a repeated
+    # confirmation finds them already spent
+    tokens = max(models.Class.lock(classid).enrollment_tokens, 0)
+
+    form = forms.ConfirmEnrollmentRequests(request.POST)
+    enrollment_requests = (
+        form.get_enrollment_requests(class_auth.connectedclass)
+        if form.is_valid()
+        else None
+    )
+    if enrollment_requests is None:
+        raise Http404("Invalid enrollment requests")
+
+    enrollments = models.Enrollment.create_from_enrollment_requests(
+        enrollment_requests[:tokens]
+    )
+
+    return JsonResponse(
+        {
+            "enrollments": [x.json_dict() for x in enrollments],
+            "requests": [x.id for x in enrollment_requests[:tokens]],
+            "out of tokens": len(enrollment_requests) > tokens,
+        }
+    )
+
+
 @login_required
 @transaction.atomic
 @require_POST
@@ -541,6 +577,7 @@ def remove_enrollment(
         models.Enrollment, id=enrollmentid, connectedclass=class_auth.connectedclass
     )
     enrollment.delete()
+    class_auth.connectedclass.bump_version()
 
     return JsonResponse({})
 
@@ -558,6 +595,7 @@ def deny_enrollment(request: HttpRequest, classid: int, requestid: int) -> JsonR
         models.EnrollmentRequest, id=requestid, connectedclass=class_auth.connectedclass
     )
     enrollment_request.delete()
+    class_auth.connectedclass.bump_version()
 
     return JsonResponse({})
 
@@ -600,19 +638,14 @@ def get_trend_chart(request: HttpRequest, classid: int) -> FileResponse:
         raise Http404("Must be teacher to get trend chart")
 
     traitset = Traitset(class_auth.connectedclass.traitset)
+    labels = class_auth.connectedclass.get_export_labels()
     headers = (
         ["Time Stamp", "Population Size", "Net Merit $"]
-        + [
-            filter_text_to_default(f"<{x.uid}>", class_auth.connectedclass)
-            for x in traitset.traits
-        ]
-        + [
-            filter_text_to_default(f"ph: <{x.uid}>", class_auth.connectedclass)
-            for x in traitset.traits
-        ]
+        + list(labels.traits)
+        + list(labels.phenotypes)
     )
     data = []
-    for row in class_auth.connectedclass.trend_log:
+    for row in class_auth.connectedclass.get_trend_log():
         data.append(
             [
                 row[nms.TIME_STAMP_KEY],
@@ -634,7 +667,12 @@ def get_animal_chart(request: HttpRequest, classid: int) -> HttpResponseRedirect
     if type(class_auth) not in ClassAuth.TEACHER_ADMIN:
         raise Http404("Must be teacher to get animal chart")
 
-    csv.create_animal_csv(classid, request.user.id)
+    if request.GET.get("units") == "real":
+        kind = models.ClassJob.KIND_REAL_UNIT_ANIMAL_CHART
+    else:
+        kind = models.ClassJob.KIND_ANIMAL_CHART
+
+    models.ClassJob.submit(class_auth.connectedclass, kind, request.user.email)
 
     return HttpResponseRedirect(f"/class/{classid}/generating-file")
 
@@ -647,31 +685,39 @@ def get_enrollments(request: HttpRequest, classid: int) -> JsonResponse:
     if type(class_auth) not in ClassAuth.TEACHER_ADMIN:
         raise Http404("Must be teacher to get_enrollments")
 
-    json = {
-        "enrollments": [
-            x.json_dict()
-            for x in models.Enrollment.objects.select_related("student").filter(
-                connectedclass=class_auth.connectedclass
-            )
-        ],
-        "enrollment_requests": [
-            x.json_dict()
-            for x in models.EnrollmentRequest.objects.select_related("student").filter(
-                connectedclass=class_auth.connectedclass
-            )
-        ],
-    }
-
-    return JsonResponse(json)
+    connectedclass = class_auth.connectedclass
+    etag = f"enrollments-{connectedclass.id}-{connectedclass.version}"
+
+    def get_json():
+        return {
+            "enrollments": [
+                x.json_dict()
+                for x in models.Enrollment.objects.select_related("student").filter(
+                    connectedclass=connectedclass
+                )
+            ],
+            "enrollment_requests": [
+                x.json_dict()
+                for x in models.EnrollmentRequest.objects.select_related(
+                    "student"
+                ).filter(connectedclass=connectedclass)
+            ],
+        }
+
+    return conditional_json_response(request, etag, get_json)
 
 
 @login_required
 def get_herd(request: HttpRequest, classid: int, herdid: int) -> JsonResponse:
     class_auth = auth_class(request, classid, "class_herd")
     herd_auth = auth_herd(class_auth, herdid)
-    json = herd_auth.herd.json_dict()
+    herd = herd_auth.herd
+    visibility_hash = class_auth.connectedclass.get_visibility_hash()
+    etag = f"herd-{herd.id}-{herd.version}-{visibility_hash}"
 
-    return JsonResponse(json)
+    return conditional_json_response(
+        request, etag, lambda: herd_cache.herd_json_response(herd, visibility_hash)
+    )
 
 
 @login_required
@@ -682,8 +728,25 @@ def get_assignments(request: HttpRequest, classid: int, herdid: int) -> JsonResp
     if type(herd_auth) is not HerdAuth.EnrollmentHerd:
         raise Http404("Invalid herd to collect assignments for.")
 
-    assignments = class_auth.enrollment.get_open_assignments_json_dict()
-    return JsonResponse(assignments)
+    # Assignments open and close over time without a version change, so the
+    # currently open assignments are part of the etag.
+    open_assignments = models.Assignment.objects.filter(
+        connectedclass=class_auth.connectedclass,
+        startdate__lte=now(),
+        duedate__gte=now(),
+    ).values_list("id", flat=True)
+    etag = "-".join(
+        [
+            f"assignments-{class_auth.enrollment.id}",
+            str(class_auth.connectedclass.version),
+            str(herd_auth.herd.version),
+            ".".join(str(x) for x in open_assignments),
+        ]
+    )
+
+    return conditional_json_response(
+        request, etag, class_auth.enrollment.get_open_assignments_json_dict
+    )
 
 
 @login_required
@@ -715,3 +778,19 @@ def get_pedigree(
     animal = get_object_or_404(models.Animal.objects, id=animalid, herd=herd_auth.herd)
 
     return JsonResponse(animal.pedigree)
+
+
+#### MONITORING VIEWS ####
+def metrics(request: HttpRequest) -> HttpResponse:
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    token_ok = bool(settings.METRICS_TOKEN) and compare_digest(
+        token.encode(), settings.METRICS_TOKEN.encode()
+    )
+
+    if not (request.user.is_superuser or token_ok):
+        raise Http404("Metrics are only available to administrators.")
+
+    return HttpResponse(
+        request_metrics.render_prometheus(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -1,7 +1,14 @@
+import logging
+from typing import Any, Callable
+
 from . import models
+from . import tasks
 from django.shortcuts import get_object_or_404
-from django.http import Http404, HttpRequest
-from background_task import background
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+logger = logging.getLogger(__name__)
 
 
 class ClassAuth:
@@ -32,7 +39,7 @@ def auth_class(
     request: HttpRequest, classid: int, *related: str
 ) -> ClassAuth.Teacher | ClassAuth.Student | ClassAuth.Admin:
     connectedclass = get_object_or_404(
-        models.Class.objects.select_related("teacher", *related).defer("trend_log"),
+        models.Class.objects.select_related("teacher", *related),
         id=classid,
     )
 
@@ -46,9 +53,7 @@ def auth_class(
             return ClassAuth.Student(
                 models.Enrollment.objects.select_related(
                     *["connectedclass__" + x for x in related]
-                )
-                .defer("connectedclass__trend_log")
-                .get(
+                ).get(
                     connectedclass=connectedclass,
                     student=request.user,
                 )
@@ -90,24 +95,70 @@ def auth_herd(
 ):
     connectedclass = class_auth.connectedclass
     herd = get_object_or_404(
-        models.Herd.objects.select_related("connectedclass", *related).defer(
-            "connectedclass__trend_log"
-        ),
+        models.Herd.objects.select_related("connectedclass", *related),
         id=herdid,
         connectedclass=connectedclass,
     )
 
-    if connectedclass.class_herd == herd:
+    return auth_herd_instance(class_auth, herd)
+
+
+def auth_herd_instance(
+    class_auth: ClassAuth.Student | ClassAuth.Teacher | ClassAuth.Admin,
+    herd: models.Herd,
+) -> (
+    HerdAuth.ClassHerd
+    | HerdAuth.EnrollmentHerd
+    | HerdAuth.EnrollmentHerdAsTeacher
+    | HerdAuth.Admin
+):
+    """Check access to an already loaded herd without querying the database"""
+
+    connectedclass = class_auth.connectedclass
+
+    if herd.connectedclass_id != connectedclass.id:
+        raise Http404("User does not have access to this herd")
+    elif connectedclass.class_herd_id == herd.id:
         return HerdAuth.ClassHerd(herd)
-    elif type(class_auth) is ClassAuth.Student and class_auth.enrollment.herd == herd:
+    elif (
+        type(class_auth) is ClassAuth.Student
+        and class_auth.enrollment.herd_id == herd.id
+    ):
         return HerdAuth.EnrollmentHerd(herd)
-    elif type(class_auth) is ClassAuth.Teacher and herd.enrollment:
+    elif type(class_auth) is ClassAuth.Teacher and herd.enrollment_id:
         return HerdAuth.EnrollmentHerdAsTeacher(herd)
     elif type(class_auth) is ClassAuth.Admin:
         return HerdAuth.Admin(herd)
     else:
         raise Http404("User does not have access to this herd")
 
-@background(schedule=0)
+
+def conditional_json_response(
+    request: HttpRequest,
+    etag: str,
+    get_json: Callable[[], dict[str, Any] | HttpResponse],
+) -> HttpResponse:
+    """Respond with 304 Not Modified if the client already has the data for
+    etag, otherwise with the json from get_json. get_json may also return an
+    already built response."""
+
+    etag = quote_etag(etag)
+    response = get_conditional_response(request, etag=etag)
+
+    if response is None:
+        json = get_json()
+        response = json if isinstance(json, HttpResponse) else JsonResponse(json)
+
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@tasks.task
 def deleteclass_background(classid: int):
-    models.Class.objects.get(id=classid).delete()
+    connectedclass = models.Class.objects.get(id=classid)
+    connectedclass.delete_in_batches(
+        progress=lambda label, count: logger.info(
+            "Deleting class %s: %s %s rows deleted", classid, count, label
+        )
+    )
@@ -0,0 +1,160 @@
+"""Compare selection strategies on a herd snapshot before assigning them.
+Each strategy is simulated many times from the same starting herd, spread
+over a process pool, and summarized as distributions per generation. Nothing
+here touches the database, so exported snapshots can be run on any machine."""
+
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+
+import numpy as np
+
+from .simulation import HerdSnapshot, get_sire_selector
+from .traitsets import Traitset
+
+PERCENTILES = [5, 50, 95]
+
+# Snapshot shared by the replicates run in one worker process
+_snapshot: Optional[HerdSnapshot] = None
+_traitset: Optional[Traitset] = None
+
+
+def _init_worker(snapshot: HerdSnapshot):
+    global _snapshot, _traitset
+    _snapshot = snapshot
+    _traitset = Traitset(snapshot.traitset)
+
+
+def get_metrics(traitset: Traitset) -> list[str]:
+    """Values recorded for every generation of a replicate"""
+
+    return [
+        "net_merit_gain",
+        "inbreeding",
+        "recessive_deaths",
+        "at_risk_matings",
+        "population",
+        *[f"gain:{x.uid}" for x in traitset.traits],
+    ]
+
+
+def run_replicate(
+    strategy: str, generations: int, sires: int, seed: int
+) -> np.ndarray:
+    """One simulation of the worker's snapshot. Rows are generations and
+    columns follow get_metrics, with nan once the herd has no males left.
+    Gains are changes in the living herd's mean since the snapshot."""
+
+    assert _snapshot is not None and _traitset is not None
+    np.random.seed(seed)
+    random.seed(seed)
+
+    herd = _snapshot.get_simulation(_traitset)
+    select_sires = get_sire_selector(_traitset, strategy)
+    start_net_merit = herd.animals.net_merit.mean()
+    start_genotype = herd.animals.genotype.mean(axis=0)
+
+    results = np.full((generations, len(get_metrics(_traitset))), np.nan)
+    for row in range(generations):
+        bred = herd.run(1, select_sires, sires)
+        if not bred:
+            break
+
+        generation = bred[0]
+        animals = herd.animals
+        counts = [
+            generation.recessive_deaths,
+            generation.at_risk_matings,
+            len(animals),
+        ]
+        if len(animals) == 0:
+            results[row, 2:5] = counts
+            break
+
+        results[row, :5] = [
+            animals.net_merit.mean() - start_net_merit,
+            animals.inbreeding.mean(),
+            *counts,
+        ]
+        results[row, 5:] = animals.genotype.mean(axis=0) - start_genotype
+
+    return results
+
+
+def summarize(values: np.ndarray) -> Optional[dict[str, float]]:
+    """Distribution of one metric over the replicates that reached a
+    generation"""
+
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None
+
+    return {
+        "mean": float(values.mean()),
+        "sd": float(values.std()),
+        **{
+            f"p{percentile}": float(value)
+            for percentile, value in zip(
+                PERCENTILES, np.percentile(values, PERCENTILES)
+            )
+        },
+    }
+
+
+def run_whatif(
+    snapshot: HerdSnapshot,
+    strategies: list[str],
+    replicates: int,
+    generations: int,
+    sires: int,
+    seed: int = 0,
+    workers: Optional[int] = None,
+) -> dict[str, list[dict[str, Any]]]:
+    """Per generation distributions of every metric for each strategy, keyed
+    by strategy. workers defaults to every core. Results only depend on seed,
+    not on the number of workers."""
+
+    traitset = Traitset(snapshot.traitset)
+    for strategy in strategies:
+        get_sire_selector(traitset, strategy)
+
+    seeds = [
+        int(x.generate_state(1)[0])
+        for x in np.random.SeedSequence(seed).spawn(len(strategies) * replicates)
+    ]
+    jobs = [
+        (strategy, generations, sires, seeds[i * replicates + replicate])
+        for i, strategy in enumerate(strategies)
+        for replicate in range(replicates)
+    ]
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(snapshot,)
+    ) as executor:
+        results = list(
+            executor.map(
+                run_replicate,
+                *zip(*jobs),
+                chunksize=max(1, len(jobs) // (workers * 4)),
+            )
+        )
+
+    metrics = get_metrics(traitset)
+    report = {}
+    for i, strategy in enumerate(strategies):
+        runs = np.stack(results[i * replicates : (i + 1) * replicates])
+        report[strategy] = [
+            {
+                "generation": snapshot.breedings + row + 1,
+                "replicates": int((~np.isnan(runs[:, row, 0])).sum()),
+                **{
+                    metric: summarize(runs[:, row, column])
+                    for column, metric in enumerate(metrics)
+                },
+            }
+            for row in range(generations)
+        ]
+
+    return report
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from environ import Env
 
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "base.metrics.MetricsMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -180,6 +182,75 @@ else:
     EMAIL_HOST_USER = env("EMAIL_HOST_USER", str)
     EMAIL_HOST_PASSWORD = env("EMAIL_HOST_PASSWORD", str)
 
+# Background tasks
+# One of "database" (django-background-tasks), "django-q" (Redis broker),
+# "process-pool" (local worker processes) or "immediate" (inline, for tests)
+TASK_BACKEND = env("TASK_BACKEND", str, default="database")
+TASK_PROCESSES = env("TASK_PROCESSES", int, default=os.cpu_count() or 1)
+
+if TASK_BACKEND == "django-q":
+    INSTALLED_APPS.append("django_q")
+    Q_CLUSTER = {
+        "name": "herdgen",
+        "workers": TASK_PROCESSES,
+        "timeout": 60 * 60,
+        "retry": 60 * 60 * 2,
+        "redis": env("REDIS_URL", str, default="redis://localhost:6379/0"),
+    }
+
+# Founder pool
+# When enabled, starter herds are filled from founder animals generated ahead
+# of time. The pool for a traitset is topped up to FOUNDER_POOL_SIZE animals of
+# each sex in the background once either drops below FOUNDER_POOL_WATERMARK.
+FOUNDER_POOL_ENABLED = env("FOUNDER_POOL_ENABLED", bool, default=False)
+FOUNDER_POOL_SIZE = env("FOUNDER_POOL_SIZE", int, default=5_000)
+FOUNDER_POOL_WATERMARK = env("FOUNDER_POOL_WATERMARK", int, default=1_000)
+
+# Caches
+# Rendered herd json is kept in local memory unless HERD_CACHE_URL points at a
+# Redis server. Redis should be configured with an LRU maxmemory-policy.
+HERD_CACHE_URL = env("HERD_CACHE_URL", str, default="")
+HERD_CACHE_SIZE = env("HERD_CACHE_SIZE", int, default=500)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "herds": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": HERD_CACHE_URL,
+            "KEY_PREFIX": "herdgen",
+        }
+        if HERD_CACHE_URL
+        else {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "herds",
+            "OPTIONS": {"MAX_ENTRIES": HERD_CACHE_SIZE},
+        }
+    ),
+}
+
+# Request metrics
+# Per view timings are served at /metrics to superusers, or to anyone sending
+# "Authorization: Bearer <METRICS_TOKEN>". Each request is also written as a
+# json line to METRICS_LOG_FILENAME, rotated at METRICS_LOG_MAX_BYTES, when set.
+# A METRICS_PROFILE_RATE fraction of requests is profiled to METRICS_PROFILE_DIR
+# with METRICS_PROFILER, either "cprofile" or "pyinstrument".
+METRICS_ENABLED = env("METRICS_ENABLED", bool, default=True)
+METRICS_TOKEN = env("METRICS_TOKEN", str, default="")
+METRICS_LOG_FILENAME = env("METRICS_LOG_FILENAME", str, default="")
+METRICS_LOG_MAX_BYTES = env("METRICS_LOG_MAX_BYTES", int, default=10 * 1024 * 1024)
+METRICS_PROFILE_RATE = env("METRICS_PROFILE_RATE", float, default=0.0)
+METRICS_PROFILE_DIR = env("METRICS_PROFILE_DIR", str, default=BASE_DIR / "profiles")
+METRICS_PROFILER = env("METRICS_PROFILER", str, default="cprofile")
+
+# Tracing
+# Phases of long operations like breeding are timed as spans. Each finished
+# operation is appended as a json line to TRACING_FILENAME when set. Spans are
+# also sent to OpenTelemetry when the opentelemetry package is installed.
+TRACING_FILENAME = env("TRACING_FILENAME", str, default="")
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
@@ -201,6 +272,20 @@ LOGGING = {
             "level": "DEBUG",
             "propagate": True,
         },
+        "base.metrics": {
+            "handlers": ["metrics"] if METRICS_LOG_FILENAME else [],
+            "level": "INFO" if METRICS_LOG_FILENAME else "WARNING",
+            "propagate": False,
+        },
     },
 }
 
+if METRICS_LOG_FILENAME:
+    LOGGING["handlers"]["metrics"] = {
+        "level": "INFO",
+        "class": "logging.handlers.RotatingFileHandler",
+        "filename": METRICS_LOG_FILENAME,
+        "maxBytes": METRICS_LOG_MAX_BYTES,
+        "backupCount": 5,
+    }
+